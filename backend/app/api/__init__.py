@@ -1,2 +1,2 @@
 # API modules
-from . import properties, developers, projects, buildings, addresses, prices, media, dynamic_pricing, users, bookings, promotions, analytics, map, ai_matching, webhooks, auth
+from . import properties, developers, projects, buildings, addresses, prices, media, dynamic_pricing, users, bookings, promotions, analytics, map, ai_matching, webhooks, auth, events, jobs
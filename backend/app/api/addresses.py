@@ -7,6 +7,7 @@ from app.crud import crud_property_address
 from app.schemas import PropertyAddressCreate, PropertyAddressUpdate, PropertyAddressRead
 from app.security import get_current_user
 from app.models import User
+from app.services.match_cache import match_cache
 
 router = APIRouter(prefix="/addresses", tags=["addresses"])
 
@@ -82,6 +83,7 @@ async def create_address(
             )
         
         address = await crud_property_address.create(db, address_data.dict())
+        await match_cache.invalidate()
         return address
     except HTTPException:
         raise
@@ -118,6 +120,7 @@ async def update_address(
             )
         
         updated_address = await crud_property_address.update(db, address, address_data.dict(exclude_unset=True))
+        await match_cache.invalidate()
         return updated_address
     except HTTPException:
         raise
@@ -153,6 +156,7 @@ async def delete_address(
             )
         
         await crud_property_address.delete(db, address_id)
+        await match_cache.invalidate()
     except HTTPException:
         raise
     except Exception as e:
@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+import json
+import uuid
+from app.config import settings
 from app.database import get_async_session
-from app.schemas import PropertyFullResponse, PropertyMatchRequest
-from app.services.ai_matching import PropertyMatchingService
+from app.schemas import (
+    PropertyFullResponse, PropertyMatchRequest, PropertyMatchBatchRequest,
+    PropertyMatchBatchJob, MatchRecommendationRead
+)
+from app.crud import crud_match_recommendation
+from app.services.ai_matching import PropertyMatchingService, aiter_batch_matches
+from app.services.task_queue import send_task
+from app.services.match_cache import match_cache
 from app.models import User
-from app.security import get_current_active_user
+from app.security import get_current_active_user, get_current_admin_user
 
 router = APIRouter(prefix="/ai-matching", tags=["ai-matching"])
 
+matched_properties_adapter = TypeAdapter(List[PropertyFullResponse])
+
 
 async def get_matching_service(db: AsyncSession = Depends(get_async_session)) -> PropertyMatchingService:
     """Фабрика для создания сервиса подбора объектов недвижимости"""
@@ -68,19 +81,94 @@ async def match_properties_for_user(
         403: Forbidden - Недостаточно прав
         400: Bad Request - Некорректные данные
     """
+    normalized_request = match_cache.normalize(match_request) if settings.match_cache_enabled else match_request
+    cache_key = None
+    if settings.match_cache_enabled:
+        cache_key = await match_cache.make_key(normalized_request, limit)
+        cached = await match_cache.get(cache_key)
+        if cached is not None:
+            return Response(
+                content=match_cache.within_budget(cached, normalized_request.budget),
+                media_type="application/json"
+            )
+        await matching_service.sync_catalog(match_cache.version)
+    
     matched_properties = await matching_service.match_properties(
-        budget=match_request.budget,
-        preferred_cities=match_request.preferred_cities,
-        preferred_districts=match_request.preferred_districts,
-        min_rooms=match_request.min_rooms,
-        max_rooms=match_request.max_rooms,
-        min_area=match_request.min_area,
-        max_area=match_request.max_area,
-        property_type=match_request.property_type,
-        category=match_request.category,
-        has_balcony=match_request.has_balcony,
-        has_parking=match_request.has_parking,
-        max_floor=match_request.max_floor,
+        budget=normalized_request.budget,
+        preferred_cities=normalized_request.preferred_cities,
+        preferred_districts=normalized_request.preferred_districts,
+        min_rooms=normalized_request.min_rooms,
+        max_rooms=normalized_request.max_rooms,
+        min_area=normalized_request.min_area,
+        max_area=normalized_request.max_area,
+        property_type=normalized_request.property_type,
+        category=normalized_request.category,
+        has_balcony=normalized_request.has_balcony,
+        has_parking=normalized_request.has_parking,
+        max_floor=normalized_request.max_floor,
         limit=limit
     )
-    return matched_properties 
\ No newline at end of file
+    payload = matched_properties_adapter.dump_json(
+        matched_properties_adapter.validate_python(matched_properties, from_attributes=True)
+    )
+    if cache_key is not None:
+        await match_cache.set(cache_key, payload)
+    return Response(content=payload, media_type="application/json")
+
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+async def get_match_cache_stats(
+    _: User = Depends(get_current_admin_user)
+):
+    """Счетчики кэша результатов подбора"""
+    return match_cache.stats()
+
+
+@router.post("/properties/batch")
+async def match_properties_batch(
+    batch_request: PropertyMatchBatchRequest,
+    matching_service: PropertyMatchingService = Depends(get_matching_service),
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Пакетный ИИ-подбор для множества профилей покупателей
+    
+    Каталог загружается один раз, результаты отдаются потоком в формате NDJSON:
+    по одной строке на профиль в порядке запроса.
+    """
+    snapshot = await matching_service.get_batch_snapshot()
+    
+    async def _ndjson():
+        async for item in aiter_batch_matches(snapshot, batch_request.profiles, batch_request.limit):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
+@router.post("/properties/batch/jobs", response_model=PropertyMatchBatchJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_batch_match_job(
+    batch_request: PropertyMatchBatchRequest,
+    _: User = Depends(get_current_admin_user)
+):
+    """Поставить пакетный подбор в очередь; результаты записываются в match_recommendations"""
+    run_id = str(uuid.uuid4())
+    task = send_task(
+        "batch_match_task",
+        [profile.model_dump(mode="json") for profile in batch_request.profiles],
+        batch_request.limit,
+        run_id
+    )
+    return PropertyMatchBatchJob(run_id=run_id, task_id=task.id, profiles=len(batch_request.profiles))
+
+
+@router.get("/recommendations/{run_id}", response_model=List[MatchRecommendationRead])
+async def get_batch_recommendations(
+    run_id: str,
+    profile_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_session),
+    _: User = Depends(get_current_admin_user)
+):
+    """Получить результаты пакетного подбора"""
+    return await crud_match_recommendation.get_by_run(db, run_id, profile_id=profile_id, skip=skip, limit=limit)
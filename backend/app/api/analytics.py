@@ -3,31 +3,41 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 from app.database import get_async_session
-from app.models import PropertyAnalytics, ViewsLog
-from app.schemas import PropertyAnalyticsRead, MarketAnalyticsResponse, ViewsLogRead
-from app.crud import crud_property_analytics, crud_views_log
-from app.security import get_current_user
+from app.config import settings
+from app.models import PropertyAnalytics, ViewsLog, RollupEvent, RollupGranularity, PropertyType
+from app.schemas import (
+    PropertyAnalyticsRead, MarketAnalyticsResponse, ViewsLogRead, ClusterDemandStatsRead,
+    PropertyEventBucketRead, UniqueVisitorsRead, DistrictStatsRead,
+    DemandClustersResponse, DemandClusterRead, DemandClusterJob
+)
+from app.crud import (
+    crud_property_analytics, crud_views_log, crud_cluster_demand_stats, crud_district_stats, CRUDEventRollup
+)
+from app.security import get_current_user, get_current_admin_user
+from app.services.demand_clustering import DemandClusteringService
+from app.services.district_stats import district_stats
+from app.services.stats_aggregator import StatsAggregatorService
+from app.services.unique_visitors import unique_visitors, UNIQUE_VISITORS_RETENTION_DAYS
 from app.models import User
+from app.services.task_queue import send_task
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
 @router.get("/market", response_model=MarketAnalyticsResponse)
 async def get_market_analytics(
-    days: int = 30,
+    days: int = Query(30, ge=1, le=366, description="Период в днях"),
+    property_type: Optional[PropertyType] = Query(None, description="Тип объекта"),
+    city: Optional[str] = Query(None, max_length=50, description="Город"),
     db: AsyncSession = Depends(get_async_session)
 ):
-    """Получить аналитику по рынку"""
-    # Получаем статистику просмотров
-    total_views = await crud_views_log.get_total_views(db, days)
-    avg_views = await crud_views_log.get_avg_views(db, days)
-    avg_bookings = await crud_views_log.get_avg_bookings(db, days)
-    
+    """Получить аналитику по рынку с фильтрами по типу объекта и городу"""
+    stats = await StatsAggregatorService(db).get_market_stats(days, property_type, city)
     return MarketAnalyticsResponse(
-        total_views=total_views,
-        avg_views=avg_views,
-        avg_bookings=avg_bookings,
-        period_days=days
+        **stats,
+        period_days=days,
+        property_type=property_type,
+        city=city
     )
 
 
@@ -46,6 +56,37 @@ async def get_property_analytics(
     return analytics[0]
 
 
+@router.get("/properties/{property_id}/timeseries", response_model=List[PropertyEventBucketRead])
+async def get_property_timeseries(
+    property_id: int,
+    granularity: RollupGranularity = Query(RollupGranularity.DAY, description="Размер интервала"),
+    days: int = Query(30, ge=1, le=366, description="Глубина в днях"),
+    event: Optional[RollupEvent] = Query(None, description="Тип события"),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Получить количество просмотров, добавлений в избранное и бронирований объекта по интервалам"""
+    if granularity == RollupGranularity.HOUR and days > settings.rollup_hourly_retention_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Hourly data is kept for {settings.rollup_hourly_retention_days} days"
+        )
+    since = datetime.utcnow() - timedelta(days=days)
+    return await CRUDEventRollup(db).get_timeseries(property_id, granularity, since, event)
+
+
+@router.get("/properties/{property_id}/unique-visitors", response_model=UniqueVisitorsRead)
+async def get_property_unique_visitors(
+    property_id: int,
+    days: int = Query(7, ge=1, le=UNIQUE_VISITORS_RETENTION_DAYS, description="Окно в сутках, включая текущие")
+):
+    """Получить приблизительное число уникальных посетителей объекта (HyperLogLog по session_id)"""
+    return UniqueVisitorsRead(
+        property_id=property_id,
+        days=days,
+        unique_visitors=await unique_visitors.count(property_id, days)
+    )
+
+
 @router.get("/views/{property_id}", response_model=List[ViewsLogRead])
 async def get_property_views(
     property_id: int,
@@ -67,44 +108,79 @@ async def get_property_views(
     return views
 
 
-@router.get("/district/{district}/stats", response_model=Dict[str, float])
+@router.get("/district/{district}/stats", response_model=DistrictStatsRead)
 async def get_district_stats(
     district: str,
+    city: Optional[str] = Query(None, description="Город; без него — район с наибольшим числом объектов"),
     db: AsyncSession = Depends(get_async_session)
 ):
-    """Получить статистику по району"""
-    # Здесь можно добавить логику для получения статистики по району
-    # Пока возвращаем базовую структуру
-    return {
-        "popularity_score": 0.75,
-        "avg_price": 15000000.0,
-        "demand_level": 0.8
-    }
+    """Получить статистику по району (из памяти процесса, пересчитывается воркером)"""
+    if district_stats.is_ready:
+        stats = district_stats.get(district, city)
+    else:
+        rows = await crud_district_stats.get_for_district(db, district, city)
+        stats = rows[0] if rows else None
+    if not stats:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="District stats not found"
+        )
+    return stats
 
 
-@router.get("/demand-clusters", response_model=List[dict])
+@router.get("/demand-clusters", response_model=DemandClustersResponse)
 async def get_demand_clusters(
     project_id: Optional[int] = Query(None, description="ID проекта"),
-    property_type: Optional[str] = Query(None, description="Тип недвижимости"),
+    property_type: Optional[PropertyType] = Query(None, description="Тип недвижимости"),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Получить последнюю кластеризацию спроса (k-means) для набора фильтров"""
+    latest = await DemandClusteringService(db).get_latest(project_id, property_type)
+    if not latest:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Demand clusters not built yet"
+        )
+    run, clusters = latest
+    return DemandClustersResponse(
+        run_id=run.id,
+        project_id=run.project_id,
+        property_type=run.property_type,
+        k=run.k,
+        property_count=run.property_count,
+        iterations=run.iterations,
+        inertia=run.inertia,
+        created_at=run.created_at,
+        clusters=[DemandClusterRead.model_validate(cluster) for cluster in clusters]
+    )
+
+
+@router.post("/demand-clusters/rebuild", response_model=DemandClusterJob, status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_demand_clusters(
+    project_id: Optional[int] = Query(None, description="ID проекта"),
+    property_type: Optional[PropertyType] = Query(None, description="Тип недвижимости"),
+    k: Optional[int] = Query(None, ge=1, le=100, description="Количество кластеров"),
+    _: User = Depends(get_current_admin_user)
+):
+    """Поставить пересборку кластеризации спроса в очередь (вне адаптивного интервала)"""
+    task = send_task(
+        "build_demand_clusters_task",
+        project_id=project_id,
+        property_type=property_type.value if property_type else None,
+        k=k,
+        force=True
+    )
+    return DemandClusterJob(task_id=task.id, project_id=project_id, property_type=property_type, k=k)
+
+
+@router.get("/cluster-demand", response_model=List[ClusterDemandStatsRead])
+async def get_cluster_demand_stats(
+    project_id: Optional[int] = Query(None, description="ID проекта"),
+    rooms: Optional[int] = Query(None, ge=0, description="Количество комнат"),
     db: AsyncSession = Depends(get_async_session)
 ):
-    """Получить кластеры спроса для расчета динамических цен"""
-    # Здесь можно добавить логику для получения кластеров спроса
-    # Пока возвращаем базовую структуру
-    return [
-        {
-            "cluster_id": 1,
-            "demand_score": 0.8,
-            "price_range": "15-20M",
-            "property_count": 25
-        },
-        {
-            "cluster_id": 2,
-            "demand_score": 0.6,
-            "price_range": "20-25M",
-            "property_count": 15
-        }
-    ]
+    """Получить медиану и квартили спроса по кластерам (проект + комнаты)"""
+    return await crud_cluster_demand_stats.get_filtered(db, project_id=project_id, rooms=rooms)
 
 
 @router.get("/high-demand", response_model=List[PropertyAnalyticsRead])
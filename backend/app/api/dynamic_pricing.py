@@ -5,15 +5,17 @@ from app.database import get_async_session
 from app.models import Property, DynamicPricingConfig, PriceHistory, PriceChangeReason, User
 from app.schemas import (
     DynamicPricingConfigRead, DynamicPricingConfigCreate, DynamicPricingConfigUpdate,
-    PriceHistoryRead, Message, DynamicPricingResult
+    PriceHistoryRead, Message, DynamicPricingResult, PricingBacktestRequest, PricingBacktestResult
 )
 from app.crud import (
-    crud_property, crud_dynamic_pricing_config, crud_price_history,
+    crud_property, crud_property_price, crud_dynamic_pricing_config, crud_price_history,
     CRUDDynamicPricing
 )
 from app.security import get_current_active_user, get_current_business, get_current_admin_user, get_current_user
 from datetime import datetime, timedelta
 from app.services.dynamic_pricing import DynamicPricingService
+from app.services.pricing_backtest import PricingBacktestService
+from app.services.pricing_config import pricing_config_cache
 
 router = APIRouter(prefix="/dynamic-pricing", tags=["dynamic-pricing"])
 
@@ -43,7 +45,9 @@ async def create_pricing_config(
         403: Forbidden - Недостаточно прав
         400: Bad Request - Некорректные данные
     """
-    return await crud_dynamic_pricing_config.create(db, config_data.dict())
+    config = await crud_dynamic_pricing_config.create(db, config_data.dict())
+    await pricing_config_cache.invalidate()
+    return config
 
 
 @router.get("/config", response_model=List[DynamicPricingConfigRead])
@@ -61,7 +65,7 @@ async def get_active_config(
     db: AsyncSession = Depends(get_async_session)
 ):
     """Получить активную конфигурацию"""
-    config = await crud_dynamic_pricing_config.get_active(db)
+    config = await pricing_config_cache.get(db)
     if not config:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -155,7 +159,9 @@ async def update_pricing_config(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Configuration not found"
         )
-    return await crud_dynamic_pricing_config.update(db, db_config, config_data.dict(exclude_unset=True))
+    config = await crud_dynamic_pricing_config.update(db, db_config, config_data.dict(exclude_unset=True))
+    await pricing_config_cache.invalidate()
+    return config
 
 
 @router.delete("/config/{config_id}", response_model=Message)
@@ -170,6 +176,7 @@ async def delete_config(
         raise HTTPException(status_code=404, detail="Configuration not found")
     
     await crud_dynamic_pricing_config.delete(db, config_id)
+    await pricing_config_cache.invalidate()
     return Message(message="Configuration deleted")
 
 
@@ -195,37 +202,31 @@ async def update_property_price(
     Returns:
         DynamicPricingResult: Результат обновления цены
     """
-    dynamic_pricing = CRUDDynamicPricing(db)
-    
-    # Получаем объект недвижимости со всеми связанными данными
-    property_obj = await dynamic_pricing.get_property_for_task(property_id)
+    property_obj = await crud_property.get(db, property_id)
     if not property_obj:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Property not found"
         )
     
-    # Получаем объекты из того же кластера
-    cluster_properties = await dynamic_pricing.get_cluster_properties(
-        property_obj.project_id,
-        property_obj.residential.rooms if property_obj.residential else None,
-        property_id
-    )
-    
-    # Получаем историю изменения цен
-    price_history = await dynamic_pricing.get_recent_price_changes(property_id)
+    pricing_service = DynamicPricingService(db)
+    result = await pricing_service.update_property_price(property_obj)
+    if result:
+        return result
     
-    # Здесь должна быть логика расчета новой цены
-    # Пока возвращаем тестовые данные
+    # Цена не изменилась (спрос в норме, недавнее изменение или бронирование)
+    price = await crud_property_price.get_by_field(db, "property_id", property_id)
+    current_price = price[0].current_price if price else 0.0
+    demand_score = await pricing_service.calculate_demand_score(property_id)
     return DynamicPricingResult(
         property_id=property_id,
-        old_price=5000000.0,
-        new_price=5100000.0,
-        price_change_percent=2.0,
-        demand_score=0.8,
-        demand_normalized=0.7,
-        reason="market_demand",
-        description="Increased due to high demand in the area"
+        old_price=current_price,
+        new_price=current_price,
+        price_change_percent=0.0,
+        demand_score=demand_score,
+        demand_normalized=0.0,
+        reason="no_change",
+        description="Цена осталась без изменений"
     )
 
 
@@ -262,4 +263,37 @@ async def get_recent_price_changes(
     db: AsyncSession = Depends(get_async_session)
 ):
     """Получить недавние изменения цен"""
-    return await crud_price_history.get_recent_changes(db, hours) 
\ No newline at end of file
+    return await crud_price_history.get_recent_changes(db, hours)
+
+
+@router.post(
+    "/backtest",
+    response_model=PricingBacktestResult,
+    summary="Бэктест конфигурации",
+    description="Прогоняет конфигурацию динамического ценообразования на исторических просмотрах, "
+                "бронированиях и изменениях цен и возвращает траектории цен и разницу выручки по кластерам"
+)
+async def backtest_pricing_config(
+    request: PricingBacktestRequest,
+    db: AsyncSession = Depends(get_async_session),
+    _: dict = Depends(get_current_admin_user)
+) -> PricingBacktestResult:
+    """
+    Бэктест конфигурации динамического ценообразования
+    
+    Args:
+        request: Конфигурация-кандидат (или config_id), период и размер интервала
+        
+    Returns:
+        PricingBacktestResult: Итоги и результаты по кластерам (проект + комнаты)
+        
+    Raises:
+        400: Bad Request - Некорректный период
+        404: Not Found - Конфигурация не найдена
+    """
+    try:
+        return await PricingBacktestService(db).run(request)
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from typing import Any, Dict
+from app.models import User
+from app.schemas import ViewEventIngest, ViewEventBatch, ViewEventAccepted
+from app.security import get_current_admin_user
+from app.services.event_ingest import event_buffer, event_guard, EventBufferFull, EventRateLimited
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+async def _accept(request: Request, events) -> ViewEventAccepted:
+    # Адрес клиента; за прокси uvicorn берет его из X-Forwarded-For (--proxy-headers)
+    client = request.client.host if request.client else "unknown"
+    try:
+        admitted = await event_guard.admit(client, events)
+    except EventRateLimited as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many events, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    try:
+        accepted = event_buffer.add(admitted) if admitted else 0
+    except EventBufferFull:
+        await event_guard.forget(client, admitted)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Event buffer is full, retry later",
+            headers={"Retry-After": "1"}
+        )
+    return ViewEventAccepted(accepted=accepted, duplicates=len(events) - len(admitted))
+
+
+@router.post(
+    "/views",
+    response_model=ViewEventAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Принять событие просмотра",
+    description="Принимает событие просмотра или добавления в избранное; запись в views_log выполняется пачками в фоне"
+)
+async def ingest_view_event(event: ViewEventIngest, request: Request) -> ViewEventAccepted:
+    """
+    Принять одно событие
+    
+    Args:
+        event: Событие просмотра или добавления в избранное
+        
+    Returns:
+        ViewEventAccepted: Количество принятых событий и отсеянных повторов
+        
+    Raises:
+        429: Too Many Requests - Превышен лимит событий клиента
+        503: Service Unavailable - Буфер событий переполнен
+    """
+    return await _accept(request, [event])
+
+
+@router.post(
+    "/views/batch",
+    response_model=ViewEventAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Принять пачку событий просмотров",
+    description="Принимает до 1000 событий за запрос; запись в views_log выполняется пачками в фоне"
+)
+async def ingest_view_events(batch: ViewEventBatch, request: Request) -> ViewEventAccepted:
+    """
+    Принять пачку событий
+    
+    Args:
+        batch: События просмотров и добавлений в избранное
+        
+    Returns:
+        ViewEventAccepted: Количество принятых событий и отсеянных повторов
+        
+    Raises:
+        429: Too Many Requests - Превышен лимит событий клиента
+        503: Service Unavailable - Буфер событий переполнен
+    """
+    return await _accept(request, batch.events)
+
+
+@router.get("/stats", response_model=Dict[str, Any])
+async def get_ingest_stats(_: User = Depends(get_current_admin_user)):
+    """Счетчики буфера событий и проверок приема текущего процесса"""
+    return {**event_buffer.stats(), **event_guard.stats()}
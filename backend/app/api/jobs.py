@@ -0,0 +1,169 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud import crud_job_run
+from app.database import get_async_session
+from app.models import User
+from app.schemas import (
+    FanoutJobProgress, JobRunRead, JobRunItemRead, QueueStats, ScheduledJobState, ScheduledJobRun
+)
+from app.security import get_current_admin_user
+from app.services.job_fanout import fanout_progress
+from app.services.job_scheduler import SCHEDULED_JOBS, job_scheduler
+from app.services.queue_monitor import queue_monitor, queue_names
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/fanout/{job_id}", response_model=FanoutJobProgress)
+async def get_fanout_job_progress(
+    job_id: str,
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить прогресс массовой задачи, разбитой на пачки
+    
+    Args:
+        job_id: ID задачи из результата update_stats_task или update_dynamic_pricing_task
+        
+    Returns:
+        FanoutJobProgress: Счетчики пачек и объектов
+        
+    Raises:
+        404: Not Found - Задача не найдена или устарела
+    """
+    progress = await fanout_progress.get(job_id)
+    if not progress:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return progress
+
+
+@router.get("/scheduled", response_model=List[ScheduledJobState])
+async def get_scheduled_jobs(
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить состояние периодических задач воркера
+    
+    Returns:
+        List[ScheduledJobState]: Текущий адаптивный интервал, длительности и счетчики пропусков
+    """
+    return [await job_scheduler.get_state(spec) for spec in SCHEDULED_JOBS.values()]
+
+
+@router.get("/scheduled/{job}/runs", response_model=List[ScheduledJobRun])
+async def get_scheduled_job_runs(
+    job: str,
+    limit: int = Query(20, ge=1, le=100, description="Количество последних запусков"),
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить историю последних запусков периодической задачи
+    
+    Args:
+        job: Имя задачи
+        limit: Количество последних запусков
+        
+    Returns:
+        List[ScheduledJobRun]: Запуски, новые первыми
+        
+    Raises:
+        404: Not Found - Задача не найдена
+    """
+    spec = SCHEDULED_JOBS.get(job)
+    if not spec:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return await job_scheduler.get_runs(spec, limit)
+
+
+@router.get("/runs", response_model=List[JobRunRead])
+async def get_job_runs(
+    job: Optional[str] = Query(None, description="Имя задачи (stats, pricing_full)"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_session),
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить журнал запусков массовых задач
+    
+    Args:
+        job: Имя задачи
+        skip: Смещение
+        limit: Количество запусков
+        
+    Returns:
+        List[JobRunRead]: Сводки запусков, новые первыми
+    """
+    return await crud_job_run.get_runs(db, job=job, skip=skip, limit=limit)
+
+
+@router.get("/runs/{run_id}", response_model=JobRunRead)
+async def get_job_run(
+    run_id: str,
+    db: AsyncSession = Depends(get_async_session),
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить сводку запуска массовой задачи
+    
+    Args:
+        run_id: ID задачи (job_id из результата Celery)
+        
+    Returns:
+        JobRunRead: Счетчики, время и пример ошибок
+        
+    Raises:
+        404: Not Found - Запуск не найден
+    """
+    run = await crud_job_run.get(db, run_id)
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job run not found"
+        )
+    return run
+
+
+@router.get("/runs/{run_id}/items", response_model=List[JobRunItemRead])
+async def get_job_run_items(
+    run_id: str,
+    item_status: Optional[str] = Query(None, alias="status", description="high_demand, low_demand или error"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_session),
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить подробные результаты запуска по объектам и пачкам с ошибками
+    
+    Args:
+        run_id: ID задачи
+        item_status: Фильтр по результату
+        skip: Смещение
+        limit: Количество записей
+        
+    Returns:
+        List[JobRunItemRead]: Результаты в порядке записи
+    """
+    return await crud_job_run.get_items(db, run_id, status=item_status, skip=skip, limit=limit)
+
+
+@router.get("/queues", response_model=List[QueueStats])
+async def get_queue_stats(
+    _: User = Depends(get_current_admin_user)
+):
+    """
+    Получить глубину очередей Celery и задержку задач
+    
+    Returns:
+        List[QueueStats]: Для каждой очереди — число ожидающих сообщений и перцентили
+        ожидания в очереди и времени выполнения по последним задачам, секунды
+    """
+    return [await queue_monitor.get_stats(queue) for queue in queue_names()]
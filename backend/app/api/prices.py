@@ -7,6 +7,7 @@ from app.crud import crud_property_price
 from app.schemas import PropertyPriceCreate, PropertyPriceUpdate, PropertyPriceRead
 from app.security import get_current_user
 from app.models import User
+from app.services.match_cache import match_cache
 
 router = APIRouter(prefix="/prices", tags=["prices"])
 
@@ -85,6 +86,7 @@ async def create_price(
             )
         
         price = await crud_property_price.create(db, price_data.dict())
+        await match_cache.invalidate()
         return price
     except HTTPException:
         raise
@@ -121,6 +123,7 @@ async def update_price(
             )
         
         updated_price = await crud_property_price.update(db, price, price_data.dict(exclude_unset=True))
+        await match_cache.invalidate()
         return updated_price
     except HTTPException:
         raise
@@ -156,6 +159,7 @@ async def delete_price(
             )
         
         await crud_property_price.delete(db, price_id)
+        await match_cache.invalidate()
     except HTTPException:
         raise
     except Exception as e:
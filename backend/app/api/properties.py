@@ -2,17 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 from app.database import get_async_session
-from app.models import Property, UserRole
+from app.models import Property, PropertyPrice, ResidentialProperty, PropertyStatus, UserRole
 from app.schemas import PropertyCreate, PropertyUpdate, PropertyRead
 from app.security import get_current_user_role
+from app.services.catalog import catalog_snapshot
+from app.services.match_cache import match_cache
+from datetime import datetime
 from typing import List, Optional
 
 router = APIRouter(prefix="/properties", tags=["properties"])
 
-@router.get("/", response_model=List[PropertyRead],
-            summary="Получить список объектов недвижимости",
-            description="Получение списка всех доступных объектов недвижимости с возможностью фильтрации")
-async def get_properties(
+
+def properties_query(
     project_id: Optional[int] = None,
     building_id: Optional[int] = None,
     property_type: Optional[str] = None,
@@ -21,26 +22,69 @@ async def get_properties(
     min_area: Optional[float] = None,
     max_area: Optional[float] = None,
     rooms: Optional[int] = None,
-    session: AsyncSession = Depends(get_async_session)
-) -> List[PropertyRead]:
+    status: Optional[PropertyStatus] = None
+):
+    """SQL-выборка списка объектов; для доступных объектов должна совпадать с CatalogSnapshot.filter"""
     query = select(Property)
     
+    if status:
+        query = query.where(Property.status == status)
     if project_id:
         query = query.where(Property.project_id == project_id)
     if building_id:
         query = query.where(Property.building_id == building_id)
     if property_type:
         query = query.where(Property.property_type == property_type)
-    if min_price:
-        query = query.join(Property.price).where(Property.price.current_price >= min_price)
-    if max_price:
-        query = query.join(Property.price).where(Property.price.current_price <= max_price)
-    if min_area:
-        query = query.join(Property.residential).where(Property.residential.total_area >= min_area)
-    if max_area:
-        query = query.join(Property.residential).where(Property.residential.total_area <= max_area)
-    if rooms:
-        query = query.join(Property.residential).where(Property.residential.rooms == rooms)
+    if min_price or max_price:
+        query = query.join(PropertyPrice, PropertyPrice.property_id == Property.id)
+        if min_price:
+            query = query.where(PropertyPrice.current_price >= min_price)
+        if max_price:
+            query = query.where(PropertyPrice.current_price <= max_price)
+    if min_area or max_area or rooms:
+        query = query.join(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+        if min_area:
+            query = query.where(ResidentialProperty.total_area >= min_area)
+        if max_area:
+            query = query.where(ResidentialProperty.total_area <= max_area)
+        if rooms:
+            query = query.where(ResidentialProperty.rooms == rooms)
+    return query
+
+
+@router.get("/", response_model=List[PropertyRead],
+            summary="Получить список объектов недвижимости",
+            description="Получение списка всех доступных объектов недвижимости с возможностью фильтрации")
+async def get_properties(
+    project_id: Optional[int] = None,
+    building_id: Optional[int] = None,
+    property_type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_area: Optional[float] = None,
+    max_area: Optional[float] = None,
+    rooms: Optional[int] = None,
+    status: Optional[PropertyStatus] = Query(None, description="Статус объекта"),
+    session: AsyncSession = Depends(get_async_session)
+) -> List[PropertyRead]:
+    # Доступные объекты отдаются из снимка каталога без обращения к БД
+    if status == PropertyStatus.AVAILABLE and catalog_snapshot.is_ready:
+        rows = catalog_snapshot.filter(
+            project_id=project_id,
+            building_id=building_id,
+            property_type=property_type,
+            min_price=min_price,
+            max_price=max_price,
+            min_area=min_area,
+            max_area=max_area,
+            rooms=rooms,
+            strict_area=True
+        )
+        return catalog_snapshot.property_reads(rows)
+    
+    query = properties_query(
+        project_id, building_id, property_type, min_price, max_price, min_area, max_area, rooms, status
+    )
     
     properties = await session.execute(query)
     properties = properties.scalars().all()
@@ -105,9 +149,11 @@ async def update_property(
     
     for field, value in property_data.dict(exclude_unset=True).items():
         setattr(property, field, value)
+    property.updated_at = datetime.utcnow()
     
     await session.commit()
     await session.refresh(property)
+    await match_cache.invalidate()
     return PropertyRead.from_orm(property)
 
 @router.delete("/{property_id}",
@@ -133,4 +179,6 @@ async def delete_property(
     
     await session.delete(property)
     await session.commit()
+    await catalog_snapshot.delete(property_id)
+    await match_cache.invalidate()
     return {"message": "Объект недвижимости успешно удален"} 
\ No newline at end of file
@@ -59,11 +59,119 @@ class Settings(BaseSettings):
     elasticity_cap: float = 3.0
     price_max_shift: float = 7.0
     price_update_interval: int = 3600
+    pricing_full_scan_interval: int = 86400  # Полная переоценка каталога (страховочная), секунды
+    pricing_dirty_scan_interval: int = 300  # Поиск объектов с изменившимся спросом, секунды
+    pricing_dirty_min_views: int = 10  # Просмотров с последнего изменения цены для переоценки
+    pricing_dirty_min_bookings: int = 1  # Бронирований с последнего изменения цены для переоценки
+    pricing_dirty_lookback_days: int = 30  # Окно активности для объектов без истории цен
+    pricing_config_cache_ttl: int = 300  # Страховочный TTL кэша конфигурации ценообразования, секунды
+    
+    # Роллапы событий (property_event_rollups)
+    rollup_compaction_interval: int = 60  # Свертка новых строк views_log и bookings, секунды
+    rollup_compaction_batch_size: int = 500000  # ID исходной таблицы за одну транзакцию
+    rollup_hourly_retention_days: int = 7  # Часовые роллапы старше удаляются
+    
+    # Прием событий просмотров (/events)
+    event_ingest_batch_size: int = 5000  # Событий в одном COPY
+    event_ingest_flush_interval: float = 0.5  # Максимальная задержка записи, секунды
+    event_ingest_max_pending: int = 200000  # Лимит буфера процесса; сверх него — 503
+    event_ingest_max_backoff: float = 30.0  # Максимальная пауза между сбросами при ошибках БД, секунды
+    event_ingest_max_attempts: int = 5  # Попыток записи события; после них событие отбрасывается
+    event_ingest_rate_limit: int = 600  # Событий с одного клиента (адреса) за окно; сверх него — 429
+    event_ingest_rate_window: int = 60  # Окно лимита, секунды
+    event_ingest_dedupe_window: int = 1800  # Повтор события посетителя по объекту в окне не учитывается, секунды
+    
+    # Уникальные посетители (HyperLogLog в Redis)
+    unique_visitors_refresh_interval: int = 300  # Перенос оценок в property_analytics, секунды
+    pricing_use_unique_visitors: bool = False  # Спрос по уникальным посетителям вместо просмотров
+    
+    # Demand clustering
+    demand_clusters_k: int = 8
+    demand_clusters_max_iterations: int = 100
+    demand_clusters_interval: int = 86400  # Пересборка глобальной кластеризации, секунды
+    demand_clusters_keep_runs: int = 5  # Хранимых запусков на набор фильтров
+    pricing_use_demand_clusters: bool = False  # Медианы спроса по k-means кластерам вместо (проект, комнаты)
+    
+    # Партиции views_log
+    views_log_partitions_ahead: int = 2  # Партиций создается заранее, месяцев
+    views_log_retention_months: int = 13  # Более старые партиции архивируются
+    views_log_archive_dir: str = "/data/archive/views_log"  # Постоянный том; недоступный на запись каталог — ошибка архивации
+    
+    # AI Matching
+    ai_matching_candidate_limit: int = 2000  # Максимум кандидатов, передаваемых в скоринг
+    ai_matching_budget_overshoot: float = 1.2  # Допустимое превышение бюджета
+    
+    # AI Matching result cache
+    match_cache_enabled: bool = True
+    match_cache_ttl: int = 300  # секунды
+    match_cache_max_size: int = 2048
+    match_cache_budget_granularity: float = 50000.0  # Шаг округления бюджета, руб.
+    match_cache_version_check_interval: float = 1.0  # секунды
+    
+    # Market analytics cache
+    market_stats_cache_ttl: int = 60  # секунды
+    market_stats_cache_max_size: int = 256
+    
+    # District stats
+    district_stats_window_days: int = 30  # Окно просмотров и бронирований
+    district_stats_refresh_interval: int = 300  # Пересчет измененных районов в воркере, секунды
+    district_stats_full_refresh_interval: int = 86400  # Полный пересчет (сдвиг окна), секунды
+    district_stats_reload_interval: int = 60  # Перечитывание таблицы в процессе API, секунды
+    
+    # Catalog snapshot
+    catalog_snapshot_enabled: bool = True
+    catalog_refresh_interval: int = 30  # Инкрементальное обновление, секунды
+    catalog_full_reload_interval: int = 900  # Полная перезагрузка, секунды
+    catalog_load_batch_size: int = 5000
     
     # Celery
     celery_broker_url: str = "redis://redis:6379/0"
     celery_result_backend: str = "redis://redis:6379/0"
     
+    # Очереди Celery: интерактивные задачи по одному объекту, массовые задачи и обслуживание
+    celery_default_queue: str = "celery"
+    celery_interactive_queue: str = "interactive"
+    celery_bulk_queue: str = "bulk"
+    celery_default_concurrency: int = 2  # Процессов воркера на очередь (python run_worker.py <очередь>)
+    celery_interactive_concurrency: int = 4
+    celery_bulk_concurrency: int = 2
+    celery_interactive_priority: int = 0  # 0 — наивысший приоритет, 9 — наинизший
+    celery_default_priority: int = 5
+    celery_bulk_priority: int = 7
+    queue_latency_samples: int = 500  # Хранимых замеров ожидания и выполнения на очередь
+    
+    # Планирование периодических задач
+    stats_refresh_interval: int = 60  # Базовый интервал пересчета аналитики объектов, секунды
+    job_lease_ttl: int = 30 * 60  # Аренда запуска, секунды (не меньше лимита времени задачи)
+    job_runtime_factor: float = 2.0  # Интервал не меньше длительности запуска × factor
+    job_max_interval_factor: float = 10.0  # Интервал не больше базового × factor
+    job_backlog_threshold: int = 1000  # Задач в очередях брокера, при которых интервал удваивается
+    job_duration_smoothing: float = 0.3  # Коэффициент EWMA длительности
+    job_run_history: int = 50  # Хранимых запусков на задачу
+    
+    # Разбиение массовых задач на пачки
+    fanout_chunk_size: int = 5000  # Объектов в пачке; ID передаются списком в IN, поэтому не больше ~10000
+    fanout_chunk_max_retries: int = 3
+    fanout_retry_delay: int = 10  # Задержка первого повтора пачки, секунды (далее удваивается)
+    worker_scan_batch_size: int = 5000  # Строк в пачке серверного курсора при сканировании каталога
+    
+    # Результаты задач: в бэкенд Celery пишется только сводка, подробности — в job_runs / job_run_items
+    celery_result_expires: int = 6 * 3600  # Время жизни результатов в бэкенде, секунды
+    job_error_sample_size: int = 5  # Ошибок в сводке результата
+    job_run_items_enabled: bool = True  # Писать результаты по объектам в job_run_items
+    job_run_retention_days: int = 14
+    
+    # Пул процессов для CPU-ядер: скоринг подбора, формулы ценообразования, медианы кластеров
+    compute_pool_workers: int = 2  # 0 — всегда считать в текущем процессе
+    compute_pool_min_size: int = 50000  # Массивы короче считаются в текущем процессе
+    compute_pool_start_method: str = "spawn"  # Без fork: у процессов API и воркера есть потоки и цикл событий
+    
+    # Пул соединений с БД в процессе воркера (один движок на процесс)
+    worker_db_pool_size: int = 2
+    worker_db_max_overflow: int = 3
+    worker_db_pool_timeout: int = 30  # секунды
+    worker_db_pool_recycle: int = 1800  # секунды
+    
     # Documentation access
     docs_username: str = "admin"
     docs_password: str = "admin"
@@ -1,23 +1,37 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select, update, delete
-from typing import List, Optional, TypeVar, Generic, Type, Dict, Any
+from typing import AsyncIterator, List, Optional, TypeVar, Generic, Type, Dict, Any, Tuple
 from app.models import (
     User, Developer, Project, Building, Property, PropertyAddress, PropertyPrice,
     ResidentialProperty, PropertyFeatures, PropertyAnalytics, CommercialProperty,
     HouseAndLand, PropertyMedia, PromoTag, MortgageProgram, PriceHistory, ViewsLog, Booking,
-    Promotion, WebhookInbox, DynamicPricingConfig,
-    UserRole, PropertyType, PropertyCategory, PropertyStatus, BookingStatus,
-    ViewEvent, PriceChangeReason
+    Promotion, WebhookInbox, DynamicPricingConfig, MatchRecommendation, ClusterDemandStats, DistrictStats,
+    DemandClusterRun, DemandCluster, DemandClusterMember, JobRun, JobRunItem,
+    PropertyEventRollup, RollupWatermark, RollupEvent, RollupGranularity, UserRole, PropertyType, PropertyCategory, PropertyStatus, BookingStatus,
+    ViewEvent, PriceChangeReason, ParkingType
 )
 from datetime import datetime, timedelta
 import json
-from sqlalchemy import and_, or_, func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import (
+    BigInteger, Integer, String, and_, or_, case, cast, func, insert, literal, literal_column, tuple_, union, union_all
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import joinedload, contains_eager, selectinload
 
 # Generic type для CRUD операций
 ModelType = TypeVar("ModelType")
 
 
+async def stream_partitions(db: AsyncSession, query, batch_size: int) -> AsyncIterator[List[Any]]:
+    """
+    Читает результат запроса серверным курсором пачками по batch_size строк:
+    в памяти процесса одновременно находится только одна пачка
+    """
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        yield partition
+
+
 class CRUDBase(Generic[ModelType]):
     """Базовый класс для CRUD операций"""
     
@@ -184,6 +198,127 @@ class CRUDProperty(CRUDBase[Property]):
         """Получить доступные объекты"""
         return await self.get_by_field(db, "status", PropertyStatus.AVAILABLE)
     
+    async def get_match_candidates(
+        self,
+        db: AsyncSession,
+        budget: float,
+        preferred_cities: Optional[List[str]] = None,
+        preferred_districts: Optional[List[str]] = None,
+        min_rooms: Optional[int] = None,
+        max_rooms: Optional[int] = None,
+        min_area: Optional[float] = None,
+        max_area: Optional[float] = None,
+        property_type: Optional[PropertyType] = None,
+        category: Optional[PropertyCategory] = None,
+        has_balcony: Optional[bool] = None,
+        has_parking: Optional[bool] = None,
+        max_floor: Optional[int] = None,
+        budget_overshoot: float = 1.2,
+        limit: int = 1000
+    ) -> List[Property]:
+        """
+        Получить кандидатов для ИИ-подбора одним SQL-запросом.
+        Объекты без сателлитной записи (цены, адреса, жилых параметров,
+        характеристик) не отсекаются соответствующим фильтром.
+        Кандидаты упорядочены по близости цены к бюджету.
+        """
+        query = (
+            select(Property)
+            .outerjoin(PropertyPrice, PropertyPrice.property_id == Property.id)
+            .outerjoin(PropertyAddress, PropertyAddress.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .outerjoin(PropertyFeatures, PropertyFeatures.property_id == Property.id)
+            .outerjoin(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
+            .where(Property.status == PropertyStatus.AVAILABLE)
+            .options(
+                contains_eager(Property.price),
+                contains_eager(Property.address),
+                contains_eager(Property.residential),
+                contains_eager(Property.features),
+                contains_eager(Property.analytics)
+            )
+        )
+
+        # Допускаем превышение бюджета не более чем на budget_overshoot
+        query = query.where(or_(
+            PropertyPrice.property_id.is_(None),
+            PropertyPrice.current_price <= budget * budget_overshoot
+        ))
+
+        if preferred_cities:
+            query = query.where(or_(
+                PropertyAddress.property_id.is_(None),
+                PropertyAddress.city.in_(preferred_cities)
+            ))
+        if preferred_districts:
+            query = query.where(or_(
+                PropertyAddress.property_id.is_(None),
+                PropertyAddress.district.in_(preferred_districts)
+            ))
+
+        if property_type:
+            query = query.where(Property.property_type == property_type)
+        if category:
+            query = query.where(Property.category == category)
+
+        # Жилые параметры проверяются только если они заданы у объекта
+        if min_rooms:
+            query = query.where(or_(ResidentialProperty.rooms.is_(None), ResidentialProperty.rooms >= min_rooms))
+        if max_rooms:
+            query = query.where(or_(ResidentialProperty.rooms.is_(None), ResidentialProperty.rooms <= max_rooms))
+        if min_area:
+            query = query.where(or_(ResidentialProperty.total_area.is_(None), ResidentialProperty.total_area >= min_area))
+        if max_area:
+            query = query.where(or_(ResidentialProperty.total_area.is_(None), ResidentialProperty.total_area <= max_area))
+        if max_floor:
+            query = query.where(or_(ResidentialProperty.floor.is_(None), ResidentialProperty.floor <= max_floor))
+
+        if has_balcony is not None:
+            query = query.where(or_(
+                PropertyFeatures.property_id.is_(None),
+                PropertyFeatures.balcony == has_balcony
+            ))
+        if has_parking is not None:
+            has_parking_clause = and_(
+                PropertyFeatures.parking_type.is_not(None),
+                PropertyFeatures.parking_type != ParkingType.NONE
+            )
+            query = query.where(or_(
+                PropertyFeatures.property_id.is_(None),
+                has_parking_clause if has_parking else ~has_parking_clause
+            ))
+
+        query = query.order_by(
+            func.abs(PropertyPrice.current_price - budget).asc().nulls_last(),
+            Property.id
+        ).limit(limit)
+
+        result = await db.execute(query)
+        return result.unique().scalars().all()
+
+    async def get_many_with_relations(self, db: AsyncSession, property_ids: List[int]) -> List[Property]:
+        """Получить объекты со всеми связанными данными в порядке переданных ID"""
+        if not property_ids:
+            return []
+        query = select(Property).where(Property.id.in_(property_ids)).options(
+            joinedload(Property.developer),
+            joinedload(Property.project),
+            joinedload(Property.building),
+            joinedload(Property.address),
+            joinedload(Property.price),
+            joinedload(Property.residential),
+            joinedload(Property.features),
+            joinedload(Property.analytics),
+            joinedload(Property.commercial),
+            joinedload(Property.house_land),
+            selectinload(Property.media),
+            selectinload(Property.promo_tags),
+            selectinload(Property.mortgage_programs)
+        )
+        result = await db.execute(query)
+        by_id = {prop.id: prop for prop in result.unique().scalars().all()}
+        return [by_id[property_id] for property_id in property_ids if property_id in by_id]
+
     async def get_with_relations(self, db: AsyncSession, property_id: int) -> Optional[Property]:
         """Получить объект со всеми связанными данными"""
         query = select(Property).where(Property.id == property_id).options(
@@ -205,7 +340,55 @@ class CRUDProperty(CRUDBase[Property]):
         return result.scalar_one_or_none()
 
 
-class CRUDPropertyAddress(CRUDBase[PropertyAddress]):
+class CRUDPropertySatellite(CRUDBase[ModelType]):
+    """
+    CRUD операции для таблиц объекта с ключом property_id (цены, адреса).
+    Любая запись обновляет Property.updated_at, по которому инкрементально
+    обновляется снимок каталога
+    """
+
+    async def get(self, db: AsyncSession, id: int) -> Optional[ModelType]:
+        """Получить запись по ID объекта"""
+        result = await db.execute(select(self.model).where(self.model.property_id == id))
+        return result.scalar_one_or_none()
+
+    async def _touch_property(self, db: AsyncSession, property_id: int) -> None:
+        """Обновить отметку updated_at объекта, по которой обновляется снимок каталога"""
+        await db.execute(
+            update(Property)
+            .where(Property.id == property_id)
+            .values(updated_at=datetime.utcnow())
+        )
+
+    async def create(self, db: AsyncSession, obj_in: dict) -> ModelType:
+        """Создать запись объекта"""
+        await self._touch_property(db, obj_in["property_id"])
+        return await super().create(db, obj_in)
+
+    async def update(
+        self,
+        db: AsyncSession,
+        db_obj: ModelType,
+        obj_in: dict
+    ) -> ModelType:
+        """Обновить запись объекта"""
+        await self._touch_property(db, db_obj.property_id)
+        if obj_in.get("property_id", db_obj.property_id) != db_obj.property_id:
+            await self._touch_property(db, obj_in["property_id"])
+        return await super().update(db, db_obj, obj_in)
+
+    async def delete(self, db: AsyncSession, id: int) -> bool:
+        """Удалить запись объекта"""
+        db_obj = await self.get(db, id)
+        if db_obj is None:
+            return False
+        await self._touch_property(db, db_obj.property_id)
+        await db.delete(db_obj)
+        await db.commit()
+        return True
+
+
+class CRUDPropertyAddress(CRUDPropertySatellite[PropertyAddress]):
     """CRUD операции для адресов объектов"""
     
     async def get_by_city(self, db: AsyncSession, city: str) -> List[PropertyAddress]:
@@ -221,7 +404,7 @@ class CRUDPropertyAddress(CRUDBase[PropertyAddress]):
         return await self.get_by_field(db, "district", district)
     
 
-class CRUDPropertyPrice(CRUDBase[PropertyPrice]):
+class CRUDPropertyPrice(CRUDPropertySatellite[PropertyPrice]):
     """CRUD операции для цен объектов"""
 
     async def get_by_price_range(
@@ -252,6 +435,7 @@ class CRUDPropertyPrice(CRUDBase[PropertyPrice]):
         if price_obj:
             old_price = price_obj.current_price
             price_obj.current_price = new_price
+            await self._touch_property(db, property_id)
             await db.commit()
             await db.refresh(price_obj)
             
@@ -325,6 +509,206 @@ class CRUDPropertyAnalytics(CRUDBase[PropertyAnalytics]):
             select(PropertyAnalytics).where(PropertyAnalytics.clicks_total >= min_views)
         )
         return result.scalars().all()
+    
+    async def get_recently_active_ids(self, db: AsyncSession, since: datetime) -> List[int]:
+        """Получить ID объектов с просмотрами после since (по суточным роллапам)"""
+        events = rollup_event_source(RollupGranularity.DAY, floor_to_bucket(since, RollupGranularity.DAY))
+        result = await db.execute(
+            select(events.c.property_id)
+            .where(events.c.event != RollupEvent.BOOKING)
+            .distinct()
+        )
+        return result.scalars().all()
+    
+    async def bulk_update_unique_visitors(
+        self,
+        db: AsyncSession,
+        rows: List[Dict[str, Any]],
+        reset_missing: bool = True
+    ) -> None:
+        """
+        Записать оценки уникальных посетителей; при reset_missing у объектов,
+        не попавших в rows, счетчики обнуляются (посетителей в окне не было)
+        """
+        if reset_missing:
+            await db.execute(
+                update(PropertyAnalytics)
+                .where(PropertyAnalytics.unique_visitors_month > 0)
+                .values(unique_visitors_day=0, unique_visitors_week=0, unique_visitors_month=0)
+            )
+        if rows:
+            await db.execute(update(PropertyAnalytics), rows)
+        await db.commit()
+    
+    # Оценка спроса: 40% — просмотры (насыщение на 1000), 60% — бронирования (насыщение на 50)
+    DEMAND_VIEWS_WEIGHT = 0.4
+    DEMAND_BOOKINGS_WEIGHT = 0.6
+    DEMAND_MAX_VIEWS = 1000
+    DEMAND_MAX_BOOKINGS = 50
+    
+    async def get_avg_views_last_month(self, db: AsyncSession, now: Optional[datetime] = None) -> float:
+        """
+        Среднее число просмотров за 30 дней на объект по всему каталогу
+        (знаменатель rli_index); 1, если просмотров не было
+        """
+        now = now or datetime.utcnow()
+        month_start = floor_to_bucket(now - timedelta(days=30), RollupGranularity.DAY)
+        month_events = rollup_event_source(RollupGranularity.DAY, since=month_start)
+        result = await db.execute(
+            select(
+                select(func.sum(month_events.c.count))
+                .where(month_events.c.event != RollupEvent.BOOKING)
+                .scalar_subquery(),
+                select(func.count(Property.id)).scalar_subquery()
+            )
+        )
+        views, properties = result.one()
+        return float(views) / properties if views and properties else 1.0
+    
+    async def bulk_refresh(
+        self,
+        db: AsyncSession,
+        property_ids: Optional[List[int]] = None,
+        now: Optional[datetime] = None,
+        avg_views_last_month: Optional[float] = None
+    ) -> int:
+        """
+        Пересчитать аналитику объектов (всех, если property_ids не задан) по роллапам
+        событий одним INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+        avg_views_last_month — среднее по каталогу (get_avg_views_last_month): при пересчете
+        пачками его считают один раз на запуск. rli_index и demand_score без просмотров
+        не пересчитываются, как и в поштучном расчете
+        """
+        now = now or datetime.utcnow()
+        if avg_views_last_month is None:
+            avg_views_last_month = await self.get_avg_views_last_month(db, now)
+        week_ago = now - timedelta(days=7)
+        month_ago = now - timedelta(days=30)
+        
+        week_start = floor_to_bucket(week_ago, RollupGranularity.DAY)
+        month_start = floor_to_bucket(month_ago, RollupGranularity.DAY)
+        
+        # Окна 7 и 30 дней считаются по суточным роллапам с точностью до суток
+        events = rollup_event_source(RollupGranularity.DAY, property_ids=property_ids)
+        is_booking = events.c.event == RollupEvent.BOOKING
+        counts = (
+            select(
+                events.c.property_id,
+                func.sum(events.c.count).filter(~is_booking).label("clicks_total"),
+                func.sum(events.c.count).filter(events.c.event == RollupEvent.FAVOURITE).label("favourites_total"),
+                func.sum(events.c.count).filter(and_(~is_booking, events.c.ts >= week_start)).label("views_last_week"),
+                func.sum(events.c.count).filter(and_(~is_booking, events.c.ts >= month_start)).label("views_last_month"),
+                func.sum(events.c.count).filter(is_booking).label("bookings_total")
+            )
+            .group_by(events.c.property_id)
+            .subquery()
+        )
+        properties_filter = literal(True)
+        if property_ids is not None:
+            properties_filter = Property.id.in_(property_ids)
+        
+        clicks_total = func.coalesce(counts.c.clicks_total, 0)
+        views_last_month = func.coalesce(counts.c.views_last_month, 0)
+        bookings_total = func.coalesce(counts.c.bookings_total, 0)
+        demand_score = cast(func.floor(
+            func.least(clicks_total / float(self.DEMAND_MAX_VIEWS), 1.0) * self.DEMAND_VIEWS_WEIGHT * 100
+            + func.least(bookings_total / float(self.DEMAND_MAX_BOOKINGS), 1.0) * self.DEMAND_BOOKINGS_WEIGHT * 100
+        ), Integer)
+        
+        stats_query = (
+            select(
+                Property.id,
+                func.greatest(cast(func.extract("day", now - Property.created_at), Integer), 0),
+                case((views_last_month > 0, func.least(views_last_month / float(avg_views_last_month), 1.0))),
+                case((clicks_total > 0, demand_score)),
+                clicks_total,
+                func.coalesce(counts.c.favourites_total, 0),
+                bookings_total,
+                func.coalesce(counts.c.views_last_week, 0),
+                views_last_month
+            )
+            .outerjoin(counts, counts.c.property_id == Property.id)
+            .where(properties_filter)
+        )
+        columns = [
+            "property_id", "days_on_market", "rli_index", "demand_score", "clicks_total",
+            "favourites_total", "bookings_total", "views_last_week", "views_last_month"
+        ]
+        upsert = pg_insert(PropertyAnalytics).from_select(columns, stats_query)
+        excluded = upsert.excluded
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[PropertyAnalytics.property_id],
+            set_={
+                "days_on_market": excluded.days_on_market,
+                "rli_index": func.coalesce(excluded.rli_index, PropertyAnalytics.rli_index),
+                "demand_score": func.coalesce(excluded.demand_score, PropertyAnalytics.demand_score),
+                "clicks_total": excluded.clicks_total,
+                "favourites_total": excluded.favourites_total,
+                "bookings_total": excluded.bookings_total,
+                "views_last_week": excluded.views_last_week,
+                "views_last_month": excluded.views_last_month
+            }
+        )
+        result = await db.execute(upsert)
+        await db.commit()
+        return result.rowcount
+    
+    async def get_market_aggregate(
+        self,
+        db: AsyncSession,
+        since: datetime,
+        property_type: Optional[PropertyType] = None,
+        city: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Итоги и средние по рынку за период одним агрегирующим запросом по суточным
+        роллапам событий (с несвернутым хвостом) с фильтрами по типу объекта и городу
+        """
+        since = floor_to_bucket(since, RollupGranularity.DAY)
+        events = rollup_event_source(RollupGranularity.DAY, since=since)
+        is_booking = events.c.event == RollupEvent.BOOKING
+        counts = (
+            select(
+                events.c.property_id,
+                func.sum(events.c.count).filter(~is_booking).label("views"),
+                func.sum(events.c.count).filter(is_booking).label("bookings")
+            )
+            .group_by(events.c.property_id)
+            .subquery()
+        )
+        views = func.coalesce(counts.c.views, 0)
+        bookings = func.coalesce(counts.c.bookings, 0)
+        
+        query = (
+            select(
+                func.count(Property.id).label("total_properties"),
+                func.count(Property.id).filter(Property.created_at >= since).label("new_properties"),
+                func.coalesce(func.sum(views), 0).label("total_views"),
+                func.coalesce(func.sum(bookings), 0).label("total_bookings"),
+                func.coalesce(func.avg(views), 0).label("avg_views"),
+                func.coalesce(func.avg(bookings), 0).label("avg_bookings"),
+                func.coalesce(func.avg(PropertyAnalytics.days_on_market), 0).label("avg_days_on_market")
+            )
+            .select_from(Property)
+            .outerjoin(counts, counts.c.property_id == Property.id)
+            .outerjoin(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
+        )
+        if property_type is not None:
+            query = query.where(Property.property_type == property_type)
+        if city is not None:
+            query = query.join(PropertyAddress, PropertyAddress.property_id == Property.id).where(
+                PropertyAddress.city == city
+            )
+        row = (await db.execute(query)).one()
+        return {
+            "total_properties": row.total_properties,
+            "new_properties": row.new_properties,
+            "total_views": int(row.total_views),
+            "total_bookings": int(row.total_bookings),
+            "avg_views": round(float(row.avg_views), 2),
+            "avg_bookings": round(float(row.avg_bookings), 2),
+            "avg_days_on_market": round(float(row.avg_days_on_market), 2)
+        }
 
 
 class CRUDCommercialProperty(CRUDBase[CommercialProperty]):
@@ -444,18 +828,35 @@ class CRUDViewsLog(CRUDBase[ViewsLog]):
         skip: int = 0,
         limit: int = 100
     ) -> List[ViewsLog]:
-        """Получить логи просмотров объекта"""
+        """Получить логи просмотров объекта, начиная с последних (границы по времени отсекают партиции)"""
         query = select(ViewsLog).where(ViewsLog.property_id == property_id)
         
         if start_date:
-            query = query.where(ViewsLog.viewed_at >= start_date)
+            query = query.where(ViewsLog.occurred_at >= start_date)
         if end_date:
-            query = query.where(ViewsLog.viewed_at <= end_date)
+            query = query.where(ViewsLog.occurred_at <= end_date)
             
-        query = query.offset(skip).limit(limit)
+        query = query.order_by(ViewsLog.occurred_at.desc()).offset(skip).limit(limit)
         result = await db.execute(query)
         return result.scalars().all()
     
+    async def _count_events(
+        self,
+        db: AsyncSession,
+        property_id: int,
+        event: ViewEvent,
+        hours: int
+    ) -> int:
+        since = datetime.utcnow() - timedelta(hours=hours)
+        result = await db.execute(
+            select(func.count(ViewsLog.id)).where(and_(
+                ViewsLog.property_id == property_id,
+                ViewsLog.event == event,
+                ViewsLog.occurred_at >= since
+            ))
+        )
+        return result.scalar() or 0
+    
     async def get_views_count(
         self, 
         db: AsyncSession, 
@@ -463,8 +864,7 @@ class CRUDViewsLog(CRUDBase[ViewsLog]):
         hours: int = 24
     ) -> int:
         """Получить количество просмотров за период"""
-        logs = await self.get_by_time_window(db, "viewed_at", hours, property_id)
-        return len([log for log in logs if log.event_type == ViewEvent.VIEW])
+        return await self._count_events(db, property_id, ViewEvent.VIEW, hours)
     
     async def get_favourites_count(
         self, 
@@ -473,8 +873,7 @@ class CRUDViewsLog(CRUDBase[ViewsLog]):
         hours: int = 24
     ) -> int:
         """Получить количество добавлений в избранное за период"""
-        logs = await self.get_by_time_window(db, "viewed_at", hours, property_id)
-        return len([log for log in logs if log.event_type == ViewEvent.FAVOURITE])
+        return await self._count_events(db, property_id, ViewEvent.FAVOURITE, hours)
 
 
 class CRUDBooking(CRUDBase[Booking]):
@@ -523,8 +922,13 @@ class CRUDDynamicPricingConfig(CRUDBase[DynamicPricingConfig]):
             select(DynamicPricingConfig)
             .where(DynamicPricingConfig.enabled == True)
             .order_by(DynamicPricingConfig.created_at.desc())
+            .limit(1)
         )
-        return result.scalar_one_or_none()
+        return result.scalars().first()
+
+
+# Префикс ID-watermark'ов поиска объектов для переоценки в rollup_watermarks
+DIRTY_PRICING_WATERMARK_PREFIX = "dirty_pricing:"
 
 
 class CRUDDynamicPricing:
@@ -594,6 +998,291 @@ class CRUDDynamicPricing:
         )
         return result.scalar_one_or_none()
     
+    async def get_pricing_rows(self, property_ids: Optional[List[int]] = None):
+        """Получить строки для пакетной переоценки: id, кластер и цены доступных объектов"""
+        query = (
+            select(
+                Property.id,
+                Property.project_id,
+                ResidentialProperty.rooms,
+                PropertyPrice.current_price,
+                PropertyPrice.base_price,
+                PropertyAnalytics.unique_visitors_month
+            )
+            .join(PropertyPrice, PropertyPrice.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .outerjoin(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
+            .where(Property.status == PropertyStatus.AVAILABLE)
+            .order_by(Property.id)
+        )
+        if property_ids is not None:
+            query = query.where(Property.id.in_(property_ids))
+        result = await self.session.execute(query)
+        return result.all()
+    
+    async def get_event_counts(
+        self,
+        since: datetime,
+        property_ids: Optional[List[int]] = None
+    ) -> Dict[str, Dict[int, int]]:
+        """
+        Получить количество просмотров и бронирований по объектам из суточных роллапов
+        (окно начинается с полуночи дня, содержащего since)
+        """
+        events = rollup_event_source(
+            RollupGranularity.DAY, floor_to_bucket(since, RollupGranularity.DAY), property_ids
+        )
+        is_booking = events.c.event == RollupEvent.BOOKING
+        result = await self.session.execute(
+            select(
+                events.c.property_id,
+                func.coalesce(func.sum(events.c.count).filter(~is_booking), 0),
+                func.coalesce(func.sum(events.c.count).filter(is_booking), 0)
+            )
+            .group_by(events.c.property_id)
+        )
+        counts = {"views": {}, "bookings": {}}
+        for property_id, views, bookings in result.all():
+            if views:
+                counts["views"][property_id] = int(views)
+            if bookings:
+                counts["bookings"][property_id] = int(bookings)
+        return counts
+    
+    async def get_cluster_demand_rows(self, project_ids: Optional[List[Optional[int]]] = None):
+        """Получить спрос доступных объектов для расчета медиан кластеров (проект + комнаты)"""
+        query = (
+            select(
+                Property.id,
+                Property.project_id,
+                ResidentialProperty.rooms,
+                PropertyAnalytics.demand_score
+            )
+            .join(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .where(Property.status == PropertyStatus.AVAILABLE)
+        )
+        if project_ids is not None:
+            if not project_ids:
+                return []
+            known_ids = [project_id for project_id in project_ids if project_id is not None]
+            conditions = [Property.project_id.in_(known_ids)] if known_ids else []
+            if len(known_ids) != len(project_ids):
+                conditions.append(Property.project_id.is_(None))
+            query = query.where(or_(*conditions))
+        result = await self.session.execute(query)
+        return result.all()
+    
+    async def get_recently_repriced_ids(
+        self,
+        since: datetime,
+        property_ids: Optional[List[int]] = None
+    ) -> set:
+        """Получить ID объектов, цена которых менялась после since"""
+        query = select(PriceHistory.property_id).where(PriceHistory.changed_at >= since).distinct()
+        if property_ids is not None:
+            query = query.where(PriceHistory.property_id.in_(property_ids))
+        result = await self.session.execute(query)
+        return set(result.scalars().all())
+    
+    async def get_recently_booked_ids(
+        self,
+        since: datetime,
+        property_ids: Optional[List[int]] = None
+    ) -> set:
+        """Получить ID объектов, забронированных после since"""
+        query = select(Booking.property_id).where(Booking.booked_at >= since).distinct()
+        if property_ids is not None:
+            query = query.where(Booking.property_id.in_(property_ids))
+        result = await self.session.execute(query)
+        return set(result.scalars().all())
+    
+    async def claim_properties_with_new_events(self, since: datetime) -> List[int]:
+        """
+        Получить ID доступных объектов, у которых после прошлого вызова вставлены
+        просмотры или бронирования с временем события после since.
+        Позиция хранится ID-watermark'ами dirty_pricing:<источник> в rollup_watermarks
+        (advance_id_watermark), поэтому поздно закоммиченные события не теряются.
+        Watermark'и заблокированы до коммита сессии: вызывающий коммитит после
+        обработки, при ошибке откат вернет события в следующий вызов
+        """
+        now = datetime.utcnow()
+        parts = []
+        for source, (model, ts_column, _, _) in ROLLUP_SOURCES.items():
+            name = f"{DIRTY_PRICING_WATERMARK_PREFIX}{source}"
+            last_id, upper_id = await advance_id_watermark(self.session, name, model)
+            await self.session.execute(
+                update(RollupWatermark)
+                .where(RollupWatermark.source == name)
+                .values(last_id=upper_id, updated_at=now)
+            )
+            if upper_id > last_id:
+                parts.append(select(model.property_id).where(and_(
+                    model.id > last_id,
+                    model.id <= upper_id,
+                    ts_column > since
+                )))
+        if not parts:
+            return []
+        events = union(*parts).subquery()
+        result = await self.session.execute(
+            select(Property.id).where(and_(
+                Property.status == PropertyStatus.AVAILABLE,
+                Property.id.in_(select(events.c.property_id))
+            ))
+        )
+        return result.scalars().all()
+    
+    async def get_activity_since_last_change(
+        self,
+        property_ids: List[int],
+        default_since: datetime
+    ) -> Dict[int, Dict[str, int]]:
+        """
+        Получить количество просмотров и бронирований с момента последнего
+        изменения цены, но не раньше default_since (статическая граница отсекает партиции)
+        """
+        if not property_ids:
+            return {}
+        last_change = (
+            select(PriceHistory.property_id, func.max(PriceHistory.changed_at).label("changed_at"))
+            .where(PriceHistory.property_id.in_(property_ids))
+            .group_by(PriceHistory.property_id)
+            .subquery()
+        )
+        since = func.coalesce(last_change.c.changed_at, default_since)
+        views_query = (
+            select(ViewsLog.property_id, func.count(ViewsLog.id))
+            .outerjoin(last_change, last_change.c.property_id == ViewsLog.property_id)
+            .where(and_(
+                ViewsLog.property_id.in_(property_ids),
+                ViewsLog.occurred_at > since,
+                ViewsLog.occurred_at > default_since
+            ))
+            .group_by(ViewsLog.property_id)
+        )
+        bookings_query = (
+            select(Booking.property_id, func.count(Booking.id))
+            .outerjoin(last_change, last_change.c.property_id == Booking.property_id)
+            .where(and_(
+                Booking.property_id.in_(property_ids),
+                Booking.booked_at > since,
+                Booking.booked_at > default_since
+            ))
+            .group_by(Booking.property_id)
+        )
+        activity = {property_id: {"views": 0, "bookings": 0} for property_id in property_ids}
+        for property_id, count in (await self.session.execute(views_query)).all():
+            activity[property_id]["views"] = count
+        for property_id, count in (await self.session.execute(bookings_query)).all():
+            activity[property_id]["bookings"] = count
+        return activity
+    
+    @staticmethod
+    def _bucket_index(column, start: datetime, bucket_seconds: int):
+        """Номер интервала длиной bucket_seconds от start для колонки времени"""
+        return cast(func.floor(func.extract("epoch", column - start) / bucket_seconds), Integer)
+    
+    @staticmethod
+    def _project_scope(property_column, project_ids: Optional[List[int]]):
+        """Условие принадлежности объекта проектам (все объекты, если project_ids не задан)"""
+        if project_ids is None:
+            return literal(True)
+        return property_column.in_(select(Property.id).where(Property.project_id.in_(project_ids)))
+    
+    async def get_backtest_properties(self, project_ids: Optional[List[int]] = None):
+        """Получить объекты с ценами для бэктеста: id, кластер, базовая и текущая цена"""
+        query = (
+            select(
+                Property.id,
+                Property.project_id,
+                ResidentialProperty.rooms,
+                PropertyPrice.base_price,
+                PropertyPrice.current_price
+            )
+            .join(PropertyPrice, PropertyPrice.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .order_by(Property.id)
+        )
+        if project_ids is not None:
+            query = query.where(Property.project_id.in_(project_ids))
+        result = await self.session.execute(query)
+        return result.all()
+    
+    async def get_bucketed_views(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
+        project_ids: Optional[List[int]] = None
+    ):
+        """Количество событий просмотров по объектам, типам событий и интервалам времени"""
+        bucket = self._bucket_index(ViewsLog.occurred_at, start, bucket_seconds).label("bucket")
+        result = await self.session.execute(
+            select(ViewsLog.property_id, ViewsLog.event, bucket, func.count(ViewsLog.id))
+            .where(and_(
+                ViewsLog.occurred_at >= start,
+                ViewsLog.occurred_at < end,
+                self._project_scope(ViewsLog.property_id, project_ids)
+            ))
+            .group_by(ViewsLog.property_id, ViewsLog.event, bucket)
+        )
+        return result.all()
+    
+    async def get_bucketed_bookings(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int,
+        project_ids: Optional[List[int]] = None
+    ):
+        """Количество бронирований по объектам и интервалам времени"""
+        bucket = self._bucket_index(Booking.booked_at, start, bucket_seconds).label("bucket")
+        result = await self.session.execute(
+            select(Booking.property_id, bucket, func.count(Booking.id))
+            .where(and_(
+                Booking.booked_at >= start,
+                Booking.booked_at < end,
+                self._project_scope(Booking.property_id, project_ids)
+            ))
+            .group_by(Booking.property_id, bucket)
+        )
+        return result.all()
+    
+    async def get_price_changes_since(self, since: datetime, project_ids: Optional[List[int]] = None):
+        """Получить изменения цен после since в хронологическом порядке"""
+        result = await self.session.execute(
+            select(
+                PriceHistory.property_id,
+                PriceHistory.changed_at,
+                PriceHistory.old_price,
+                PriceHistory.new_price
+            )
+            .where(and_(
+                PriceHistory.changed_at >= since,
+                self._project_scope(PriceHistory.property_id, project_ids)
+            ))
+            .order_by(PriceHistory.changed_at, PriceHistory.id)
+        )
+        return result.all()
+    
+    async def bulk_apply_prices(
+        self,
+        price_updates: List[Dict[str, Any]],
+        history_rows: List[Dict[str, Any]]
+    ) -> None:
+        """Применить новые цены и записать историю в одной транзакции"""
+        if not price_updates:
+            return
+        now = datetime.utcnow()
+        await self.session.execute(update(PropertyPrice), price_updates)
+        await self.session.execute(
+            update(Property),
+            [{"id": row["property_id"], "updated_at": now} for row in price_updates]
+        )
+        await self.session.execute(insert(PriceHistory), history_rows)
+        await self.session.commit()
+    
     async def create_price_history(self, data: dict) -> PriceHistory:
         """Создать запись в истории цен"""
         price_history = PriceHistory(
@@ -638,40 +1327,744 @@ class CRUDWebhook(CRUDBase[WebhookInbox]):
         return result.scalars().all()
 
 
-class CRUDWorker:
-    """CRUD операции для воркера"""
+class CRUDMatchRecommendation(CRUDBase[MatchRecommendation]):
+    """CRUD операции для результатов пакетного подбора"""
+    
+    async def bulk_create(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+        """Сохранить рекомендации одним многострочным INSERT"""
+        if not rows:
+            return 0
+        await db.execute(insert(MatchRecommendation), rows)
+        await db.commit()
+        return len(rows)
+    
+    async def get_by_run(
+        self,
+        db: AsyncSession,
+        run_id: str,
+        profile_id: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[MatchRecommendation]:
+        """Получить рекомендации прогона"""
+        query = select(MatchRecommendation).where(MatchRecommendation.run_id == run_id)
+        if profile_id:
+            query = query.where(MatchRecommendation.profile_id == profile_id)
+        query = query.order_by(MatchRecommendation.profile_index, MatchRecommendation.rank).offset(skip).limit(limit)
+        result = await db.execute(query)
+        return result.scalars().all()
+
+
+class CRUDClusterDemandStats(CRUDBase[ClusterDemandStats]):
+    """CRUD операции для статистики спроса по кластерам (проект + комнаты)"""
+    
+    async def refresh(self, db: AsyncSession) -> int:
+        """Пересчитать статистику всех кластеров одним запросом с percentile_cont"""
+        demand = PropertyAnalytics.demand_score
+        stats_query = (
+            select(
+                Property.project_id,
+                ResidentialProperty.rooms,
+                func.percentile_cont(0.5).within_group(demand),
+                func.percentile_cont(0.25).within_group(demand),
+                func.percentile_cont(0.75).within_group(demand),
+                func.count(demand),
+                literal(datetime.utcnow())
+            )
+            .join(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .where(and_(
+                Property.status == PropertyStatus.AVAILABLE,
+                demand.is_not(None)
+            ))
+            .group_by(Property.project_id, ResidentialProperty.rooms)
+        )
+        await db.execute(delete(ClusterDemandStats))
+        result = await db.execute(
+            insert(ClusterDemandStats).from_select(
+                ["project_id", "rooms", "median_demand", "p25_demand", "p75_demand",
+                 "property_count", "updated_at"],
+                stats_query
+            )
+        )
+        await db.commit()
+        return result.rowcount
+    
+    async def get_for_cluster(
+        self,
+        db: AsyncSession,
+        project_id: Optional[int],
+        rooms: Optional[int]
+    ) -> Optional[ClusterDemandStats]:
+        """Получить статистику кластера"""
+        query = select(ClusterDemandStats).where(
+            ClusterDemandStats.project_id == project_id if project_id is not None
+            else ClusterDemandStats.project_id.is_(None),
+            ClusterDemandStats.rooms == rooms if rooms is not None
+            else ClusterDemandStats.rooms.is_(None)
+        )
+        result = await db.execute(query)
+        return result.scalars().first()
+    
+    async def get_medians(self, db: AsyncSession) -> Dict[tuple, float]:
+        """Получить медианы спроса всех кластеров по ключу (project_id, rooms)"""
+        result = await db.execute(
+            select(ClusterDemandStats.project_id, ClusterDemandStats.rooms, ClusterDemandStats.median_demand)
+        )
+        return {(project_id, rooms): median for project_id, rooms, median in result.all()}
+    
+    async def get_filtered(
+        self,
+        db: AsyncSession,
+        project_id: Optional[int] = None,
+        rooms: Optional[int] = None
+    ) -> List[ClusterDemandStats]:
+        """Получить статистику кластеров с фильтрацией"""
+        query = select(ClusterDemandStats)
+        if project_id is not None:
+            query = query.where(ClusterDemandStats.project_id == project_id)
+        if rooms is not None:
+            query = query.where(ClusterDemandStats.rooms == rooms)
+        result = await db.execute(query.order_by(ClusterDemandStats.project_id, ClusterDemandStats.rooms))
+        return result.scalars().all()
+
+
+ROLLUP_EVENT_TYPE = PropertyEventRollup.__table__.c.event.type
+ROLLUP_GRANULARITY_TYPE = PropertyEventRollup.__table__.c.granularity.type
+
+
+# События хвоста (после watermark) не старше времени последней свертки минус запас:
+# время событий при приеме ограничено сутками в прошлое
+ROLLUP_TAIL_LOOKBACK = timedelta(days=2)
+
+
+def _date_trunc(granularity: RollupGranularity, column):
+    """date_trunc с константой вместо параметра, чтобы выражение совпадало в SELECT и GROUP BY"""
+    return func.date_trunc(literal_column(f"'{granularity.value}'"), column)
+
+# Исходные таблицы роллапов: модель, время события, тип события и колонки группировки
+ROLLUP_SOURCES = {
+    "views_log": (
+        ViewsLog,
+        ViewsLog.occurred_at,
+        cast(cast(ViewsLog.event, String), ROLLUP_EVENT_TYPE),
+        [ViewsLog.property_id, ViewsLog.event]
+    ),
+    "bookings": (
+        Booking,
+        Booking.booked_at,
+        cast(literal(RollupEvent.BOOKING, ROLLUP_EVENT_TYPE), ROLLUP_EVENT_TYPE),
+        [Booking.property_id]
+    ),
+}
+
+
+def floor_to_bucket(value: datetime, granularity: RollupGranularity) -> datetime:
+    """Начало часового или суточного интервала, содержащего value"""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if granularity == RollupGranularity.DAY:
+        value = value.replace(hour=0)
+    return value
+
+
+def rollup_event_source(
+    granularity: RollupGranularity,
+    since: Optional[datetime] = None,
+    property_ids: Optional[List[int]] = None
+):
+    """
+    События объектов в виде (property_id, event, ts, count): роллапы заданной
+    гранулярности плюс еще не свернутый хвост views_log и bookings после watermark.
+    since должен быть выровнен по началу интервала (floor_to_bucket)
+    """
+    rollup = (
+        select(
+            PropertyEventRollup.property_id,
+            PropertyEventRollup.event,
+            PropertyEventRollup.bucket_start.label("ts"),
+            PropertyEventRollup.count.label("count")
+        )
+        .where(PropertyEventRollup.granularity == granularity)
+    )
+    if since is not None:
+        rollup = rollup.where(PropertyEventRollup.bucket_start >= since)
+    if property_ids is not None:
+        rollup = rollup.where(PropertyEventRollup.property_id.in_(property_ids))
+    
+    parts = [rollup]
+    for source, (model, ts_column, event, _) in ROLLUP_SOURCES.items():
+        watermark = func.coalesce(
+            select(RollupWatermark.last_id).where(RollupWatermark.source == source).scalar_subquery(),
+            0
+        )
+        # Нижняя граница времени хвоста отсекает старые партиции views_log
+        checked_at = select(RollupWatermark.updated_at).where(RollupWatermark.source == source).scalar_subquery()
+        tail_since = func.coalesce(checked_at - ROLLUP_TAIL_LOOKBACK, datetime(1970, 1, 1))
+        tail = select(model.property_id, event, ts_column, literal_column("1")).where(and_(
+            model.id > watermark,
+            ts_column >= tail_since
+        ))
+        if since is not None:
+            tail = tail.where(ts_column >= since)
+        if property_ids is not None:
+            tail = tail.where(model.property_id.in_(property_ids))
+        parts.append(tail)
+    return union_all(*parts).subquery()
+
+
+# Кандидат в горизонт принимается не раньше чем через ID_HORIZON_LAG: транзакция могла
+# получить ID из последовательности, но еще не получить номер (xid)
+ID_HORIZON_LAG = timedelta(seconds=5)
+
+
+def _snapshot_xid(func_name: str):
+    """Граница текущего снимка транзакций (xid8) как bigint"""
+    return cast(cast(getattr(func, func_name)(func.pg_current_snapshot()), String), BigInteger)
+
+
+def promote_id_horizon(
+    horizon_id: int,
+    pending: Tuple[Optional[int], Optional[int], Optional[datetime]],
+    xmin: int,
+    now: datetime
+) -> Tuple[int, Tuple[Optional[int], Optional[int], Optional[datetime]]]:
+    """Переносит кандидата (pending_id, pending_xmax, pending_at) в горизонт, если он стал безопасным"""
+    pending_id, pending_xmax, pending_at = pending
+    if pending_id is not None and xmin >= pending_xmax and now - pending_at >= ID_HORIZON_LAG:
+        return max(horizon_id, pending_id), (None, None, None)
+    return horizon_id, pending
+
+
+async def advance_id_watermark(
+    session: AsyncSession,
+    source: str,
+    model,
+    batch_size: Optional[int] = None
+) -> Tuple[int, int]:
+    """
+    Блокирует ID-watermark источника до конца транзакции и возвращает
+    (last_id, upper_id) следующей пачки. Вызывающий обрабатывает строки
+    last_id < id <= upper_id, записывает last_id = upper_id и коммитит.
+
+    ID выдаются при вставке, а видимыми строки становятся при коммите, поэтому
+    строка с меньшим ID может появиться позже строки с большим. upper_id не
+    переходит безопасный горизонт: максимальный ID, видимый в прошлом запуске,
+    становится горизонтом, когда завершились все транзакции, начатые до того
+    момента (pg_snapshot_xmin текущего снимка не меньше запомненного xmax),
+    и прошло ID_HORIZON_LAG.
+    """
+    now = datetime.utcnow()
+    await session.execute(
+        pg_insert(RollupWatermark)
+        .values(source=source, last_id=0, horizon_id=0, updated_at=now)
+        .on_conflict_do_nothing(index_elements=[RollupWatermark.source])
+    )
+    watermark = (await session.execute(
+        select(
+            RollupWatermark.last_id, RollupWatermark.horizon_id, RollupWatermark.pending_id,
+            RollupWatermark.pending_xmax, RollupWatermark.pending_at
+        )
+        .where(RollupWatermark.source == source)
+        .with_for_update()
+    )).one()
+    xmin, xmax = (await session.execute(
+        select(_snapshot_xid("pg_snapshot_xmin"), _snapshot_xid("pg_snapshot_xmax"))
+    )).one()
+    
+    horizon_id, pending = promote_id_horizon(
+        watermark.horizon_id,
+        (watermark.pending_id, watermark.pending_xmax, watermark.pending_at),
+        xmin,
+        now
+    )
+    if pending[0] is None:
+        max_id = (await session.execute(select(func.max(model.id)))).scalar() or 0
+        if max_id > horizon_id:
+            pending = (max_id, xmax, now)
+    
+    await session.execute(
+        update(RollupWatermark)
+        .where(RollupWatermark.source == source)
+        .values(horizon_id=horizon_id, pending_id=pending[0], pending_xmax=pending[1], pending_at=pending[2])
+    )
+    upper_id = horizon_id if batch_size is None else min(horizon_id, watermark.last_id + batch_size)
+    return watermark.last_id, max(upper_id, watermark.last_id)
+
+
+class CRUDEventRollup:
+    """CRUD операции для часовых и суточных агрегатов событий объектов"""
     
     def __init__(self, session: AsyncSession):
         self.session = session
     
-    async def get_property_for_task(self, property_id: int) -> Optional[Property]:
-        """Получить объект для задачи"""
-        result = await self.session.execute(select(Property).where(Property.id == property_id))
-        return result.scalar_one_or_none()
+    async def compact(self, source: str, batch_size: int) -> int:
+        """
+        Свернуть следующую пачку строк источника (не более batch_size ID) в роллапы.
+        Watermark блокируется на время транзакции, поэтому параллельные запуски
+        не учитывают строки дважды, и не переходит безопасный горизонт
+        (advance_id_watermark). Возвращает количество обработанных ID
+        """
+        model, ts_column, event, group_columns = ROLLUP_SOURCES[source]
+        now = datetime.utcnow()
+        
+        last_id, upper_id = await advance_id_watermark(self.session, source, model, batch_size)
+        if upper_id <= last_id:
+            await self.session.execute(
+                update(RollupWatermark).where(RollupWatermark.source == source).values(updated_at=now)
+            )
+            await self.session.commit()
+            return 0
+        
+        for granularity in RollupGranularity:
+            bucket = _date_trunc(granularity, ts_column)
+            rows = (
+                select(
+                    model.property_id,
+                    event,
+                    cast(literal(granularity, ROLLUP_GRANULARITY_TYPE), ROLLUP_GRANULARITY_TYPE),
+                    bucket,
+                    func.count(model.id)
+                )
+                .where(and_(model.id > last_id, model.id <= upper_id))
+                .group_by(*group_columns, bucket)
+            )
+            upsert = pg_insert(PropertyEventRollup).from_select(
+                ["property_id", "event", "granularity", "bucket_start", "count"], rows
+            )
+            await self.session.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=["property_id", "event", "granularity", "bucket_start"],
+                    set_={"count": PropertyEventRollup.count + upsert.excluded.count}
+                )
+            )
+        
+        await self.session.execute(
+            update(RollupWatermark)
+            .where(RollupWatermark.source == source)
+            .values(last_id=upper_id, updated_at=now)
+        )
+        await self.session.commit()
+        return upper_id - last_id
     
-    async def get_properties_for_pricing(self) -> List[Property]:
-        """Получить объекты для динамического ценообразования"""
+    async def prune_hourly(self, before: datetime) -> int:
+        """Удалить часовые роллапы старше before (суточные хранятся бессрочно)"""
         result = await self.session.execute(
-            select(Property)
-            .where(Property.status == PropertyStatus.AVAILABLE)
-            .options(
-                joinedload(Property.price),
-                joinedload(Property.analytics)
+            delete(PropertyEventRollup).where(and_(
+                PropertyEventRollup.granularity == RollupGranularity.HOUR,
+                PropertyEventRollup.bucket_start < before
+            ))
+        )
+        await self.session.commit()
+        return result.rowcount
+    
+    async def get_watermarks(self) -> Dict[str, RollupWatermark]:
+        """Получить watermark всех источников"""
+        result = await self.session.execute(select(RollupWatermark))
+        return {watermark.source: watermark for watermark in result.scalars().all()}
+    
+    async def get_timeseries(
+        self,
+        property_id: int,
+        granularity: RollupGranularity,
+        since: datetime,
+        event: Optional[RollupEvent] = None
+    ):
+        """Получить количество событий объекта по интервалам начиная с since"""
+        events = rollup_event_source(granularity, floor_to_bucket(since, granularity), [property_id])
+        bucket = _date_trunc(granularity, events.c.ts).label("bucket_start")
+        query = (
+            select(bucket, events.c.event, func.sum(events.c.count).label("count"))
+            .group_by(bucket, events.c.event)
+            .order_by(bucket, events.c.event)
+        )
+        if event is not None:
+            query = query.where(events.c.event == event)
+        result = await self.session.execute(query)
+        return result.all()
+
+
+class CRUDDistrictStats(CRUDBase[DistrictStats]):
+    """CRUD операции для статистики по районам"""
+    
+    # Веса событий в активности района
+    FAVOURITE_WEIGHT = 3.0
+    BOOKING_WEIGHT = 20.0
+    
+    def _dirty_districts(self, since: datetime):
+        """Районы объектов с событиями, изменениями объекта или цены после since"""
+        changed = union(
+            select(ViewsLog.property_id).where(ViewsLog.occurred_at >= since),
+            select(Booking.property_id).where(Booking.booked_at >= since),
+            select(PriceHistory.property_id).where(PriceHistory.changed_at >= since),
+            select(Property.id).where(Property.updated_at >= since)
+        ).subquery()
+        return (
+            select(PropertyAddress.city, PropertyAddress.district)
+            .where(and_(
+                PropertyAddress.property_id.in_(select(changed.c[0])),
+                PropertyAddress.district.is_not(None)
+            ))
+            .distinct()
+        )
+    
+    async def refresh(
+        self,
+        db: AsyncSession,
+        window_days: int,
+        since: Optional[datetime] = None,
+        now: Optional[datetime] = None
+    ) -> int:
+        """
+        Пересчитать статистику районов одним INSERT ... SELECT ... ON CONFLICT.
+        С since пересчитываются только районы, где что-то изменилось после since;
+        выход старых событий из окна учитывается полным пересчетом (since=None),
+        который также удаляет районы без объектов. Популярность — cume_dist
+        активности на объект среди всех районов — пересчитывается всегда
+        """
+        now = now or datetime.utcnow()
+        window_start = floor_to_bucket(now - timedelta(days=window_days), RollupGranularity.DAY)
+        
+        events = rollup_event_source(RollupGranularity.DAY, since=window_start)
+        counts = (
+            select(
+                events.c.property_id,
+                func.sum(events.c.count).filter(events.c.event == RollupEvent.VIEW).label("views"),
+                func.sum(events.c.count).filter(events.c.event == RollupEvent.FAVOURITE).label("favourites"),
+                func.sum(events.c.count).filter(events.c.event == RollupEvent.BOOKING).label("bookings")
+            )
+            .group_by(events.c.property_id)
+            .subquery()
+        )
+        available = Property.status == PropertyStatus.AVAILABLE
+        price = PropertyPrice.current_price
+        price_per_m2 = func.coalesce(
+            PropertyPrice.price_per_m2,
+            price / func.nullif(ResidentialProperty.total_area, 0)
+        )
+        stats_query = (
+            select(
+                PropertyAddress.city,
+                PropertyAddress.district,
+                func.count(Property.id).filter(available),
+                func.avg(price).filter(available),
+                func.percentile_cont(0.5).within_group(price).filter(available),
+                func.avg(price_per_m2).filter(available),
+                func.percentile_cont(0.5).within_group(price_per_m2).filter(available),
+                func.coalesce(func.sum(counts.c.views), 0),
+                func.coalesce(func.sum(counts.c.favourites), 0),
+                func.coalesce(func.sum(counts.c.bookings), 0),
+                literal(0.0),
+                literal(now)
+            )
+            .select_from(Property)
+            .join(PropertyAddress, PropertyAddress.property_id == Property.id)
+            .outerjoin(PropertyPrice, PropertyPrice.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .outerjoin(counts, counts.c.property_id == Property.id)
+            .where(PropertyAddress.district.is_not(None))
+            .group_by(PropertyAddress.city, PropertyAddress.district)
+        )
+        if since is not None:
+            stats_query = stats_query.where(
+                tuple_(PropertyAddress.city, PropertyAddress.district).in_(self._dirty_districts(since))
             )
+        
+        columns = [
+            "city", "district", "property_count", "avg_price", "median_price",
+            "avg_price_per_m2", "median_price_per_m2", "views", "favourites", "bookings",
+            "popularity_score", "updated_at"
+        ]
+        upsert = pg_insert(DistrictStats).from_select(columns, stats_query)
+        excluded = upsert.excluded
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[DistrictStats.city, DistrictStats.district],
+            set_={
+                column: getattr(excluded, column)
+                for column in columns
+                if column not in ("city", "district", "popularity_score")
+            }
         )
+        result = await db.execute(upsert)
+        
+        if since is None:
+            await db.execute(delete(DistrictStats).where(DistrictStats.updated_at < now))
+        
+        activity = (
+            DistrictStats.views
+            + DistrictStats.favourites * self.FAVOURITE_WEIGHT
+            + DistrictStats.bookings * self.BOOKING_WEIGHT
+        ) / func.greatest(DistrictStats.property_count, 1)
+        ranked = (
+            select(
+                DistrictStats.city,
+                DistrictStats.district,
+                func.cume_dist().over(order_by=activity).label("popularity")
+            )
+            .subquery()
+        )
+        await db.execute(
+            update(DistrictStats)
+            .where(and_(
+                DistrictStats.city == ranked.c.city,
+                DistrictStats.district == ranked.c.district
+            ))
+            .values(popularity_score=ranked.c.popularity)
+        )
+        await db.commit()
+        return result.rowcount
+    
+    async def get_all(self, db: AsyncSession) -> List[DistrictStats]:
+        """Получить статистику всех районов"""
+        result = await db.execute(select(DistrictStats))
         return result.scalars().all()
     
-    async def get_properties_for_stats(self) -> List[Property]:
-        """Получить объекты для обновления статистики"""
-        result = await self.session.execute(
-            select(Property)
+    async def get_for_district(
+        self,
+        db: AsyncSession,
+        district: str,
+        city: Optional[str] = None
+    ) -> List[DistrictStats]:
+        """Получить статистику района (по всем городам, если city не задан)"""
+        query = select(DistrictStats).where(DistrictStats.district == district)
+        if city is not None:
+            query = query.where(DistrictStats.city == city)
+        result = await db.execute(query.order_by(DistrictStats.property_count.desc()))
+        return result.scalars().all()
+
+
+class CRUDDemandCluster(CRUDBase[DemandClusterRun]):
+    """CRUD операции для запусков кластеризации спроса"""
+    
+    @staticmethod
+    def _scope(query, project_id: Optional[int], property_type: Optional[PropertyType]):
+        """Точное совпадение набора фильтров запуска (None — без фильтра)"""
+        return query.where(
+            DemandClusterRun.project_id == project_id if project_id is not None
+            else DemandClusterRun.project_id.is_(None),
+            DemandClusterRun.property_type == property_type if property_type is not None
+            else DemandClusterRun.property_type.is_(None)
+        )
+    
+    async def stream_features(
+        self,
+        db: AsyncSession,
+        project_id: Optional[int] = None,
+        property_type: Optional[PropertyType] = None,
+        batch_size: int = 5000
+    ) -> AsyncIterator[List[Any]]:
+        """Признаки доступных объектов с ценой для кластеризации, пачками по batch_size строк"""
+        query = (
+            select(
+                Property.id,
+                PropertyPrice.current_price,
+                func.coalesce(
+                    PropertyPrice.price_per_m2,
+                    PropertyPrice.current_price / func.nullif(ResidentialProperty.total_area, 0)
+                ).label("price_per_m2"),
+                ResidentialProperty.rooms,
+                ResidentialProperty.total_area,
+                PropertyAnalytics.demand_score,
+                PropertyAnalytics.views_last_month
+            )
+            .join(PropertyPrice, PropertyPrice.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .outerjoin(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
             .where(Property.status == PropertyStatus.AVAILABLE)
-            .options(
-                joinedload(Property.analytics),
-                joinedload(Property.views_logs),
-                joinedload(Property.bookings)
+            .order_by(Property.id)
+        )
+        if project_id is not None:
+            query = query.where(Property.project_id == project_id)
+        if property_type is not None:
+            query = query.where(Property.property_type == property_type)
+        async for partition in stream_partitions(db, query, batch_size):
+            yield partition
+    
+    async def save_run(
+        self,
+        db: AsyncSession,
+        run: DemandClusterRun,
+        clusters: List[Dict[str, Any]],
+        members: List[Dict[str, Any]],
+        keep_runs: int
+    ) -> DemandClusterRun:
+        """Сохранить запуск с кластерами и участниками; старые запуски того же набора фильтров удаляются"""
+        db.add(run)
+        await db.flush()
+        if clusters:
+            await db.execute(insert(DemandCluster), [{**cluster, "run_id": run.id} for cluster in clusters])
+        if members:
+            await db.execute(insert(DemandClusterMember), [{**member, "run_id": run.id} for member in members])
+        
+        stale_ids = (
+            self._scope(select(DemandClusterRun.id), run.project_id, run.property_type)
+            .order_by(DemandClusterRun.created_at.desc(), DemandClusterRun.id.desc())
+            .offset(keep_runs)
+        )
+        stale_ids = (await db.execute(stale_ids)).scalars().all()
+        if stale_ids:
+            await db.execute(delete(DemandClusterMember).where(DemandClusterMember.run_id.in_(stale_ids)))
+            await db.execute(delete(DemandCluster).where(DemandCluster.run_id.in_(stale_ids)))
+            await db.execute(delete(DemandClusterRun).where(DemandClusterRun.id.in_(stale_ids)))
+        await db.commit()
+        await db.refresh(run)
+        return run
+    
+    async def get_latest_run(
+        self,
+        db: AsyncSession,
+        project_id: Optional[int] = None,
+        property_type: Optional[PropertyType] = None
+    ) -> Optional[DemandClusterRun]:
+        """Получить последний запуск для набора фильтров"""
+        query = (
+            self._scope(select(DemandClusterRun), project_id, property_type)
+            .order_by(DemandClusterRun.created_at.desc(), DemandClusterRun.id.desc())
+            .limit(1)
+        )
+        result = await db.execute(query)
+        return result.scalars().first()
+    
+    async def get_clusters(self, db: AsyncSession, run_id: int) -> List[DemandCluster]:
+        """Получить кластеры запуска"""
+        result = await db.execute(
+            select(DemandCluster).where(DemandCluster.run_id == run_id).order_by(DemandCluster.cluster_id)
+        )
+        return result.scalars().all()
+    
+    async def get_member_medians(
+        self,
+        db: AsyncSession,
+        run_id: int,
+        property_ids: Optional[List[int]] = None
+    ) -> Dict[int, float]:
+        """Медиана спроса кластера каждого объекта запуска"""
+        query = (
+            select(DemandClusterMember.property_id, DemandCluster.median_demand)
+            .join(DemandCluster, and_(
+                DemandCluster.run_id == DemandClusterMember.run_id,
+                DemandCluster.cluster_id == DemandClusterMember.cluster_id
+            ))
+            .where(DemandClusterMember.run_id == run_id)
+        )
+        if property_ids is not None:
+            query = query.where(DemandClusterMember.property_id.in_(property_ids))
+        result = await db.execute(query)
+        return {property_id: median for property_id, median in result.all()}
+
+
+class CRUDJobRun(CRUDBase[JobRun]):
+    """CRUD операции для журнала запусков массовых задач"""
+    
+    async def start(self, db: AsyncSession, run_id: str, job: str, total_chunks: int) -> None:
+        """Зарегистрировать запуск"""
+        db.add(JobRun(id=run_id, job=job, total_chunks=total_chunks))
+        await db.commit()
+    
+    async def finish(self, db: AsyncSession, run_id: str, status: str, **summary: Any) -> None:
+        """Записать итог запуска; длительность считается от started_at"""
+        now = datetime.utcnow()
+        await db.execute(
+            update(JobRun)
+            .where(JobRun.id == run_id)
+            .values(
+                status=status,
+                finished_at=now,
+                duration=func.extract("epoch", literal(now) - JobRun.started_at),
+                **summary
             )
         )
+        await db.commit()
+    
+    async def add_items(self, db: AsyncSession, run_id: str, items: List[Dict[str, Any]]) -> int:
+        """Записать результаты запуска одним многострочным INSERT"""
+        if not items:
+            return 0
+        await db.execute(insert(JobRunItem), [{"run_id": run_id, **item} for item in items])
+        await db.commit()
+        return len(items)
+    
+    async def get_runs(
+        self,
+        db: AsyncSession,
+        job: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 20
+    ) -> List[JobRun]:
+        """Последние запуски, новые первыми"""
+        query = select(JobRun)
+        if job:
+            query = query.where(JobRun.job == job)
+        result = await db.execute(query.order_by(JobRun.started_at.desc()).offset(skip).limit(limit))
+        return result.scalars().all()
+    
+    async def get_items(
+        self,
+        db: AsyncSession,
+        run_id: str,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[JobRunItem]:
+        """Результаты запуска"""
+        query = select(JobRunItem).where(JobRunItem.run_id == run_id)
+        if status:
+            query = query.where(JobRunItem.status == status)
+        result = await db.execute(query.order_by(JobRunItem.id).offset(skip).limit(limit))
+        return result.scalars().all()
+    
+    async def prune(self, db: AsyncSession, before: datetime) -> int:
+        """Удалить запуски, начатые раньше before, вместе с результатами"""
+        old_runs = select(JobRun.id).where(JobRun.started_at < before)
+        await db.execute(delete(JobRunItem).where(JobRunItem.run_id.in_(old_runs)))
+        result = await db.execute(delete(JobRun).where(JobRun.started_at < before))
+        await db.commit()
+        return result.rowcount
+
+
+class CRUDWorker:
+    """CRUD операции для воркера"""
+    
+    def __init__(self, session: AsyncSession):
+        self.session = session
+    
+    async def get_property_for_task(self, property_id: int) -> Optional[Property]:
+        """Получить объект для задачи"""
+        result = await self.session.execute(select(Property).where(Property.id == property_id))
+        return result.scalar_one_or_none()
+    
+    # Сканирование каталога: серверный курсор, только нужные колонки, пачки по batch_size строк.
+    # Память воркера не зависит ни от размера каталога, ни от размера таблиц событий
+    
+    async def stream_property_ids(
+        self,
+        batch_size: int,
+        available_only: bool = False
+    ) -> AsyncIterator[List[int]]:
+        """ID объектов по возрастанию, пачками по batch_size"""
+        query = select(Property.id)
+        if available_only:
+            query = query.where(Property.status == PropertyStatus.AVAILABLE)
+        async for partition in stream_partitions(self.session, query.order_by(Property.id), batch_size):
+            yield [row.id for row in partition]
+    
+    async def get_id_ranges(self, chunk_size: int, available_only: bool = False) -> List[Tuple[int, int]]:
+        """Разбить ID объектов на последовательные диапазоны по chunk_size объектов"""
+        return [
+            (property_ids[0], property_ids[-1])
+            async for property_ids in self.stream_property_ids(chunk_size, available_only)
+        ]
+    
+    async def get_property_ids_in_range(
+        self,
+        first_id: int,
+        last_id: int,
+        available_only: bool = False
+    ) -> List[int]:
+        """Получить ID объектов диапазона [first_id, last_id]"""
+        query = select(Property.id).where(Property.id.between(first_id, last_id))
+        if available_only:
+            query = query.where(Property.status == PropertyStatus.AVAILABLE)
+        result = await self.session.execute(query.order_by(Property.id))
         return result.scalars().all()
     
     async def update_property_price_timestamp(self, property_id: int) -> None:
@@ -707,6 +2100,11 @@ crud_booking = CRUDBooking(Booking)
 crud_dynamic_pricing_config = CRUDDynamicPricingConfig(DynamicPricingConfig)
 crud_promotion = CRUDPromotion(Promotion)
 crud_webhook = CRUDWebhook(WebhookInbox)
+crud_match_recommendation = CRUDMatchRecommendation(MatchRecommendation)
+crud_cluster_demand_stats = CRUDClusterDemandStats(ClusterDemandStats)
+crud_district_stats = CRUDDistrictStats(DistrictStats)
+crud_demand_cluster = CRUDDemandCluster(DemandClusterRun)
+crud_job_run = CRUDJobRun(JobRun)
 
 # Примечание: Следующие классы требуют активную сессию и должны создаваться в runtime:
 # - CRUDDynamicPricing
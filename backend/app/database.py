@@ -2,6 +2,7 @@ from sqlmodel import SQLModel
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.partitions import ensure_partitions
 
 # Create async engine for PostgreSQL
 async_engine = create_async_engine(
@@ -22,6 +23,7 @@ async def create_db_and_tables():
     """Create database tables"""
     async with async_engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await ensure_partitions(conn)
 
 
 async def get_async_session() -> AsyncSession:
@@ -5,13 +5,19 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from app.config import settings
-from app.database import create_db_and_tables
+from app.database import create_db_and_tables, AsyncSessionLocal
+from app.services.catalog import catalog_snapshot
+from app.services.pricing_config import pricing_config_cache
+from app.services.event_ingest import event_buffer
+from app.services.district_stats import district_stats
+from app.services.compute_pool import compute_pool
 from app.api import (
     auth, buildings, properties, users,
     addresses, analytics, bookings, developers,
     dynamic_pricing, map, media, prices, promotions,
-    webhooks, projects
+    webhooks, projects, ai_matching, events, jobs
 )
+import asyncio
 import secrets
 
 
@@ -43,6 +49,27 @@ async def lifespan(app: FastAPI):
     """Жизненный цикл приложения для инициализации и очистки"""
     # Startup
     await create_db_and_tables()
+    
+    catalog_refresher = None
+    if settings.catalog_snapshot_enabled:
+        try:
+            async with AsyncSessionLocal() as session:
+                await catalog_snapshot.load(session)
+            print(f"📦 Снимок каталога загружен: {len(catalog_snapshot)} объектов")
+        except Exception as e:
+            print(f"Ошибка при загрузке снимка каталога: {e}")
+        catalog_refresher = asyncio.create_task(catalog_snapshot.run_refresher(AsyncSessionLocal))
+    
+    try:
+        async with AsyncSessionLocal() as session:
+            await district_stats.load(session)
+    except Exception as e:
+        print(f"Ошибка при загрузке статистики районов: {e}")
+    district_stats_refresher = asyncio.create_task(district_stats.run_refresher(AsyncSessionLocal))
+    
+    pricing_config_cache.start_listener()
+    event_buffer.start(AsyncSessionLocal)
+    
     print("🚀 Real Estate 4.0 API запущен!")
     print(f"📚 Документация API: http://localhost:8000/docs")
     print(f"🔍 ReDoc: http://localhost:8000/redoc")
@@ -50,6 +77,12 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    if catalog_refresher:
+        catalog_refresher.cancel()
+    district_stats_refresher.cancel()
+    pricing_config_cache.stop_listener()
+    await event_buffer.stop()
+    compute_pool.shutdown()
     print("🛑 Real Estate 4.0 API остановлен!")
 
 
@@ -89,6 +122,9 @@ app.include_router(analytics.router, prefix="/api/v1")
 app.include_router(dynamic_pricing.router, prefix="/api/v1")
 app.include_router(map.router, prefix="/api/v1")
 app.include_router(webhooks.router, prefix="/api/v1")
+app.include_router(ai_matching.router, prefix="/api/v1")
+app.include_router(events.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -3,7 +3,7 @@ from typing import Optional, List
 from datetime import datetime, date
 from enum import Enum
 import json
-from sqlalchemy import JSON
+from sqlalchemy import JSON, BigInteger, Index
 
 
 class UserRole(str, Enum):
@@ -50,6 +50,17 @@ class ViewEvent(str, Enum):
     FAVOURITE = "favourite"
 
 
+class RollupEvent(str, Enum):
+    VIEW = "view"
+    FAVOURITE = "favourite"
+    BOOKING = "booking"
+
+
+class RollupGranularity(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
 class PriceChangeReason(str, Enum):
     DYNAMIC = "dynamic"
     MANUAL = "manual"
@@ -168,7 +179,7 @@ class Property(SQLModel, table=True):
     developer_id: Optional[int] = Field(default=None, foreign_key="developers.id")
     project_id: Optional[int] = Field(default=None, foreign_key="projects.id")
     building_id: Optional[int] = Field(default=None, foreign_key="buildings.id")
-    status: PropertyStatus = Field(default=PropertyStatus.AVAILABLE)
+    status: PropertyStatus = Field(default=PropertyStatus.AVAILABLE, index=True)
     has_3d_tour: bool = Field(default=False)
     qury: Optional[str] = Field(default=None, index=True)
     
@@ -212,7 +223,7 @@ class PropertyPrice(SQLModel, table=True):
     
     property_id: int = Field(primary_key=True, foreign_key="properties.id")
     base_price: float = Field(ge=0)
-    current_price: float = Field(ge=0)
+    current_price: float = Field(ge=0, index=True)
     currency: str = Field(default="RUB", max_length=3)
     price_per_m2: Optional[float] = Field(default=None, ge=0)
     original_price: Optional[float] = Field(default=None, ge=0)  # Price before any discounts
@@ -230,10 +241,10 @@ class ResidentialProperty(SQLModel, table=True):
     unit_number: Optional[str] = Field(default=None, max_length=20)
     floor: Optional[int] = Field(default=None, ge=1, le=100)
     floors_total: Optional[int] = Field(default=None, ge=1, le=100)
-    rooms: Optional[int] = Field(default=None, ge=0, le=10)
+    rooms: Optional[int] = Field(default=None, ge=0, le=10, index=True)
     is_studio: bool = Field(default=False)
     is_free_plan: bool = Field(default=False)
-    total_area: Optional[float] = Field(default=None, ge=0)
+    total_area: Optional[float] = Field(default=None, ge=0, index=True)
     living_area: Optional[float] = Field(default=None, ge=0)
     kitchen_area: Optional[float] = Field(default=None, ge=0)
     ceiling_height: Optional[float] = Field(default=None, ge=0)
@@ -273,6 +284,9 @@ class PropertyAnalytics(SQLModel, table=True):
     bookings_total: Optional[int] = Field(default=None, ge=0)
     views_last_week: Optional[int] = Field(default=None, ge=0)
     views_last_month: Optional[int] = Field(default=None, ge=0)
+    unique_visitors_day: Optional[int] = Field(default=None, ge=0)  # Оценка HyperLogLog по session_id
+    unique_visitors_week: Optional[int] = Field(default=None, ge=0)
+    unique_visitors_month: Optional[int] = Field(default=None, ge=0)
     price_trend: Optional[float] = Field(default=None)  # Percentage change
     
     # Relationships
@@ -378,12 +392,19 @@ class PriceHistory(SQLModel, table=True):
 
 class ViewsLog(SQLModel, table=True):
     __tablename__ = "views_log"
-    
-    id: Optional[int] = Field(default=None, primary_key=True)
+    # Помесячные партиции по occurred_at (см. app/partitions.py); ключ партиционирования входит в PK
+    __table_args__ = (
+        Index("ix_views_log_property_occurred", "property_id", "occurred_at"),
+        {"postgresql_partition_by": "RANGE (occurred_at)"},
+    )
+    
+    id: Optional[int] = Field(
+        default=None, primary_key=True, sa_type=BigInteger, sa_column_kwargs={"autoincrement": True}
+    )
     property_id: int = Field(foreign_key="properties.id")
     user_id: Optional[int] = Field(default=None, foreign_key="users.id")
     event: ViewEvent
-    occurred_at: datetime = Field(default_factory=datetime.utcnow)
+    occurred_at: datetime = Field(default_factory=datetime.utcnow, primary_key=True)
     source: Optional[str] = None  # web, mobile_app, etc.
     session_id: Optional[str] = None
     
@@ -448,4 +469,168 @@ class DynamicPricingConfig(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     min_price_change: float = Field(default=-5.0)  # Maximum price decrease in percent
     max_price_change: float = Field(default=5.0)  # Maximum price increase in percent
-    update_interval_hours: int = Field(default=24) 
\ No newline at end of file
+    update_interval_hours: int = Field(default=24) 
+
+
+class MatchRecommendation(SQLModel, table=True):
+    __tablename__ = "match_recommendations"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    run_id: str = Field(max_length=36, index=True)
+    profile_id: Optional[str] = Field(default=None, max_length=64, index=True)
+    profile_index: int
+    property_id: int = Field(foreign_key="properties.id")
+    rank: int
+    score: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ClusterDemandStats(SQLModel, table=True):
+    __tablename__ = "cluster_demand_stats"
+    __table_args__ = (
+        Index("ix_cluster_demand_stats_cluster", "project_id", "rooms"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: Optional[int] = Field(default=None, foreign_key="projects.id")
+    rooms: Optional[int] = Field(default=None)
+    median_demand: float = Field(default=0)
+    p25_demand: float = Field(default=0)
+    p75_demand: float = Field(default=0)
+    property_count: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DistrictStats(SQLModel, table=True):
+    """Статистика района: цены доступных объектов, активность за окно и популярность"""
+    __tablename__ = "district_stats"
+    
+    city: str = Field(primary_key=True, max_length=50)
+    district: str = Field(primary_key=True, max_length=50)
+    property_count: int = Field(default=0)
+    avg_price: Optional[float] = Field(default=None)
+    median_price: Optional[float] = Field(default=None)
+    avg_price_per_m2: Optional[float] = Field(default=None)
+    median_price_per_m2: Optional[float] = Field(default=None)
+    views: int = Field(default=0)
+    favourites: int = Field(default=0)
+    bookings: int = Field(default=0)
+    popularity_score: float = Field(default=0)  # 0..1, ранг активности на объект среди районов
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DemandClusterRun(SQLModel, table=True):
+    """Запуск кластеризации спроса (k-means по признакам доступных объектов)"""
+    __tablename__ = "demand_cluster_runs"
+    __table_args__ = (
+        Index("ix_demand_cluster_runs_scope", "project_id", "property_type", "created_at"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: Optional[int] = Field(default=None, foreign_key="projects.id")
+    property_type: Optional[PropertyType] = Field(default=None)
+    k: int
+    property_count: int = Field(default=0)
+    iterations: int = Field(default=0)
+    inertia: float = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DemandCluster(SQLModel, table=True):
+    """Кластер спроса запуска: центроид в исходных единицах и статистика участников"""
+    __tablename__ = "demand_clusters"
+    
+    run_id: int = Field(primary_key=True, foreign_key="demand_cluster_runs.id")
+    cluster_id: int = Field(primary_key=True)  # По возрастанию цены центроида
+    property_count: int = Field(default=0)
+    centroid_price: float = Field(default=0)
+    centroid_price_per_m2: float = Field(default=0)
+    centroid_rooms: float = Field(default=0)
+    centroid_area: float = Field(default=0)
+    centroid_demand: float = Field(default=0)
+    centroid_views: float = Field(default=0)
+    min_price: float = Field(default=0)
+    max_price: float = Field(default=0)
+    median_demand: float = Field(default=0)
+    p25_demand: float = Field(default=0)
+    p75_demand: float = Field(default=0)
+
+
+class DemandClusterMember(SQLModel, table=True):
+    """Принадлежность объекта кластеру запуска"""
+    __tablename__ = "demand_cluster_members"
+    __table_args__ = (
+        Index("ix_demand_cluster_members_property", "property_id"),
+    )
+    
+    run_id: int = Field(primary_key=True, foreign_key="demand_cluster_runs.id")
+    property_id: int = Field(primary_key=True, foreign_key="properties.id")
+    cluster_id: int
+
+
+class PropertyEventRollup(SQLModel, table=True):
+    """Количество событий объекта за час или сутки (агрегаты views_log и bookings)"""
+    __tablename__ = "property_event_rollups"
+    __table_args__ = (
+        Index("ix_property_event_rollups_bucket", "granularity", "bucket_start"),
+    )
+    
+    property_id: int = Field(primary_key=True, foreign_key="properties.id")
+    event: RollupEvent = Field(primary_key=True)
+    granularity: RollupGranularity = Field(primary_key=True)
+    bucket_start: datetime = Field(primary_key=True)
+    count: int = Field(default=0, ge=0)
+
+
+class RollupWatermark(SQLModel, table=True):
+    """Последний ID исходной таблицы, учтенный в property_event_rollups, и безопасный горизонт ID"""
+    __tablename__ = "rollup_watermarks"
+    
+    source: str = Field(primary_key=True, max_length=50)
+    last_id: int = Field(default=0, sa_type=BigInteger)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # ID, ниже которого все транзакции вставки завершены
+    horizon_id: int = Field(default=0, sa_type=BigInteger)
+    # Кандидат в горизонт: максимальный видимый ID и граница транзакций на момент pending_at
+    pending_id: Optional[int] = Field(default=None, sa_type=BigInteger)
+    pending_xmax: Optional[int] = Field(default=None, sa_type=BigInteger)
+    pending_at: Optional[datetime] = None
+
+
+class JobRun(SQLModel, table=True):
+    """Сводка запуска массовой задачи воркера: счетчики, время и пример ошибок"""
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        Index("ix_job_runs_job_started", "job", "started_at"),
+    )
+    
+    id: str = Field(primary_key=True, max_length=36)  # ID задачи из результата Celery
+    job: str = Field(max_length=50)
+    status: str = Field(default="running", max_length=20)
+    total_chunks: int = Field(default=0)
+    failed_chunks: int = Field(default=0)
+    processed: int = Field(default=0)
+    updated: int = Field(default=0)
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = Field(default=None)
+    duration: Optional[float] = Field(default=None)  # Секунды от постановки до завершения
+    max_chunk_duration: Optional[float] = Field(default=None)
+    error_sample: Optional[List[str]] = Field(default=None, sa_type=JSON)
+
+
+class JobRunItem(SQLModel, table=True):
+    """Результат запуска по объекту (изменение цены) или по пачке с ошибкой"""
+    __tablename__ = "job_run_items"
+    __table_args__ = (
+        Index("ix_job_run_items_run", "run_id", "id"),
+    )
+    
+    id: Optional[int] = Field(
+        default=None, primary_key=True, sa_type=BigInteger, sa_column_kwargs={"autoincrement": True}
+    )
+    run_id: str = Field(max_length=36, foreign_key="job_runs.id")
+    property_id: Optional[int] = Field(default=None, foreign_key="properties.id")
+    status: str = Field(max_length=20)
+    old_value: Optional[float] = Field(default=None)
+    new_value: Optional[float] = Field(default=None)
+    detail: Optional[str] = Field(default=None)
@@ -0,0 +1,179 @@
+"""
+Помесячные партиции views_log.
+
+views_log объявлена как PARTITION BY RANGE (occurred_at); партиции
+views_log_yYYYYmMM создаются заранее на settings.views_log_partitions_ahead
+месяцев вперед. Партиции старше settings.views_log_retention_months
+выгружаются в сжатый CSV (COPY через asyncpg) в settings.views_log_archive_dir,
+отсоединяются и удаляются. Каталог архива должен быть постоянным (том в
+docker-compose) и доступным на запись: иначе обслуживание завершается ошибкой
+до удаления партиций.
+
+Выгружаются только партиции, полностью свернутые в property_event_rollups:
+max(id) партиции не выше watermark свертки, а он продвигается только до
+безопасного горизонта ID (после него не может появиться незакоммиченных строк
+с меньшим ID). Партиция блокируется от вставок до проверки, поэтому поздние
+события с прошлой датой не теряются, и счетчики аналитики и ценообразования
+не меняются.
+"""
+from datetime import date, datetime
+from typing import List, Optional
+import gzip
+import os
+import tempfile
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import settings
+from app.models import ViewsLog
+
+
+PARENT_TABLE = ViewsLog.__tablename__
+PARTITION_PREFIX = f"{PARENT_TABLE}_y"
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Месяц партиции по имени views_log_yYYYYmMM"""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        year, month = name[len(PARTITION_PREFIX):].split("m")
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    """Объявлена ли views_log партиционированной (старые БД создавались без партиций)"""
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :name"
+        ),
+        {"name": PARENT_TABLE}
+    )
+    return result.first() is not None
+
+
+async def list_partitions(conn: AsyncConnection) -> List[str]:
+    """Имена партиций views_log"""
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :name ORDER BY child.relname"
+        ),
+        {"name": PARENT_TABLE}
+    )
+    return list(result.scalars().all())
+
+
+async def ensure_partitions(
+    conn: AsyncConnection,
+    months_back: Optional[int] = None,
+    months_ahead: Optional[int] = None,
+    today: Optional[date] = None
+) -> List[str]:
+    """Создает недостающие партиции от months_back назад до months_ahead вперед"""
+    if not await is_partitioned(conn):
+        print(f"⚠️ Таблица {PARENT_TABLE} не партиционирована, создание партиций пропущено")
+        return []
+    months_back = settings.views_log_retention_months if months_back is None else months_back
+    months_ahead = settings.views_log_partitions_ahead if months_ahead is None else months_ahead
+    current = month_start(today or datetime.utcnow().date())
+
+    existing = set(await list_partitions(conn))
+    created = []
+    for offset in range(-months_back, months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        await conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{PARENT_TABLE}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def ensure_archive_dir(archive_dir: str) -> None:
+    """Проверяет, что каталог архива существует (создается) и доступен на запись"""
+    try:
+        os.makedirs(archive_dir, exist_ok=True)
+        with tempfile.TemporaryFile(dir=archive_dir):
+            pass
+    except OSError as e:
+        raise RuntimeError(
+            f"Каталог архива {PARENT_TABLE} {archive_dir} недоступен на запись "
+            f"(views_log_archive_dir должен указывать на постоянный том): {e}"
+        ) from e
+
+
+async def archive_partition(conn: AsyncConnection, name: str, archive_dir: str) -> str:
+    """
+    Выгружает партицию в gzip CSV, отсоединяет и удаляет ее; возвращает путь к файлу.
+    Файл пишется во временный и переименовывается после полной выгрузки
+    """
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial_path = f"{path}.partial"
+    raw_connection = await conn.get_raw_connection()
+    with gzip.open(partial_path, "wb") as archive:
+        async def _write(chunk: bytes) -> None:
+            archive.write(chunk)
+
+        await raw_connection.driver_connection.copy_from_table(
+            name, output=_write, format="csv", header=True
+        )
+    os.replace(partial_path, path)
+    await conn.execute(text(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION "{name}"'))
+    await conn.execute(text(f'DROP TABLE "{name}"'))
+    return path
+
+
+async def archive_expired_partitions(
+    conn: AsyncConnection,
+    compacted_id: int,
+    today: Optional[date] = None
+) -> List[str]:
+    """
+    Архивирует партиции старше срока хранения, все строки которых уже свернуты
+    в роллапы (max(id) не больше compacted_id — watermark свертки, не выше
+    безопасного горизонта ID). Недоступный на запись каталог архива — ошибка
+    """
+    if not await is_partitioned(conn):
+        return []
+    archive_dir = settings.views_log_archive_dir
+    ensure_archive_dir(archive_dir)
+    current = month_start(today or datetime.utcnow().date())
+    cutoff = add_months(current, -settings.views_log_retention_months)
+
+    archived = []
+    for name in await list_partitions(conn):
+        month = partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+        # Блокировка ждет транзакции, вставляющие в партицию, и не дает начать новые:
+        # max(id) ниже учитывает все строки, которые попадут в архив
+        await conn.execute(text(f'LOCK TABLE "{name}" IN SHARE ROW EXCLUSIVE MODE'))
+        max_id = (await conn.execute(text(f'SELECT max(id) FROM "{name}"'))).scalar()
+        if max_id is not None and max_id > compacted_id:
+            print(f"Партиция {name} еще не свернута в роллапы, архивация отложена")
+            continue
+        archived.append(await archive_partition(conn, name, archive_dir))
+    return archived
@@ -0,0 +1,35 @@
+import asyncio
+import weakref
+import redis.asyncio as aioredis
+from app.config import settings
+
+# Клиенты привязаны к циклу событий: API и воркер Celery используют разные циклы
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+_broker_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> aioredis.Redis:
+    """Получить асинхронный клиент Redis для текущего цикла событий"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = aioredis.from_url(settings.redis_url)
+    return client
+
+
+def get_broker_redis() -> aioredis.Redis:
+    """Получить асинхронный клиент Redis брокера Celery для текущего цикла событий"""
+    loop = asyncio.get_running_loop()
+    client = _broker_clients.get(loop)
+    if client is None:
+        client = _broker_clients[loop] = aioredis.from_url(settings.celery_broker_url)
+    return client
+
+
+async def close_redis() -> None:
+    """Закрыть клиенты Redis текущего цикла событий"""
+    loop = asyncio.get_running_loop()
+    for clients in (_clients, _broker_clients):
+        client = clients.pop(loop, None)
+        if client is not None:
+            await client.close()
@@ -3,7 +3,8 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, date
 from app.models import (
     UserRole, PropertyType, PropertyCategory, PropertyStatus, BookingStatus, 
-    ViewEvent, PriceChangeReason, ViewType, FinishingType, ParkingType
+    ViewEvent, PriceChangeReason, ViewType, FinishingType, ParkingType,
+    RollupEvent
 )
 
 
@@ -320,6 +321,9 @@ class PropertyAnalyticsBase(BaseModel):
     bookings_total: Optional[int] = Field(None, ge=0)
     views_last_week: Optional[int] = Field(None, ge=0)
     views_last_month: Optional[int] = Field(None, ge=0)
+    unique_visitors_day: Optional[int] = Field(None, ge=0)
+    unique_visitors_week: Optional[int] = Field(None, ge=0)
+    unique_visitors_month: Optional[int] = Field(None, ge=0)
     price_trend: Optional[float] = None
 
 
@@ -526,6 +530,29 @@ class ViewsLogCreate(ViewsLogBase):
     property_id: int
 
 
+class ViewEventIngest(BaseModel):
+    property_id: int
+    event: ViewEvent
+    occurred_at: Optional[datetime] = None  # Время на клиенте; по умолчанию время приема
+    source: Optional[str] = Field(None, max_length=32)  # web, mobile_app, etc.
+    session_id: Optional[str] = Field(None, max_length=64)
+
+
+class ViewEventBatch(BaseModel):
+    events: List[ViewEventIngest] = Field(..., min_length=1, max_length=1000)
+
+
+class UniqueVisitorsRead(BaseModel):
+    property_id: int
+    days: int
+    unique_visitors: int
+
+
+class ViewEventAccepted(BaseModel):
+    accepted: int
+    duplicates: int = 0  # Повторы, отсеянные без записи
+
+
 class ViewsLogRead(ViewsLogBase):
     id: int
     property_id: int
@@ -593,12 +620,55 @@ class PropertyMatchRequest(BaseModel):
     max_floor: Optional[int] = None
 
 
+class PropertyMatchBatchItem(PropertyMatchRequest):
+    profile_id: Optional[str] = None  # Идентификатор покупателя во внешней CRM
+
+
+class PropertyMatchBatchRequest(BaseModel):
+    profiles: List[PropertyMatchBatchItem] = Field(..., min_length=1)
+    limit: int = Field(10, ge=1, le=100)
+
+
+class PropertyMatchBatchJob(BaseModel):
+    run_id: str
+    task_id: str
+    profiles: int
+
+
+class MatchRecommendationRead(BaseModel):
+    run_id: str
+    profile_id: Optional[str] = None
+    profile_index: int
+    property_id: int
+    rank: int
+    score: float
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 # Market Analytics schemas
+class PropertyEventBucketRead(BaseModel):
+    bucket_start: datetime
+    event: RollupEvent
+    count: int
+
+    class Config:
+        from_attributes = True
+
+
 class MarketAnalyticsResponse(BaseModel):
     total_views: int
     avg_views: float
     avg_bookings: float
     period_days: int = 30
+    total_properties: int = 0
+    new_properties: int = 0
+    total_bookings: int = 0
+    avg_days_on_market: float = 0
+    property_type: Optional[PropertyType] = None
+    city: Optional[str] = None
 
 
 # Promotion schemas
@@ -657,6 +727,160 @@ class DynamicPricingConfigRead(DynamicPricingConfigBase):
         from_attributes = True
 
 
+class ClusterDemandStatsRead(BaseModel):
+    project_id: Optional[int] = None
+    rooms: Optional[int] = None
+    median_demand: float
+    p25_demand: float
+    p75_demand: float
+    property_count: int
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class DistrictStatsRead(BaseModel):
+    city: str
+    district: str
+    property_count: int
+    avg_price: Optional[float] = None
+    median_price: Optional[float] = None
+    avg_price_per_m2: Optional[float] = None
+    median_price_per_m2: Optional[float] = None
+    views: int
+    favourites: int
+    bookings: int
+    popularity_score: float
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class DemandClusterRead(BaseModel):
+    cluster_id: int
+    property_count: int
+    centroid_price: float
+    centroid_price_per_m2: float
+    centroid_rooms: float
+    centroid_area: float
+    centroid_demand: float
+    centroid_views: float
+    min_price: float
+    max_price: float
+    median_demand: float
+    p25_demand: float
+    p75_demand: float
+
+    class Config:
+        from_attributes = True
+
+
+class DemandClustersResponse(BaseModel):
+    run_id: int
+    project_id: Optional[int] = None
+    property_type: Optional[PropertyType] = None
+    k: int
+    property_count: int
+    iterations: int
+    inertia: float
+    created_at: datetime
+    clusters: List[DemandClusterRead]
+
+
+class DemandClusterJob(BaseModel):
+    task_id: str
+    project_id: Optional[int] = None
+    property_type: Optional[PropertyType] = None
+    k: Optional[int] = None
+
+
+class FanoutJobProgress(BaseModel):
+    job_id: str
+    job: Optional[str] = None
+    status: str
+    total_chunks: int = 0
+    done_chunks: int = 0
+    failed_chunks: int = 0
+    retried_chunks: int = 0
+    processed: int = 0
+    updated: int = 0
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+
+class JobRunRead(BaseModel):
+    id: str
+    job: str
+    status: str
+    total_chunks: int
+    failed_chunks: int
+    processed: int
+    updated: int
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration: Optional[float] = None
+    max_chunk_duration: Optional[float] = None
+    error_sample: Optional[List[str]] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobRunItemRead(BaseModel):
+    id: int
+    run_id: str
+    property_id: Optional[int] = None
+    status: str
+    old_value: Optional[float] = None
+    new_value: Optional[float] = None
+    detail: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LatencyPercentiles(BaseModel):
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    max: Optional[float] = None
+
+
+class QueueStats(BaseModel):
+    queue: str
+    depth: int
+    samples: int
+    wait: LatencyPercentiles
+    runtime: LatencyPercentiles
+
+
+class ScheduledJobState(BaseModel):
+    job: str
+    overlap: str
+    lock: str
+    base_interval: float
+    interval: float
+    status: Optional[str] = None
+    ewma_duration: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_started_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    runs: int = 0
+    failures: int = 0
+    throttled: int = 0
+    skipped: int = 0
+    coalesced: int = 0
+
+
+class ScheduledJobRun(BaseModel):
+    started_at: datetime
+    duration: float
+    status: str
+    interval: float
+
+
 class DynamicPricingResult(BaseModel):
     property_id: int
     old_price: float
@@ -668,6 +892,58 @@ class DynamicPricingResult(BaseModel):
     description: str
 
 
+class PricingBacktestConfig(BaseModel):
+    k1: float = Field(0.5, ge=0)
+    k2: float = Field(2.0, ge=0)
+    k3: float = Field(5.0, ge=0)
+    min_price_change: float = Field(-5.0, le=0)
+    max_price_change: float = Field(5.0, ge=0)
+    update_interval_hours: int = Field(24, ge=1)
+
+
+class PricingBacktestRequest(BaseModel):
+    config: Optional[PricingBacktestConfig] = None  # Кандидат; иначе config_id или активная конфигурация
+    config_id: Optional[int] = None
+    start: Optional[datetime] = None  # По умолчанию год назад
+    end: Optional[datetime] = None  # По умолчанию сейчас
+    bucket_hours: int = Field(24, ge=1, le=168)
+    project_ids: Optional[List[int]] = None
+    include_paths: bool = True
+
+
+class PricingBacktestCluster(BaseModel):
+    project_id: Optional[int] = None
+    rooms: Optional[int] = None
+    property_count: int
+    bookings: int
+    actual_revenue: float
+    simulated_revenue: float
+    revenue_delta: float
+    revenue_delta_percent: float
+    actual_price_changes: int
+    simulated_price_changes: int
+    actual_price_path: Optional[List[float]] = None  # Средняя цена кластера по интервалам
+    simulated_price_path: Optional[List[float]] = None
+
+
+class PricingBacktestResult(BaseModel):
+    model: str  # Модель симуляции: спрос и медианы считаются иначе, чем в боевом движке
+    config: PricingBacktestConfig
+    start: datetime
+    end: datetime
+    bucket_hours: int
+    buckets: int
+    property_count: int
+    actual_revenue: float
+    simulated_revenue: float
+    revenue_delta: float
+    revenue_delta_percent: float
+    actual_price_changes: int
+    simulated_price_changes: int
+    elapsed_seconds: float
+    clusters: List[PricingBacktestCluster]
+
+
 # Token schemas
 class Token(BaseModel):
     access_token: str
@@ -1,8 +1,14 @@
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import Property, PropertyType, PropertyCategory
-from typing import List, Optional, Dict, Tuple
-from app.crud import crud_property, crud_property_analytics
-from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime
+from app.crud import crud_property
+from app.config import settings
+from app.services.match_scoring import MatchColumns, rank_candidates, rank_candidates_async
+from app.services.catalog import CatalogSnapshot, catalog_snapshot
+from app.services.district_stats import district_stats
+from app.schemas import PropertyMatchRequest
 
 
 class PropertyMatchingService:
@@ -29,138 +35,133 @@ class PropertyMatchingService:
         ИИ-подбор объектов недвижимости по предпочтениям пользователя.
         Использует взвешенный скоринг для ранжирования результатов.
         """
-        # Получаем базовый список объектов
-        properties = await crud_property.get_available(self.session)
+        # При готовом снимке каталога фильтрация и скоринг выполняются без обращения к БД
+        if catalog_snapshot.is_ready:
+            rows = catalog_snapshot.filter(
+                budget=budget,
+                budget_overshoot=settings.ai_matching_budget_overshoot,
+                preferred_cities=preferred_cities,
+                preferred_districts=preferred_districts,
+                min_rooms=min_rooms,
+                max_rooms=max_rooms,
+                min_area=min_area,
+                max_area=max_area,
+                property_type=property_type,
+                category=category,
+                has_balcony=has_balcony,
+                has_parking=has_parking,
+                max_floor=max_floor
+            )
+            columns = catalog_snapshot.match_columns(rows, preferred_districts)
+            ranked = await rank_candidates_async(columns, budget=budget, limit=limit)
+            return await crud_property.get_many_with_relations(
+                self.session, [property_id for property_id, _ in ranked]
+            )
         
-        # Фильтруем объекты по базовым критериям
-        filtered_properties = []
-        for prop in properties:
-            # Проверяем цену
-            if prop.price and prop.price.current_price > budget * 1.2:  # Допускаем превышение бюджета не более чем на 20%
-                continue
-            
-            # Проверяем город
-            if preferred_cities and prop.address and prop.address.city not in preferred_cities:
-                continue
-                
-            # Проверяем район
-            if preferred_districts and prop.address and prop.address.district not in preferred_districts:
-                continue
-                
-            # Проверяем тип недвижимости
-            if property_type and prop.property_type != property_type:
-                continue
-                
-            # Проверяем категорию
-            if category and prop.category != category:
-                continue
-                
-            # Проверяем количество комнат (только для жилой недвижимости)
-            if min_rooms and prop.residential and prop.residential.rooms and prop.residential.rooms < min_rooms:
-                continue
-                
-            if max_rooms and prop.residential and prop.residential.rooms and prop.residential.rooms > max_rooms:
-                continue
-                
-            # Проверяем площадь (только для жилой недвижимости)
-            if min_area and prop.residential and prop.residential.total_area and prop.residential.total_area < min_area:
-                continue
-                
-            if max_area and prop.residential and prop.residential.total_area and prop.residential.total_area > max_area:
-                continue
-                
-            # Проверяем особенности
-            if has_balcony is not None and prop.features and prop.features.balcony != has_balcony:
-                continue
-                
-            if has_parking is not None and prop.features and prop.features.parking_type and not has_parking:
-                continue
-                
-            # Проверяем этаж (только для жилой недвижимости)
-            if max_floor and prop.residential and prop.residential.floor and prop.residential.floor > max_floor:
-                continue
-            
-            filtered_properties.append(prop)
+        # Фильтрация выполняется в БД, в скоринг попадает ограниченный набор кандидатов
+        filtered_properties = await crud_property.get_match_candidates(
+            self.session,
+            budget=budget,
+            preferred_cities=preferred_cities,
+            preferred_districts=preferred_districts,
+            min_rooms=min_rooms,
+            max_rooms=max_rooms,
+            min_area=min_area,
+            max_area=max_area,
+            property_type=property_type,
+            category=category,
+            has_balcony=has_balcony,
+            has_parking=has_parking,
+            max_floor=max_floor,
+            budget_overshoot=settings.ai_matching_budget_overshoot,
+            limit=settings.ai_matching_candidate_limit
+        )
         
         if not filtered_properties:
             return []
 
-        # Рассчитываем скоринг для каждого объекта
-        scored_properties = []
-        for property_obj in filtered_properties:
-            score = await self._calculate_property_score(
-                property_obj,
-                budget=budget,
-                preferred_districts=preferred_districts
-            )
-            scored_properties.append((property_obj, score))
+        # Скоринг выполняется одним проходом по колонкам кандидатов
+        columns = MatchColumns.from_properties(
+            filtered_properties, preferred_districts, district_popularity=district_stats.popularity
+        )
+        ranked = await rank_candidates_async(columns, budget=budget, limit=limit)
         
-        # Сортируем по скорингу и возвращаем топ limit объектов
-        scored_properties.sort(key=lambda x: x[1], reverse=True)
-        return [property_obj for property_obj, _ in scored_properties[:limit]]
+        # Загружаем полные данные только для топ limit объектов
+        top_ids = [property_id for property_id, _ in ranked]
+        return await crud_property.get_many_with_relations(self.session, top_ids)
 
-    async def _calculate_property_score(
-        self,
-        property_obj: Property,
-        budget: float,
-        preferred_districts: Optional[List[str]]
-    ) -> float:
-        """
-        Рассчитывает скоринг для объекта недвижимости на основе различных факторов.
-        
-        Факторы:
-        1. Соответствие бюджету (вес: 0.3)
-        2. Популярность района (вес: 0.2)
-        3. Спрос на объект (вес: 0.2)
-        4. Активность просмотров (вес: 0.15)
-        5. Новизна объявления (вес: 0.15)
-        """
-        weights = {
-            'budget_match': 0.3,
-            'district_popularity': 0.2,
-            'demand': 0.2,
-            'views': 0.15,
-            'freshness': 0.15
-        }
-        
-        scores = {}
-        
-        # 1. Соответствие бюджету
-        if property_obj.price:
-            price_diff_percent = abs(property_obj.price.current_price - budget) / budget
-            scores['budget_match'] = max(0, 1 - price_diff_percent)
-        else:
-            scores['budget_match'] = 0.5
-        
-        # 2. Популярность района
-        if property_obj.address and property_obj.address.district:
-            # Базовая популярность района (можно расширить логикой)
-            scores['district_popularity'] = 0.7  # Заглушка
-        else:
-            scores['district_popularity'] = 0.5
-        
-        # 3. Спрос на объект
-        if property_obj.analytics and property_obj.analytics.demand_score:
-            scores['demand'] = min(1.0, property_obj.analytics.demand_score / 10.0)
-        else:
-            scores['demand'] = 0.5
-        
-        # 4. Активность просмотров
-        if property_obj.analytics and property_obj.analytics.clicks_total:
-            # Нормализуем количество просмотров
-            scores['views'] = min(1.0, property_obj.analytics.clicks_total / 1000.0)
-        else:
-            scores['views'] = 0.5
-        
-        # 5. Новизна объявления
-        days_active = (datetime.utcnow() - property_obj.created_at).days
-        scores['freshness'] = max(0, 1 - (days_active / 30))  # Линейное убывание в течение 30 дней
-        
-        # Рассчитываем финальный скор
-        final_score = sum(score * weights[factor] for factor, score in scores.items())
-        
-        # Применяем бонус если район в предпочитаемых
-        if preferred_districts and property_obj.address and property_obj.address.district in preferred_districts:
-            final_score *= 1.2
-        
-        return final_score 
\ No newline at end of file
+    async def sync_catalog(self, cache_version: int) -> None:
+        """Догоняет снимок каталога до версии кэша подбора перед расчетом результата"""
+        await catalog_snapshot.sync(self.session, cache_version)
+
+    async def get_batch_snapshot(self) -> CatalogSnapshot:
+        """Снимок каталога для пакетного подбора: общий, если загружен, иначе разовый"""
+        await district_stats.ensure_fresh(self.session)
+        if catalog_snapshot.is_ready:
+            return catalog_snapshot
+        snapshot = CatalogSnapshot()
+        await snapshot.load(self.session)
+        return snapshot
+
+
+def _profile_columns(snapshot: CatalogSnapshot, profile: PropertyMatchRequest) -> MatchColumns:
+    """Колонки кандидатов профиля после фильтрации по снимку"""
+    rows = snapshot.filter(
+        budget=profile.budget,
+        budget_overshoot=settings.ai_matching_budget_overshoot,
+        preferred_cities=profile.preferred_cities,
+        preferred_districts=profile.preferred_districts,
+        min_rooms=profile.min_rooms,
+        max_rooms=profile.max_rooms,
+        min_area=profile.min_area,
+        max_area=profile.max_area,
+        property_type=profile.property_type,
+        category=profile.category,
+        has_balcony=profile.has_balcony,
+        has_parking=profile.has_parking,
+        max_floor=profile.max_floor
+    )
+    return snapshot.match_columns(rows, profile.preferred_districts)
+
+
+def _batch_item(index: int, profile: PropertyMatchRequest, ranked: List[Tuple[int, float]]) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "profile_id": getattr(profile, "profile_id", None),
+        "results": [
+            {"property_id": property_id, "score": round(score, 6)}
+            for property_id, score in ranked
+        ]
+    }
+
+
+def iter_batch_matches(
+    snapshot: CatalogSnapshot,
+    profiles: Sequence[PropertyMatchRequest],
+    limit: int
+) -> Iterator[Dict[str, Any]]:
+    """
+    Пакетный подбор по одному снимку каталога.
+    Фильтрация и скоринг каждого профиля векторизованы по всем кандидатам.
+    """
+    now = datetime.utcnow()
+    for index, profile in enumerate(profiles):
+        columns = _profile_columns(snapshot, profile)
+        yield _batch_item(index, profile, rank_candidates(columns, budget=profile.budget, limit=limit, now=now))
+
+
+async def aiter_batch_matches(
+    snapshot: CatalogSnapshot,
+    profiles: Sequence[PropertyMatchRequest],
+    limit: int
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Как iter_batch_matches, но для цикла событий: скоринг больших выборок выполняется
+    в пуле процессов, и между профилями управление возвращается циклу
+    """
+    now = datetime.utcnow()
+    for index, profile in enumerate(profiles):
+        columns = _profile_columns(snapshot, profile)
+        ranked = await rank_candidates_async(columns, budget=profile.budget, limit=limit, now=now)
+        yield _batch_item(index, profile, ranked)
+        await asyncio.sleep(0)
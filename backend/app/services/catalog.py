@@ -0,0 +1,437 @@
+"""
+Процессный снимок каталога доступных объектов недвижимости.
+
+Данные хранятся в колонках на базе array, строки (город, район) кодируются
+словарём. Снимок загружается один раз при старте и далее обновляется
+инкрементально по Property.updated_at; периодически выполняется полная
+перезагрузка, чтобы подтянуть изменения сателлитных таблиц (цены, аналитика).
+Удалённые объекты не видны по updated_at, поэтому удаление оставляет отметку
+в Redis, которую снимки всех процессов применяют при обновлении.
+"""
+from array import array
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+import asyncio
+import math
+import time
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.redis_client import get_redis
+from app.models import (
+    Property, PropertyPrice, PropertyAddress, ResidentialProperty, PropertyFeatures,
+    PropertyAnalytics, PropertyStatus, PropertyType, PropertyCategory, ParkingType
+)
+from app.schemas import PropertyRead
+from app.services.match_scoring import MatchColumns, KNOWN_DISTRICT_POPULARITY, DEFAULT_FACTOR_SCORE
+from app.services.district_stats import district_stats
+
+
+PROPERTY_TYPES = list(PropertyType)
+CATEGORIES = list(PropertyCategory)
+MISSING_CODE = -1
+EPOCH = datetime(1970, 1, 1)
+TOMBSTONES_KEY = "catalog:tombstones"  # sorted set: ID удалённого объекта -> время удаления
+TOMBSTONE_OVERLAP = 60.0  # Запас окна чтения отметок на расхождение часов процессов
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    return (value - EPOCH).total_seconds() if value else math.nan
+
+
+def _nullable(value) -> float:
+    return float(value) if value is not None else math.nan
+
+
+class CatalogColumns:
+    """Колоночное хранилище строк каталога"""
+    __slots__ = (
+        "row_by_id", "alive", "property_id", "external_id", "property_type", "category",
+        "developer_id", "project_id", "building_id", "has_3d_tour", "created_at", "updated_at",
+        "price", "has_address", "city", "district", "rooms", "total_area", "floor",
+        "has_features", "balcony", "parking", "demand_score", "clicks_total",
+        "cities", "city_codes", "districts", "district_codes"
+    )
+
+    def __init__(self):
+        self.row_by_id: Dict[int, int] = {}
+        self.alive = bytearray()
+        self.property_id = array("q")
+        self.external_id: List[Optional[str]] = []
+        self.property_type = array("b")
+        self.category = array("b")
+        self.developer_id = array("q")
+        self.project_id = array("q")
+        self.building_id = array("q")
+        self.has_3d_tour = bytearray()
+        self.created_at = array("d")
+        self.updated_at = array("d")
+        self.price = array("d")
+        self.has_address = bytearray()
+        self.city = array("q")
+        self.district = array("q")
+        self.rooms = array("d")
+        self.total_area = array("d")
+        self.floor = array("d")
+        self.has_features = bytearray()
+        self.balcony = bytearray()
+        self.parking = bytearray()
+        self.demand_score = array("d")
+        self.clicks_total = array("d")
+        self.cities: List[str] = []
+        self.city_codes: Dict[str, int] = {}
+        self.districts: List[str] = []
+        self.district_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.property_id)
+
+    @staticmethod
+    def _encode(value: Optional[str], codes: Dict[str, int], values: List[str]) -> int:
+        if value is None:
+            return MISSING_CODE
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def upsert(self, row) -> None:
+        """Добавляет или перезаписывает строку каталога"""
+        values = (
+            1,
+            row.id,
+            row.external_id,
+            PROPERTY_TYPES.index(row.property_type),
+            CATEGORIES.index(row.category),
+            row.developer_id or 0,
+            row.project_id or 0,
+            row.building_id or 0,
+            1 if row.has_3d_tour else 0,
+            _timestamp(row.created_at),
+            _timestamp(row.updated_at),
+            _nullable(row.current_price),
+            1 if row.address_id is not None else 0,
+            self._encode(row.city, self.city_codes, self.cities),
+            self._encode(row.district, self.district_codes, self.districts),
+            _nullable(row.rooms),
+            _nullable(row.total_area),
+            _nullable(row.floor),
+            1 if row.features_id is not None else 0,
+            1 if row.balcony else 0,
+            1 if row.parking_type is not None and row.parking_type != ParkingType.NONE else 0,
+            float(row.demand_score or 0),
+            float(row.clicks_total or 0),
+        )
+        columns = (
+            self.alive, self.property_id, self.external_id, self.property_type, self.category,
+            self.developer_id, self.project_id, self.building_id, self.has_3d_tour,
+            self.created_at, self.updated_at, self.price, self.has_address, self.city,
+            self.district, self.rooms, self.total_area, self.floor, self.has_features,
+            self.balcony, self.parking, self.demand_score, self.clicks_total
+        )
+        index = self.row_by_id.get(row.id)
+        if index is None:
+            self.row_by_id[row.id] = len(self.property_id)
+            for column, value in zip(columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(columns, values):
+                column[index] = value
+
+    def remove(self, property_id: int) -> None:
+        """Помечает строку удалённой (место освобождается при полной перезагрузке)"""
+        index = self.row_by_id.pop(property_id, None)
+        if index is not None:
+            self.alive[index] = 0
+
+    def view(self, name: str, dtype) -> "np.ndarray":
+        """Массив NumPy поверх колонки без копирования"""
+        return np.frombuffer(getattr(self, name), dtype=dtype)
+
+
+class CatalogSnapshot:
+    """Снимок каталога доступных объектов для фильтрации и ранжирования без обращения к БД"""
+
+    def __init__(self):
+        self._columns = CatalogColumns()
+        self._lock = asyncio.Lock()
+        self.watermark: Optional[datetime] = None
+        self.loaded_at: Optional[datetime] = None
+        self.synced_version = 0  # Версия кэша подбора, до которой снимок догнал изменения
+        self.tombstones_checked_at = 0.0  # До какого времени применены отметки об удалении
+
+    @property
+    def is_ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._columns.row_by_id)
+
+    @staticmethod
+    def _rows_query():
+        return (
+            select(
+                Property.id, Property.external_id, Property.property_type, Property.category,
+                Property.developer_id, Property.project_id, Property.building_id, Property.status,
+                Property.has_3d_tour, Property.created_at, Property.updated_at,
+                PropertyPrice.current_price,
+                PropertyAddress.property_id.label("address_id"), PropertyAddress.city, PropertyAddress.district,
+                ResidentialProperty.rooms, ResidentialProperty.total_area, ResidentialProperty.floor,
+                PropertyFeatures.property_id.label("features_id"), PropertyFeatures.balcony,
+                PropertyFeatures.parking_type,
+                PropertyAnalytics.demand_score, PropertyAnalytics.clicks_total
+            )
+            .outerjoin(PropertyPrice, PropertyPrice.property_id == Property.id)
+            .outerjoin(PropertyAddress, PropertyAddress.property_id == Property.id)
+            .outerjoin(ResidentialProperty, ResidentialProperty.property_id == Property.id)
+            .outerjoin(PropertyFeatures, PropertyFeatures.property_id == Property.id)
+            .outerjoin(PropertyAnalytics, PropertyAnalytics.property_id == Property.id)
+            .execution_options(yield_per=settings.catalog_load_batch_size)
+        )
+
+    async def _apply(self, session: AsyncSession, query, columns: CatalogColumns) -> Optional[datetime]:
+        """Применяет строки запроса к колонкам и возвращает максимальный updated_at"""
+        watermark = None
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            for row in partition:
+                if row.status == PropertyStatus.AVAILABLE:
+                    columns.upsert(row)
+                else:
+                    columns.remove(row.id)
+                if watermark is None or row.updated_at > watermark:
+                    watermark = row.updated_at
+        return watermark
+
+    async def _apply_tombstones(self, columns: CatalogColumns) -> bool:
+        """Убирает объекты, удалённые после прошлой проверки; False, если Redis недоступен"""
+        checked_at = time.time()
+        try:
+            members = await get_redis().zrangebyscore(
+                TOMBSTONES_KEY, self.tombstones_checked_at - TOMBSTONE_OVERLAP, "+inf"
+            )
+        except Exception as e:
+            print(f"Ошибка при чтении удалённых объектов каталога: {e}")
+            return False
+        for member in members:
+            columns.remove(int(member))
+        self.tombstones_checked_at = checked_at
+        return True
+
+    async def load(self, session: AsyncSession) -> None:
+        """Полная загрузка снимка с атомарной подменой колонок"""
+        async with self._lock:
+            # Объекты, удалённые до начала чтения, в загрузку не попадут
+            started_at = time.time()
+            columns = CatalogColumns()
+            query = self._rows_query().where(Property.status == PropertyStatus.AVAILABLE)
+            watermark = await self._apply(session, query, columns)
+            self._columns = columns
+            self.watermark = watermark or self.watermark
+            self.tombstones_checked_at = started_at
+            self.loaded_at = datetime.utcnow()
+
+    async def refresh(self, session: AsyncSession) -> bool:
+        """
+        Инкрементальное обновление по Property.updated_at и отметкам об удалении.
+        Возвращает False, если отметки прочитать не удалось
+        """
+        if self.watermark is None:
+            await self.load(session)
+            return True
+        async with self._lock:
+            query = self._rows_query().where(Property.updated_at >= self.watermark)
+            watermark = await self._apply(session, query, self._columns)
+            if watermark and watermark > self.watermark:
+                self.watermark = watermark
+            return await self._apply_tombstones(self._columns)
+
+    async def delete(self, property_id: int) -> None:
+        """Убирает удалённый объект из снимка и оставляет отметку для других процессов"""
+        async with self._lock:
+            self._columns.remove(property_id)
+        now = time.time()
+        try:
+            pipeline = get_redis().pipeline(transaction=True)
+            pipeline.zadd(TOMBSTONES_KEY, {property_id: now})
+            # Старые отметки уже учтены полной перезагрузкой во всех процессах
+            pipeline.zremrangebyscore(TOMBSTONES_KEY, "-inf", now - 2 * settings.catalog_full_reload_interval)
+            await pipeline.execute()
+        except Exception as e:
+            print(f"Ошибка при записи удаления объекта {property_id} из каталога: {e}")
+
+    async def sync(self, session: AsyncSession, version: int) -> None:
+        """
+        Подтягивает изменения, закоммиченные до инвалидации кэша подбора с версией version.
+        Инвалидация выполняется после коммита, записи в цены и адреса сдвигают
+        Property.updated_at, а удаление оставляет отметку, поэтому обычно достаточно
+        инкрементального обновления. Без отметок удаления снимок перезагружается целиком
+        """
+        if not self.is_ready or version <= self.synced_version:
+            return
+        if not await self.refresh(session):
+            await self.load(session)
+        self.synced_version = max(self.synced_version, version)
+
+    async def run_refresher(self, session_factory: Callable[[], AsyncSession]) -> None:
+        """Фоновый цикл обновления снимка"""
+        last_full_reload = datetime.utcnow()
+        while True:
+            await asyncio.sleep(settings.catalog_refresh_interval)
+            try:
+                async with session_factory() as session:
+                    if (datetime.utcnow() - last_full_reload).total_seconds() >= settings.catalog_full_reload_interval:
+                        await self.load(session)
+                        last_full_reload = datetime.utcnow()
+                    else:
+                        await self.refresh(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка при обновлении снимка каталога: {e}")
+
+    def filter(
+        self,
+        budget: Optional[float] = None,
+        budget_overshoot: float = 1.2,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        preferred_cities: Optional[Sequence[str]] = None,
+        preferred_districts: Optional[Sequence[str]] = None,
+        min_rooms: Optional[int] = None,
+        max_rooms: Optional[int] = None,
+        rooms: Optional[int] = None,
+        min_area: Optional[float] = None,
+        max_area: Optional[float] = None,
+        property_type: Optional[str] = None,
+        category: Optional[str] = None,
+        has_balcony: Optional[bool] = None,
+        has_parking: Optional[bool] = None,
+        max_floor: Optional[int] = None,
+        project_id: Optional[int] = None,
+        building_id: Optional[int] = None,
+        strict_area: bool = False
+    ) -> "np.ndarray":
+        """
+        Возвращает индексы строк, прошедших фильтры.
+        Семантика совпадает с CRUDProperty.get_match_candidates: отсутствие
+        сателлитной записи не отсекает объект. С strict_area объекты без площади
+        не проходят фильтры по площади, как в SQL-выборке списка объектов.
+        """
+        c = self._columns
+        mask = c.view("alive", np.uint8).astype(bool)
+
+        price = c.view("price", np.float64)
+        has_price = ~np.isnan(price)
+        with np.errstate(invalid="ignore"):
+            if budget is not None:
+                mask &= ~has_price | (price <= budget * budget_overshoot)
+            if min_price:
+                mask &= has_price & (price >= min_price)
+            if max_price:
+                mask &= has_price & (price <= max_price)
+
+            has_address = c.view("has_address", np.uint8).astype(bool)
+            if preferred_cities:
+                codes = [c.city_codes[city] for city in preferred_cities if city in c.city_codes]
+                mask &= ~has_address | np.isin(c.view("city", np.int64), codes)
+            if preferred_districts:
+                codes = [c.district_codes[d] for d in preferred_districts if d in c.district_codes]
+                mask &= ~has_address | np.isin(c.view("district", np.int64), codes)
+
+            if property_type:
+                codes = [i for i, value in enumerate(PROPERTY_TYPES) if value == property_type]
+                mask &= np.isin(c.view("property_type", np.int8), codes)
+            if category:
+                codes = [i for i, value in enumerate(CATEGORIES) if value == category]
+                mask &= np.isin(c.view("category", np.int8), codes)
+            if project_id:
+                mask &= c.view("project_id", np.int64) == project_id
+            if building_id:
+                mask &= c.view("building_id", np.int64) == building_id
+
+            room_count = c.view("rooms", np.float64)
+            if rooms:
+                mask &= room_count == rooms
+            if min_rooms:
+                mask &= np.isnan(room_count) | (room_count >= min_rooms)
+            if max_rooms:
+                mask &= np.isnan(room_count) | (room_count <= max_rooms)
+
+            area = c.view("total_area", np.float64)
+            missing_area = np.zeros(len(area), dtype=bool) if strict_area else np.isnan(area)
+            if min_area:
+                mask &= missing_area | (area >= min_area)
+            if max_area:
+                mask &= missing_area | (area <= max_area)
+
+            floor = c.view("floor", np.float64)
+            if max_floor:
+                mask &= np.isnan(floor) | (floor <= max_floor)
+
+        has_features = c.view("has_features", np.uint8).astype(bool)
+        if has_balcony is not None:
+            mask &= ~has_features | (c.view("balcony", np.uint8).astype(bool) == has_balcony)
+        if has_parking is not None:
+            mask &= ~has_features | (c.view("parking", np.uint8).astype(bool) == has_parking)
+
+        return np.flatnonzero(mask)
+
+    def _district_popularity(self, city: "np.ndarray", district: "np.ndarray") -> "np.ndarray":
+        """Популярность районов строк: поиск в статистике по уникальным парам (город, район)"""
+        if not len(district):
+            return np.empty(0, dtype=np.float64)
+        c = self._columns
+        pairs, inverse = np.unique(np.stack([city, district], axis=1), axis=0, return_inverse=True)
+        values = np.empty(len(pairs), dtype=np.float64)
+        for i, (city_code, district_code) in enumerate(pairs.tolist()):
+            if district_code == MISSING_CODE:
+                values[i] = DEFAULT_FACTOR_SCORE
+                continue
+            popularity = district_stats.popularity(
+                c.cities[city_code] if city_code != MISSING_CODE else None, c.districts[district_code]
+            )
+            values[i] = KNOWN_DISTRICT_POPULARITY if popularity is None else popularity
+        return values[inverse.reshape(-1)]
+
+    def match_columns(self, rows: "np.ndarray", preferred_districts: Optional[Sequence[str]] = None) -> MatchColumns:
+        """Колонки для скоринга по индексам строк"""
+        c = self._columns
+        district = c.view("district", np.int64)[rows]
+        preferred_codes = [c.district_codes[d] for d in preferred_districts or [] if d in c.district_codes]
+        return MatchColumns(
+            property_ids=c.view("property_id", np.int64)[rows].tolist(),
+            price=c.view("price", np.float64)[rows],
+            district_popularity=self._district_popularity(c.view("city", np.int64)[rows], district),
+            preferred_district=np.isin(district, preferred_codes),
+            demand_score=c.view("demand_score", np.float64)[rows],
+            clicks_total=c.view("clicks_total", np.float64)[rows],
+            created_at=c.view("created_at", np.float64)[rows]
+        )
+
+    def property_reads(self, rows: "np.ndarray") -> List[PropertyRead]:
+        """Схемы PropertyRead по индексам строк"""
+        c = self._columns
+        result = []
+        for index in sorted(rows.tolist(), key=lambda i: c.property_id[i]):
+            result.append(PropertyRead(
+                id=c.property_id[index],
+                external_id=c.external_id[index],
+                property_type=PROPERTY_TYPES[c.property_type[index]],
+                category=CATEGORIES[c.category[index]],
+                developer_id=c.developer_id[index] or None,
+                project_id=c.project_id[index] or None,
+                building_id=c.building_id[index] or None,
+                status=PropertyStatus.AVAILABLE,
+                has_3d_tour=bool(c.has_3d_tour[index]),
+                created_at=EPOCH + timedelta(seconds=c.created_at[index]),
+                updated_at=EPOCH + timedelta(seconds=c.updated_at[index])
+            ))
+        return result
+
+
+catalog_snapshot = CatalogSnapshot()
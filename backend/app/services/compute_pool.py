@@ -0,0 +1,186 @@
+"""
+Вынос CPU-ядер (скоринг подбора, формулы ценообразования, медианы кластеров)
+в ограниченный пул процессов.
+
+Ядро — функция уровня модуля, принимающая массивы NumPy одинаковой длины N
+и скалярные аргументы и возвращающая один или несколько массивов float64
+длины N. Входные массивы копируются в один блок shared memory вместе с
+местом под результаты; процесс пула подключается к блоку по имени, считает
+и записывает результаты на место, поэтому массивы не сериализуются.
+
+Массивы короче compute_pool_min_size считаются в текущем процессе: для них
+копирование и переключение процессов дороже самого вычисления. Так же
+ядро выполняется, если пул отключен (compute_pool_workers = 0) или процесс
+не может порождать дочерние (например, демонизированный процесс воркера).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import asyncio
+import os
+
+import numpy as np
+
+from app.config import settings
+
+
+ALIGNMENT = 64  # Выравнивание массивов внутри блока, байты
+
+# (смещение, dtype, форма) массива в блоке shared memory
+Layout = Tuple[int, str, Tuple[int, ...]]
+KernelResult = Union[np.ndarray, Tuple[np.ndarray, ...]]
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _plan(arrays: Sequence[np.ndarray], n_outputs: int, length: int) -> Tuple[List[Layout], List[Layout], int]:
+    """Раскладка входов и выходов в одном блоке и его размер"""
+    offset = 0
+    inputs = []
+    for array in arrays:
+        inputs.append((offset, array.dtype.str, array.shape))
+        offset = _align(offset + array.nbytes)
+    outputs = []
+    for _ in range(n_outputs):
+        outputs.append((offset, np.dtype(np.float64).str, (length,)))
+        offset = _align(offset + length * 8)
+    return inputs, outputs, max(offset, 1)
+
+
+# Представления массивов создаются только внутри функций ниже: блок можно закрыть,
+# лишь когда на его буфер не осталось ссылок
+
+def _views(buffer, layouts: Sequence[Layout]) -> List[np.ndarray]:
+    return [np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset) for offset, dtype, shape in layouts]
+
+
+def _write_inputs(buffer, inputs: List[Layout], arrays: Sequence[np.ndarray]) -> None:
+    for target, array in zip(_views(buffer, inputs), arrays):
+        target[...] = array
+
+
+def _read_outputs(buffer, outputs: List[Layout]) -> Tuple[np.ndarray, ...]:
+    return tuple(view.copy() for view in _views(buffer, outputs))
+
+
+def _compute(
+    buffer,
+    kernel: Callable[..., KernelResult],
+    inputs: List[Layout],
+    outputs: List[Layout],
+    args: Tuple[Any, ...]
+) -> None:
+    result = kernel(*_views(buffer, inputs), *args)
+    results = result if isinstance(result, tuple) else (result,)
+    for target, value in zip(_views(buffer, outputs), results):
+        target[...] = value
+
+
+def _execute(
+    kernel: Callable[..., KernelResult],
+    block_name: str,
+    inputs: List[Layout],
+    outputs: List[Layout],
+    args: Tuple[Any, ...]
+) -> None:
+    """Выполняется в процессе пула: читает входы из блока и пишет туда результаты"""
+    block = SharedMemory(name=block_name)
+    try:
+        _compute(block.buf, kernel, inputs, outputs, args)
+    finally:
+        block.close()
+
+
+class ComputePool:
+    """Ограниченный пул процессов для CPU-ядер с передачей массивов через shared memory"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._disabled = False
+        self.offloaded = 0
+        self.inline = 0
+        self.failures = 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._disabled or settings.compute_pool_workers <= 0:
+            return None
+        if self._pid != os.getpid():
+            # Пул родителя после fork непригоден: создаем свой
+            self._executor = None
+            self._pid = os.getpid()
+        if self._executor is None:
+            try:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.compute_pool_workers,
+                    mp_context=get_context(settings.compute_pool_start_method)
+                )
+            except (AssertionError, OSError, ValueError) as e:
+                print(f"Пул процессов недоступен, вычисления выполняются в текущем процессе: {e}")
+                self._disabled = True
+                return None
+        return self._executor
+
+    async def run(
+        self,
+        kernel: Callable[..., KernelResult],
+        arrays: Sequence[np.ndarray],
+        *args: Any,
+        n_outputs: int = 1
+    ) -> KernelResult:
+        """
+        Выполняет kernel(*arrays, *args). Результат — массив или кортеж из
+        n_outputs массивов float64 длины len(arrays[0])
+        """
+        arrays = [np.ascontiguousarray(array) for array in arrays]
+        length = len(arrays[0]) if arrays else 0
+        executor = self._get_executor() if length >= max(settings.compute_pool_min_size, 1) else None
+        if executor is None:
+            self.inline += 1
+            return kernel(*arrays, *args)
+
+        inputs, outputs, size = _plan(arrays, n_outputs, length)
+        block = SharedMemory(create=True, size=size)
+        try:
+            _write_inputs(block.buf, inputs, arrays)
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    executor, _execute, kernel, block.name, inputs, outputs, args
+                )
+            except BrokenProcessPool:
+                # Процесс пула завершился аварийно: пул пересоздается при следующем вызове
+                self.failures += 1
+                self._executor = None
+                return kernel(*arrays, *args)
+            except AssertionError as e:
+                # Процессы пула создаются при первой задаче; демонизированный процесс их создать не может
+                print(f"Пул процессов недоступен, вычисления выполняются в текущем процессе: {e}")
+                self._disabled = True
+                self._executor = None
+                return kernel(*arrays, *args)
+            results = _read_outputs(block.buf, outputs)
+            self.offloaded += 1
+            return results if n_outputs > 1 else results[0]
+        finally:
+            block.close()
+            block.unlink()
+
+    def shutdown(self) -> None:
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": 0 if self._disabled else settings.compute_pool_workers,
+            "offloaded": self.offloaded,
+            "inline": self.inline,
+            "failures": self.failures
+        }
+
+
+compute_pool = ComputePool()
@@ -0,0 +1,217 @@
+"""
+Кластеризация спроса доступных объектов методом k-means.
+
+Признаки: логарифмы цены, цены за м² и площади, число комнат, скор спроса
+и логарифм просмотров за месяц. Пропуски заполняются медианой признака,
+признаки стандартизуются. Инициализация k-means++ с фиксированным seed,
+поэтому повторный запуск на тех же данных дает те же кластеры. Расстояния
+считаются пачками через ||x||² − 2x·c + ||c||², что ограничивает память
+матрицей «пачка × k». Кластеры нумеруются по возрастанию цены центроида.
+
+Результаты каждого запуска сохраняются (demand_cluster_runs, demand_clusters,
+demand_cluster_members): эндпоинт отдает последний запуск без пересчета,
+а ценообразование может брать медиану спроса кластера объекта вместо
+группировки «проект + комнаты».
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud import crud_demand_cluster
+from app.models import DemandClusterRun, DemandCluster, PropertyType
+
+
+FEATURES = ("price", "price_per_m2", "rooms", "area", "demand", "views")
+LOG_FEATURES = (0, 1, 3, 5)  # Цены, площадь и просмотры распределены с длинным хвостом
+DISTANCE_CHUNK = 65536
+TOLERANCE = 1e-4  # Относительное изменение инерции для остановки
+SEED = 0
+
+
+@dataclass
+class KMeansResult:
+    labels: np.ndarray  # (N,)
+    centroids: np.ndarray  # (k, D) в стандартизованных признаках
+    inertia: float
+    iterations: int
+
+
+def _assign(X: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Ближайший центроид и квадрат расстояния до него для каждой точки"""
+    labels = np.empty(len(X), dtype=np.int64)
+    distances = np.empty(len(X), dtype=np.float64)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for lo in range(0, len(X), DISTANCE_CHUNK):
+        chunk = X[lo:lo + DISTANCE_CHUNK]
+        d2 = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ centroids.T + centroid_norms[None, :]
+        labels[lo:lo + len(chunk)] = d2.argmin(axis=1)
+        distances[lo:lo + len(chunk)] = np.maximum(d2[np.arange(len(chunk)), labels[lo:lo + len(chunk)]], 0.0)
+    return labels, distances
+
+
+def _init_plus_plus(X: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Инициализация k-means++: следующий центр выбирается пропорционально квадрату расстояния"""
+    centroids = np.empty((k, X.shape[1]), dtype=np.float64)
+    centroids[0] = X[rng.integers(len(X))]
+    closest = ((X - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(X), p=closest / total) if total > 0 else rng.integers(len(X))
+        centroids[i] = X[index]
+        closest = np.minimum(closest, ((X - centroids[i]) ** 2).sum(axis=1))
+    return centroids
+
+
+def kmeans(X: np.ndarray, k: int, max_iterations: int, seed: int = SEED) -> KMeansResult:
+    """Алгоритм Ллойда; пустой кластер переносится в самую удаленную от своего центра точку"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(X))
+    centroids = _init_plus_plus(X, k, rng)
+    inertia = np.inf
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        labels, distances = _assign(X, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=X[:, d], minlength=k) for d in range(X.shape[1])], axis=1)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        for cluster in np.flatnonzero(empty):
+            farthest = int(distances.argmax())
+            centroids[cluster] = X[farthest]
+            distances[farthest] = 0.0
+
+        new_inertia = float(distances.sum())
+        converged = (
+            not empty.any()
+            and np.isfinite(inertia)
+            and inertia - new_inertia <= TOLERANCE * max(inertia, 1e-12)
+        )
+        inertia = new_inertia
+        if converged:
+            break
+    labels, distances = _assign(X, centroids)
+    return KMeansResult(labels=labels, centroids=centroids, inertia=float(distances.sum()), iterations=iterations)
+
+
+def build_features(rows) -> np.ndarray:
+    """Матрица признаков (N, D) в исходных единицах; отсутствующие значения — NaN"""
+    def column(values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    return np.column_stack([
+        column([row.current_price for row in rows]),
+        column([row.price_per_m2 for row in rows]),
+        column([row.rooms for row in rows]),
+        column([row.total_area for row in rows]),
+        column([row.demand_score or 0 for row in rows]),
+        column([row.views_last_month or 0 for row in rows])
+    ])
+
+
+def standardize(raw: np.ndarray) -> np.ndarray:
+    """Логарифмирование, заполнение пропусков медианой и z-нормировка признаков"""
+    X = raw.copy()
+    X[:, LOG_FEATURES] = np.log1p(np.maximum(X[:, LOG_FEATURES], 0.0))
+    with np.errstate(invalid="ignore"):
+        medians = np.nanmedian(X, axis=0)
+    medians = np.where(np.isnan(medians), 0.0, medians)
+    missing = np.isnan(X)
+    X[missing] = np.take(medians, np.nonzero(missing)[1])
+    std = X.std(axis=0)
+    return (X - X.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+
+def summarize(raw: np.ndarray, labels: np.ndarray, k: int) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Статистика кластеров в исходных единицах и перенумерация меток
+    по возрастанию средней цены кластера
+    """
+    counts = np.bincount(labels, minlength=k)
+    price = raw[:, 0]
+    mean_price = np.bincount(labels, weights=price, minlength=k) / np.maximum(counts, 1)
+    order = np.argsort(mean_price, kind="stable")
+    remap = np.empty(k, dtype=np.int64)
+    remap[order] = np.arange(k)
+    labels = remap[labels]
+
+    clusters = []
+    for cluster in range(k):
+        members = raw[labels == cluster]
+        if not len(members):
+            continue
+        with np.errstate(invalid="ignore"):
+            centroid = np.nanmean(members, axis=0)
+        centroid = np.where(np.isnan(centroid), 0.0, centroid)
+        demand = members[:, 4]
+        clusters.append({
+            "cluster_id": cluster,
+            "property_count": len(members),
+            **{f"centroid_{name}": float(value) for name, value in zip(FEATURES, centroid)},
+            "min_price": float(members[:, 0].min()),
+            "max_price": float(members[:, 0].max()),
+            "median_demand": float(np.percentile(demand, 50)),
+            "p25_demand": float(np.percentile(demand, 25)),
+            "p75_demand": float(np.percentile(demand, 75))
+        })
+    return clusters, labels
+
+
+class DemandClusteringService:
+    """Построение и чтение кластеризаций спроса"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def build(
+        self,
+        project_id: Optional[int] = None,
+        property_type: Optional[PropertyType] = None,
+        k: Optional[int] = None
+    ) -> DemandClusterRun:
+        """Кластеризует доступные объекты с ценой и сохраняет запуск"""
+        k = k or settings.demand_clusters_k
+        # Строки читаются пачками и сразу сворачиваются в массивы признаков
+        id_blocks: List[np.ndarray] = []
+        feature_blocks: List[np.ndarray] = []
+        async for partition in crud_demand_cluster.stream_features(
+            self.session, project_id, property_type, batch_size=settings.worker_scan_batch_size
+        ):
+            id_blocks.append(np.fromiter((row.id for row in partition), dtype=np.int64, count=len(partition)))
+            feature_blocks.append(build_features(partition))
+        
+        run = DemandClusterRun(project_id=project_id, property_type=property_type, k=0)
+        clusters: List[Dict[str, Any]] = []
+        members: List[Dict[str, Any]] = []
+        if id_blocks:
+            property_ids = np.concatenate(id_blocks)
+            raw = np.vstack(feature_blocks)
+            result = await asyncio.to_thread(
+                kmeans, standardize(raw), k, settings.demand_clusters_max_iterations
+            )
+            clusters, labels = summarize(raw, result.labels, len(result.centroids))
+            members = [
+                {"property_id": property_id, "cluster_id": label}
+                for property_id, label in zip(property_ids.tolist(), labels.tolist())
+            ]
+            run.k = len(clusters)
+            run.property_count = len(property_ids)
+            run.iterations = result.iterations
+            run.inertia = result.inertia
+        return await crud_demand_cluster.save_run(
+            self.session, run, clusters, members, keep_runs=settings.demand_clusters_keep_runs
+        )
+
+    async def get_latest(
+        self,
+        project_id: Optional[int] = None,
+        property_type: Optional[PropertyType] = None
+    ) -> Optional[Tuple[DemandClusterRun, List[DemandCluster]]]:
+        """Последний запуск для набора фильтров с его кластерами"""
+        run = await crud_demand_cluster.get_latest_run(self.session, project_id, property_type)
+        if not run:
+            return None
+        return run, await crud_demand_cluster.get_clusters(self.session, run.id)
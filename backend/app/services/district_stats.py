@@ -0,0 +1,81 @@
+"""
+Процессная карта статистики районов.
+
+Таблица district_stats пересчитывается воркером (инкрементально по
+измененным районам и периодически полностью). Процесс API держит ее
+копию в словаре по ключу (город, район) и перечитывает каждые
+district_stats_reload_interval секунд, поэтому эндпоинт статистики района
+и скоринг ИИ-подбора не обращаются к БД.
+"""
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud import crud_district_stats
+from app.schemas import DistrictStatsRead
+
+
+class DistrictStatsMap:
+    """Статистика районов в памяти процесса"""
+
+    def __init__(self):
+        self._by_key: Dict[Tuple[str, str], DistrictStatsRead] = {}
+        self._by_district: Dict[str, List[DistrictStatsRead]] = {}
+        self.loaded_at: Optional[datetime] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    async def load(self, session: AsyncSession) -> None:
+        """Перечитывает таблицу и атомарно подменяет словари"""
+        rows = [DistrictStatsRead.model_validate(row) for row in await crud_district_stats.get_all(session)]
+        by_district: Dict[str, List[DistrictStatsRead]] = {}
+        for row in sorted(rows, key=lambda row: -row.property_count):
+            by_district.setdefault(row.district, []).append(row)
+        self._by_key = {(row.city, row.district): row for row in rows}
+        self._by_district = by_district
+        self.loaded_at = datetime.utcnow()
+
+    async def ensure_fresh(self, session: AsyncSession) -> None:
+        """Перечитывает таблицу, если она не загружена или устарела (процессы без фонового цикла)"""
+        if (
+            self.loaded_at is None
+            or (datetime.utcnow() - self.loaded_at).total_seconds() >= settings.district_stats_reload_interval
+        ):
+            await self.load(session)
+
+    def get(self, district: str, city: Optional[str] = None) -> Optional[DistrictStatsRead]:
+        """Статистика района; без города — район с наибольшим числом объектов"""
+        if city is not None:
+            return self._by_key.get((city, district))
+        candidates = self._by_district.get(district)
+        return candidates[0] if candidates else None
+
+    def popularity(self, city: Optional[str], district: Optional[str]) -> Optional[float]:
+        """Популярность района 0..1 или None, если статистики нет"""
+        if district is None:
+            return None
+        stats = self.get(district, city)
+        return stats.popularity_score if stats else None
+
+    async def run_refresher(self, session_factory: Callable[[], AsyncSession]) -> None:
+        """Фоновый цикл перечитывания таблицы"""
+        while True:
+            await asyncio.sleep(settings.district_stats_reload_interval)
+            try:
+                async with session_factory() as session:
+                    await self.load(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка при обновлении статистики районов: {e}")
+
+
+district_stats = DistrictStatsMap()
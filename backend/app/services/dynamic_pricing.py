@@ -1,20 +1,28 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, func
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict
 from datetime import datetime, timedelta
-import statistics
-from app.models import (
-    Property, PropertyAnalytics, PriceHistory, ViewsLog, Booking,
-    PriceChangeReason, DynamicPricingConfig, PropertyStatus
-)
+from collections import namedtuple
+import numpy as np
+from app.models import Property, PriceChangeReason, DynamicPricingConfig
 from app.schemas import DynamicPricingResult
 from app.config import settings
 from app.crud import (
-    crud_property, crud_property_analytics, crud_booking, crud_dynamic_pricing_config,
-    CRUDDynamicPricing
+    crud_property_analytics, crud_booking, crud_dynamic_pricing_config,
+    crud_residential, crud_cluster_demand_stats, crud_demand_cluster, CRUDDynamicPricing
+)
+from app.services.match_cache import match_cache
+from app.services.pricing_config import pricing_config_cache
+from app.services.compute_pool import compute_pool
+from app.services.pricing_math import (
+    DEMAND_WINDOW_DAYS, demand_scores, cluster_medians_excluding_self,
+    price_adjustments, apply_price_limits, reprice_arrays
 )
 
 
+# Ключ кластера объекта для расчета медиан спроса
+ClusterMember = namedtuple("ClusterMember", ["id", "project_id", "rooms"])
+
+
 class DynamicPricingService:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -24,7 +32,7 @@ class DynamicPricingService:
     async def _get_config(self) -> DynamicPricingConfig:
         """Получает актуальную конфигурацию динамического ценообразования"""
         if self.config is None:
-            self.config = await crud_dynamic_pricing_config.get_active(self.session)
+            self.config = await pricing_config_cache.get(self.session)
             
             if not self.config:
                 # Создаем дефолтную конфигурацию
@@ -35,74 +43,37 @@ class DynamicPricingService:
                     "enabled": True
                 }
                 self.config = await crud_dynamic_pricing_config.create(self.session, config_data)
+                await pricing_config_cache.invalidate()
         
         return self.config
     
     async def calculate_demand_score(self, property_id: int) -> float:
         """Рассчитывает оценку спроса на основе просмотров и бронирований"""
-        # Получаем статистику за последние 30 дней
-        start_date = datetime.utcnow() - timedelta(days=30)
-        
-        # Получаем количество просмотров
-        views_result = await self.session.execute(
-            select(func.count(ViewsLog.id))
-            .where(
-                and_(
-                    ViewsLog.property_id == property_id,
-                    ViewsLog.occurred_at >= start_date
-                )
-            )
-        )
-        views_count = views_result.scalar() or 0
-        
-        # Получаем количество бронирований
-        bookings_result = await self.session.execute(
-            select(func.count(Booking.id))
-            .where(
-                and_(
-                    Booking.property_id == property_id,
-                    Booking.booked_at >= start_date
-                )
-            )
-        )
-        bookings_count = bookings_result.scalar() or 0
-        
-        # Простая формула для оценки спроса
-        # Можно настроить веса для просмотров и бронирований
-        views_weight = 0.3
-        bookings_weight = 0.7
-        
-        # Нормализуем значения (предполагаем, что хорошие показатели - это 100 просмотров и 5 бронирований в месяц)
-        normalized_views = min(views_count / 100.0, 1.0)
-        normalized_bookings = min(bookings_count / 5.0, 1.0)
-        
-        return (normalized_views * views_weight + normalized_bookings * bookings_weight) * 100
+        start_date = datetime.utcnow() - timedelta(days=DEMAND_WINDOW_DAYS)
+        counts = await self.crud.get_event_counts(start_date, [property_id])
+        views = counts["views"].get(property_id, 0)
+        if settings.pricing_use_unique_visitors:
+            analytics = await crud_property_analytics.get_by_field(self.session, "property_id", property_id)
+            views = (analytics[0].unique_visitors_month or 0) if analytics else 0
+        return float(demand_scores([views], [counts["bookings"].get(property_id, 0)])[0])
     
     async def get_cluster_median_demand(self, property_obj: Property) -> float:
-        """Получает медианный спрос для кластера (проект + тип комнат)"""
-        # Получаем все объекты того же проекта и типа комнат
-        project_id = property_obj.project_id if property_obj.project else None
-        rooms = property_obj.residential.rooms if property_obj.residential else None
-        
-        cluster_properties = await self.crud.get_cluster_properties(
-            project_id,
-            rooms,
-            property_obj.id
-        )
+        """Получает медианный спрос для кластера (k-means, если включено, иначе проект + тип комнат)"""
+        member_medians = await self._get_demand_cluster_medians([property_obj.id])
+        if property_obj.id in member_medians:
+            return member_medians[property_obj.id]
         
-        if not cluster_properties:
-            return 0.0
+        residential = await crud_residential.get_by_field(self.session, "property_id", property_obj.id)
+        rooms = residential[0].rooms if residential else None
         
-        # Вычисляем медианный спрос
-        demands = [p.analytics.demand_score for p in cluster_properties if p.analytics]
-        if not demands:
-            return 0.0
+        stats = await crud_cluster_demand_stats.get_for_cluster(self.session, property_obj.project_id, rooms)
+        if stats:
+            return stats.median_demand
         
-        demands.sort()
-        mid = len(demands) // 2
-        if len(demands) % 2 == 0:
-            return (demands[mid - 1] + demands[mid]) / 2
-        return demands[mid]
+        # Статистика кластеров еще не рассчитана — считаем по объектам кластера
+        row = ClusterMember(id=property_obj.id, project_id=property_obj.project_id, rooms=rooms)
+        medians = await self._compute_cluster_medians([row], [property_obj.id])
+        return float(medians[0])
     
     async def should_update_price(self, property_obj: Property) -> bool:
         """Проверяет, можно ли обновлять цену для объекта недвижимости"""
@@ -130,38 +101,13 @@ class DynamicPricingService:
         median_demand: float
     ) -> float:
         """Рассчитывает корректировку цены на основе спроса"""
-        # Настройки для корректировки цены
-        max_adjustment = 0.10  # Максимальное изменение цены (10%)
-        demand_threshold = 0.2  # Порог разницы в спросе для изменения цены
-        
-        # Нормализуем оценки спроса
-        demand_normalized = demand_score / 100.0
-        median_normalized = median_demand / 100.0
-        
-        # Вычисляем разницу в спросе
-        demand_diff = demand_normalized - median_normalized
-        
-        if abs(demand_diff) < demand_threshold:
-            return current_price
-        
-        # Рассчитываем процент изменения
-        adjustment_percent = demand_diff * max_adjustment
-        
-        # Применяем изменение к текущей цене
-        new_price = current_price * (1 + adjustment_percent)
-        
-        # Округляем до тысяч
-        return round(new_price / 1000) * 1000
+        return float(price_adjustments([current_price], [demand_score], [median_demand])[0])
     
     def apply_price_limits(self, property_obj: Property, new_price: float) -> float:
         """Применяет ограничения на изменение цены"""
         if not property_obj.price:
             return new_price
-            
-        max_allowed_price = property_obj.price.base_price * (1 + settings.price_max_shift / 100)
-        min_allowed_price = property_obj.price.base_price * (1 - settings.price_max_shift / 100)
-        
-        return max(min_allowed_price, min(max_allowed_price, new_price))
+        return float(apply_price_limits([new_price], [property_obj.price.base_price], settings.price_max_shift)[0])
     
     async def generate_price_change_description(self, property_obj: Property, price_change: float) -> str:
         """Генерирует описание изменения цены"""
@@ -174,76 +120,165 @@ class DynamicPricingService:
         else:
             return "Цена осталась без изменений"
     
-    async def update_property_price(self, property_obj: Property) -> Dict[str, Any]:
+    async def update_property_price(self, property_obj: Property) -> Optional[DynamicPricingResult]:
         """Обновляет цену объекта на основе динамического ценообразования"""
-        if not property_obj.price:
-            return {
-                "success": False,
-                "error": "Property has no price information"
-            }
-        
-        # Получаем текущие показатели
-        current_price = property_obj.price.current_price
-        demand_score = await self.calculate_demand_score(property_obj.id)
-        median_demand = await self.get_cluster_median_demand(property_obj)
-        
-        # Рассчитываем новую цену
-        new_price = await self.calculate_price_adjustment(
-            current_price,
-            demand_score,
-            median_demand
-        )
+        results = await self.reprice_properties([property_obj.id])
+        return results[0] if results else None
+    
+    async def update_all_property_prices(self) -> List[DynamicPricingResult]:
+        """Обновляет цены всех доступных объектов недвижимости"""
+        return await self.reprice_properties()
+    
+    async def find_dirty_properties(self) -> List[int]:
+        """
+        Находит объекты с событиями, вставленными после прошлого поиска, у которых
+        с момента последнего изменения цены накопилось достаточно сигналов спроса.
+        Позиция поиска фиксируется коммитом сессии вызывающим
+        """
+        lookback_since = datetime.utcnow() - timedelta(days=settings.pricing_dirty_lookback_days)
+        candidates = await self.crud.claim_properties_with_new_events(lookback_since)
+        activity = await self.crud.get_activity_since_last_change(candidates, lookback_since)
+        return [
+            property_id for property_id, counts in activity.items()
+            if counts["views"] >= settings.pricing_dirty_min_views
+            or counts["bookings"] >= settings.pricing_dirty_min_bookings
+        ]
+    
+    async def _get_demand_cluster_medians(self, property_ids: Optional[List[int]]) -> Dict[int, float]:
+        """Медианы спроса k-means кластеров объектов из последней глобальной кластеризации"""
+        if not settings.pricing_use_demand_clusters:
+            return {}
+        run = await crud_demand_cluster.get_latest_run(self.session)
+        if not run:
+            return {}
+        return await crud_demand_cluster.get_member_medians(self.session, run.id, property_ids)
+    
+    async def _get_cluster_medians(self, rows, property_ids: Optional[List[int]]) -> np.ndarray:
+        """
+        Медианы спроса кластеров: k-means кластер объекта (если включено и объект
+        попал в кластеризацию), иначе кластер (проект + комнаты) из cluster_demand_stats
+        """
+        member_medians = await self._get_demand_cluster_medians(property_ids)
+        if member_medians and all(row.id in member_medians for row in rows):
+            return np.array([member_medians[row.id] for row in rows], dtype=np.float64)
         
-        if new_price == current_price:
-            return {
-                "success": True,
-                "message": "No price adjustment needed",
-                "price_change": 0
-            }
+        medians = await crud_cluster_demand_stats.get_medians(self.session)
+        if medians:
+            fallback = np.array([medians.get((row.project_id, row.rooms), 0.0) for row in rows], dtype=np.float64)
+        else:
+            fallback = await self._compute_cluster_medians(rows, property_ids)
+        return np.array([
+            member_medians.get(row.id, fallback[i]) for i, row in enumerate(rows)
+        ], dtype=np.float64)
+    
+    async def _compute_cluster_medians(self, rows, property_ids: Optional[List[int]]) -> np.ndarray:
+        """Медианы спроса кластеров (проект + комнаты) без учета самого объекта по данным объектов"""
+        project_ids = None if property_ids is None else list({row.project_id for row in rows})
+        members = await self.crud.get_cluster_demand_rows(project_ids)
         
-        # Определяем причину изменения
-        price_change = new_price - current_price
-        price_change_percent = (price_change / current_price) * 100
+        keys: Dict[tuple, int] = {}
+        index_by_id: Dict[int, int] = {}
+        key_codes = []
+        values = []
+        for row in members:
+            index_by_id[row.id] = len(values)
+            key_codes.append(keys.setdefault((row.project_id, row.rooms), len(keys)))
+            values.append(row.demand_score if row.demand_score is not None else np.nan)
+        # Объекты без аналитики получают медиану кластера, но сами в ней не участвуют
+        for row in rows:
+            if row.id not in index_by_id:
+                index_by_id[row.id] = len(values)
+                key_codes.append(keys.setdefault((row.project_id, row.rooms), len(keys)))
+                values.append(np.nan)
         
-        if price_change > 0:
-            reason = "high_demand"
-            description = "Increased due to high demand"
+        medians = await compute_pool.run(
+            cluster_medians_excluding_self,
+            [np.array(key_codes, dtype=np.int64), np.array(values, dtype=np.float64)]
+        )
+        return medians[[index_by_id[row.id] for row in rows]]
+    
+    async def reprice_properties(self, property_ids: Optional[List[int]] = None) -> List[DynamicPricingResult]:
+        """
+        Пакетная переоценка объектов (всех доступных, если property_ids не задан).
+        Спрос считается сгруппированными запросами, медианы кластеров — один раз,
+        формулы применяются векторно, изменения записываются одной транзакцией.
+        """
+        config = await self._get_config()
+        now = datetime.utcnow()
+        
+        rows = await self.crud.get_pricing_rows(property_ids)
+        if not rows:
+            return []
+        scope_ids = [row.id for row in rows]
+        scope_filter = None if property_ids is None else scope_ids
+        
+        # Спрос за последние 30 дней (просмотры или уникальные посетители)
+        counts = await self.crud.get_event_counts(now - timedelta(days=DEMAND_WINDOW_DAYS), scope_filter)
+        if settings.pricing_use_unique_visitors:
+            # Повторные просмотры одной сессией не завышают спрос
+            views = np.array([row.unique_visitors_month or 0 for row in rows], dtype=np.float64)
         else:
-            reason = "low_demand"
-            description = "Decreased due to low demand"
-        
-        # Обновляем цену
-        await self.crud.update_property_price(
-            property_obj.id,
-            new_price,
-            reason,
-            description
+            views = np.array([counts["views"].get(property_id, 0) for property_id in scope_ids], dtype=np.float64)
+        bookings = np.array([counts["bookings"].get(property_id, 0) for property_id in scope_ids], dtype=np.float64)
+        median_demand = await self._get_cluster_medians(rows, scope_filter)
+        
+        # Спрос и новые цены с ограничениями от базовой цены и за один шаг (на больших пачках — в пуле процессов)
+        current_prices = np.array([row.current_price for row in rows], dtype=np.float64)
+        base_prices = np.array([row.base_price for row in rows], dtype=np.float64)
+        demand, new_prices, change_percent = await compute_pool.run(
+            reprice_arrays,
+            [views, bookings, median_demand, current_prices, base_prices],
+            settings.price_max_shift, config.min_price_change, config.max_price_change,
+            n_outputs=3
         )
         
-        return {
-            "success": True,
-            "old_price": current_price,
-            "new_price": new_price,
-            "price_change": price_change,
-            "price_change_percent": price_change_percent,
-            "demand_score": demand_score,
-            "median_demand": median_demand,
-            "reason": reason,
-            "description": description
-        }
-    
-    async def update_all_property_prices(self) -> List[DynamicPricingResult]:
-        """Обновляет цены всех доступных объектов недвижимости"""
-        available_properties = await crud_property.get_by_status(self.session, PropertyStatus.AVAILABLE)
+        # Не чаще раза в update_interval_hours и не в течение суток после бронирования
+        # (правила прежнего should_update_price; время брони — Booking.booked_at)
+        blocked = await self.crud.get_recently_repriced_ids(
+            now - timedelta(hours=config.update_interval_hours), scope_filter
+        )
+        blocked |= await self.crud.get_recently_booked_ids(now - timedelta(hours=24), scope_filter)
+        eligible = ~np.isin(np.array(scope_ids, dtype=np.int64), np.array(list(blocked), dtype=np.int64))
+        changed = np.flatnonzero(eligible & (np.abs(new_prices - current_prices) >= 0.01))
         
         results = []
-        for property_obj in available_properties:
-            try:
-                result = await self.update_property_price(property_obj)
-                if result:
-                    results.append(result)
-            except Exception as e:
-                print(f"Ошибка при обновлении цены объекта {property_obj.id}: {e}")
-                continue
-        
-        return results 
\ No newline at end of file
+        price_updates = []
+        history_rows = []
+        for i in changed.tolist():
+            property_id = scope_ids[i]
+            old_price = float(current_prices[i])
+            new_price = float(new_prices[i])
+            percent = float(change_percent[i])
+            if percent > 0:
+                reason = "high_demand"
+                description = f"Цена повышена на {percent:.1f}% из-за высокого спроса"
+            else:
+                reason = "low_demand"
+                description = f"Цена снижена на {abs(percent):.1f}% из-за низкого спроса"
+            
+            price_updates.append({"property_id": property_id, "current_price": new_price})
+            history_rows.append({
+                "property_id": property_id,
+                "changed_at": now,
+                "old_price": old_price,
+                "new_price": new_price,
+                "reason": PriceChangeReason.DYNAMIC,
+                "description": description
+            })
+            median = float(median_demand[i])
+            results.append(DynamicPricingResult(
+                property_id=property_id,
+                old_price=old_price,
+                new_price=new_price,
+                price_change_percent=percent,
+                demand_score=float(demand[i]),
+                demand_normalized=float(demand[i]) / median if median else 0.0,
+                reason=reason,
+                description=description
+            ))
+        
+        if price_updates:
+            await self.crud.bulk_apply_prices(price_updates, history_rows)
+            await match_cache.invalidate()
+        
+        return results
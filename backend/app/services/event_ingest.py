@@ -0,0 +1,287 @@
+"""
+Буферизованная запись событий просмотров и избранного в views_log.
+
+Эндпоинт публичный, поэтому события сначала проходят EventIngestGuard:
+лимит событий с одного клиента за окно (429 сверх него) и отсев повторов —
+событие посетителя (session_id, без него — адрес клиента) по объекту
+учитывается не чаще раза в event_ingest_dedupe_window. Повторы не попадают
+в views_log и не влияют на спрос и цены. Ошибки Redis не блокируют прием.
+
+Принятые события добавляются в буфер процесса, эндпоинт сразу отвечает 202.
+Фоновая задача сбрасывает буфер пачками через COPY (asyncpg) каждые
+event_ingest_flush_interval секунд или при накоплении event_ingest_batch_size
+событий. Перед записью события для несуществующих объектов отбрасываются,
+чтобы одна ошибка внешнего ключа не отклонила всю пачку. При переполнении
+буфера новые события отклоняются (клиент получает 503 и может повторить).
+При ошибке БД незаписанные события возвращаются в буфер, а пауза перед
+следующим сбросом удваивается до event_ingest_max_backoff; событие, не
+записанное за event_ingest_max_attempts попыток, отбрасывается (dropped).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import time
+
+from sqlmodel import select
+
+from app.config import settings
+from app.models import Property, ViewsLog
+from app.schemas import ViewEventIngest
+from app.redis_client import get_redis
+from app.services.unique_visitors import unique_visitors
+
+
+# Допустимое расхождение времени клиента с сервером
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+MAX_EVENT_AGE = timedelta(days=1)
+
+COPY_COLUMNS = ["property_id", "user_id", "event", "occurred_at", "source", "session_id"]
+
+EventRow = Tuple[int, Optional[int], str, datetime, Optional[str], Optional[str]]
+
+
+RATE_KEY_PREFIX = "event_ingest:rate"
+SEEN_KEY_PREFIX = "event_ingest:seen"
+
+
+class EventBufferFull(Exception):
+    """Буфер событий переполнен"""
+
+
+class EventRateLimited(Exception):
+    """Клиент превысил лимит событий"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class EventIngestGuard:
+    """Лимит событий на клиента и отсев повторов перед буфером"""
+
+    def __init__(self):
+        self.limited = 0
+        self.duplicates = 0
+        self.guard_errors = 0
+
+    @staticmethod
+    def seen_key(event: ViewEventIngest, client: str) -> str:
+        visitor = f"s:{event.session_id}" if event.session_id else f"c:{client}"
+        return f"{SEEN_KEY_PREFIX}:{event.event.name}:{event.property_id}:{visitor}"
+
+    async def _check_rate(self, client: str, count: int, now: float) -> None:
+        window = settings.event_ingest_rate_window
+        key = f"{RATE_KEY_PREFIX}:{client}:{int(now // window)}"
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.incrby(key, count)
+        pipeline.expire(key, window)
+        total, _ = await pipeline.execute()
+        if total > settings.event_ingest_rate_limit:
+            self.limited += count
+            raise EventRateLimited(retry_after=max(int(window - now % window), 1))
+
+    async def _first_seen(self, events: Sequence[ViewEventIngest], client: str) -> List[ViewEventIngest]:
+        pipeline = get_redis().pipeline(transaction=False)
+        for event in events:
+            pipeline.set(self.seen_key(event, client), 1, nx=True, ex=settings.event_ingest_dedupe_window)
+        results = await pipeline.execute()
+        admitted = [event for event, first in zip(events, results) if first]
+        self.duplicates += len(events) - len(admitted)
+        return admitted
+
+    async def admit(self, client: str, events: Sequence[ViewEventIngest]) -> List[ViewEventIngest]:
+        """События, которые нужно учесть; EventRateLimited при превышении лимита клиента"""
+        try:
+            await self._check_rate(client, len(events), time.time())
+            return await self._first_seen(events, client)
+        except EventRateLimited:
+            raise
+        except Exception as e:
+            # Redis недоступен: прием событий важнее защиты от накрутки
+            self.guard_errors += 1
+            print(f"Ошибка проверки событий в Redis, события приняты без проверки: {e}")
+            return list(events)
+
+    async def forget(self, client: str, events: Sequence[ViewEventIngest]) -> None:
+        """Снимает отметки повторов с событий, которые не удалось принять (повтор клиента учтется)"""
+        try:
+            await get_redis().delete(*(self.seen_key(event, client) for event in events))
+        except Exception:
+            self.guard_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limited": self.limited, "duplicates": self.duplicates, "guard_errors": self.guard_errors}
+
+
+class EventIngestBuffer:
+    """Буфер событий с фоновым сбросом в views_log"""
+
+    def __init__(self):
+        self._pending: List[EventRow] = []
+        self._attempts: List[int] = []  # Неудачных попыток записи каждого события _pending
+        self._failures = 0  # Сбросов подряд, завершившихся ошибкой
+        self._ready = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._session_factory = None
+        self._stopping = False
+        self.accepted = 0
+        self.written = 0
+        self.rejected = 0
+        self.discarded = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.visitor_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @staticmethod
+    def _row(event: ViewEventIngest, now: datetime) -> EventRow:
+        occurred_at = event.occurred_at or now
+        if occurred_at.tzinfo is not None:
+            occurred_at = occurred_at.astimezone(timezone.utc).replace(tzinfo=None)
+        # Время клиента принимается только в разумных пределах
+        if occurred_at > now + MAX_CLOCK_SKEW or occurred_at < now - MAX_EVENT_AGE:
+            occurred_at = now
+        # Перечисления хранятся в БД по имени
+        return (event.property_id, None, event.event.name, occurred_at, event.source, event.session_id)
+
+    def add(self, events: Sequence[ViewEventIngest]) -> int:
+        """Добавить события в буфер; без ожидания и без обращения к БД"""
+        if len(self._pending) + len(events) > settings.event_ingest_max_pending:
+            self.rejected += len(events)
+            raise EventBufferFull()
+        now = datetime.utcnow()
+        self._pending.extend(self._row(event, now) for event in events)
+        self._attempts.extend([0] * len(events))
+        self.accepted += len(events)
+        if len(self._pending) >= settings.event_ingest_batch_size:
+            self._ready.set()
+        return len(events)
+
+    async def _write(self, session_factory, rows: List[EventRow]) -> None:
+        """Записать пачку через COPY, отбросив события несуществующих объектов"""
+        async with session_factory() as session:
+            property_ids = list({row[0] for row in rows})
+            result = await session.execute(select(Property.id).where(Property.id.in_(property_ids)))
+            known_ids = set(result.scalars().all())
+            valid = [row for row in rows if row[0] in known_ids]
+            self.discarded += len(rows) - len(valid)
+            if not valid:
+                return
+
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                ViewsLog.__tablename__, records=valid, columns=COPY_COLUMNS
+            )
+            await session.commit()
+            self.written += len(valid)
+
+        # Счетчики уникальных посетителей не критичны: ошибка Redis не возвращает пачку в буфер
+        try:
+            await unique_visitors.record((row[0], row[5], row[3]) for row in valid)
+        except Exception:
+            self.visitor_errors += 1
+
+    def _requeue(self, rows: List[EventRow], attempts: List[int]) -> None:
+        """
+        Возвращает незаписанные события в начало буфера: события, исчерпавшие
+        event_ingest_max_attempts попыток, и не поместившиеся в лимит буфера отбрасываются
+        """
+        retry = [(row, attempt + 1) for row, attempt in zip(rows, attempts)
+                 if attempt + 1 < settings.event_ingest_max_attempts]
+        exhausted = len(rows) - len(retry)
+        room = max(settings.event_ingest_max_pending - len(self._pending), 0)
+        overflow = max(len(retry) - room, 0)
+        self.dropped += exhausted
+        self.rejected += overflow
+        if exhausted:
+            print(f"Отброшено {exhausted} событий после {settings.event_ingest_max_attempts} попыток записи")
+        retry = retry[:room]
+        self._pending[:0] = [row for row, _ in retry]
+        self._attempts[:0] = [attempt for _, attempt in retry]
+
+    async def flush(self, session_factory=None) -> int:
+        """Сбросить накопленные события; при ошибке БД события возвращаются в буфер"""
+        session_factory = session_factory or self._session_factory
+        rows, self._pending = self._pending, []
+        attempts, self._attempts = self._attempts, []
+        batch_size = settings.event_ingest_batch_size
+        written = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                await self._write(session_factory, batch)
+                written += len(batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failures += 1
+                print(f"Ошибка при записи событий просмотров: {e}")
+                self._requeue(rows[start:], attempts[start:])
+                return written
+        self._failures = 0
+        return written
+
+    def _delay(self) -> float:
+        """Пауза до следующего сброса: удваивается с каждой ошибкой подряд"""
+        interval = settings.event_ingest_flush_interval
+        if not self._failures:
+            return interval
+        return min(interval * 2 ** self._failures, settings.event_ingest_max_backoff)
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+
+    async def run_flusher(self, session_factory) -> None:
+        """Фоновый цикл сброса буфера"""
+        self._session_factory = session_factory
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            if self._failures:
+                # После ошибки пауза выдерживается целиком: заполнение буфера ее не сокращает
+                deadline = loop.time() + self._delay()
+                while not self._stopping and loop.time() < deadline:
+                    await self._wait(deadline - loop.time())
+            else:
+                await self._wait(self._delay())
+            if self._pending:
+                await self.flush(session_factory)
+
+    def start(self, session_factory) -> None:
+        """Запустить фоновый сброс в текущем цикле событий"""
+        self._session_factory = session_factory
+        self._stopping = False
+        self._ready = asyncio.Event()
+        self._flusher = asyncio.create_task(self.run_flusher(session_factory))
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и записать остаток буфера"""
+        if self._flusher:
+            # Даем текущему сбросу завершиться, чтобы не потерять взятую пачку
+            self._stopping = True
+            self._ready.set()
+            await self._flusher
+            self._flusher = None
+        if self._pending and self._session_factory:
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "accepted": self.accepted,
+            "written": self.written,
+            "rejected": self.rejected,
+            "discarded": self.discarded,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "visitor_errors": self.visitor_errors
+        }
+
+
+event_buffer = EventIngestBuffer()
+event_guard = EventIngestGuard()
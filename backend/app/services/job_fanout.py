@@ -0,0 +1,77 @@
+"""
+Прогресс массовых задач воркера, разбитых на пачки.
+
+Массовая задача (статистика, переоценка) делит ID объектов на диапазоны
+и запускает по задаче на диапазон (Celery chord). Прогресс хранится в
+Redis-хеше jobs:fanout:{job_id}: пачки увеличивают счетчики атомарно
+(HINCRBY), поэтому состояние видно во время выполнения с любого процесса.
+Хеш живет FANOUT_TTL секунд после последнего изменения.
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.redis_client import get_redis
+
+
+FANOUT_KEY = "jobs:fanout:{job_id}"
+FANOUT_TTL = 24 * 3600
+MAX_ERROR_LENGTH = 500
+
+COUNTERS = ("total_chunks", "done_chunks", "failed_chunks", "retried_chunks", "processed", "updated")
+
+
+class FanoutProgress:
+    """Счетчики прогресса задач, разбитых на пачки"""
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return FANOUT_KEY.format(job_id=job_id)
+
+    async def _update(self, job_id: str, increments: Dict[str, int], fields: Optional[Dict[str, str]] = None) -> None:
+        key = self._key(job_id)
+        pipeline = get_redis().pipeline(transaction=True)
+        for field, amount in increments.items():
+            pipeline.hincrby(key, field, amount)
+        if fields:
+            pipeline.hset(key, mapping=fields)
+        pipeline.expire(key, FANOUT_TTL)
+        await pipeline.execute()
+
+    async def start(self, job_id: str, job: str, total_chunks: int) -> None:
+        """Зарегистрировать задачу с total_chunks пачками"""
+        await self._update(
+            job_id,
+            {"total_chunks": total_chunks},
+            {"job": job, "status": "running", "started_at": datetime.utcnow().isoformat()}
+        )
+
+    async def chunk_done(self, job_id: str, processed: int, updated: int) -> None:
+        await self._update(job_id, {"done_chunks": 1, "processed": processed, "updated": updated})
+
+    async def chunk_retried(self, job_id: str, error: str) -> None:
+        await self._update(job_id, {"retried_chunks": 1}, {"last_error": error[:MAX_ERROR_LENGTH]})
+
+    async def chunk_failed(self, job_id: str, error: str) -> None:
+        """Пачка исчерпала повторы; остальные пачки продолжают работу"""
+        await self._update(job_id, {"failed_chunks": 1}, {"last_error": error[:MAX_ERROR_LENGTH]})
+
+    async def finish(self, job_id: str) -> Dict[str, Any]:
+        """Отметить завершение всех пачек и вернуть итоговое состояние"""
+        progress = await self.get(job_id) or {}
+        status = "partial" if progress.get("failed_chunks") else "success"
+        await self._update(job_id, {}, {"status": status, "finished_at": datetime.utcnow().isoformat()})
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Состояние задачи или None, если она неизвестна или устарела"""
+        raw = await get_redis().hgetall(self._key(job_id))
+        if not raw:
+            return None
+        progress: Dict[str, Any] = {"job_id": job_id}
+        for field, value in raw.items():
+            field, value = field.decode(), value.decode()
+            progress[field] = int(value) if field in COUNTERS else value
+        return progress
+
+
+fanout_progress = FanoutProgress()
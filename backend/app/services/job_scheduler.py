@@ -0,0 +1,229 @@
+"""
+Планирование периодических задач воркера без наложения запусков.
+
+Celery beat вызывает задачи с базовым интервалом, а решение о запуске
+принимает эта прослойка:
+
+1. Адаптивный интервал. После каждого запуска интервал пересчитывается:
+   не меньше базового, не меньше сглаженной (EWMA) длительности запуска,
+   умноженной на job_runtime_factor, и растет с глубиной очередей брокера.
+   Сверху ограничен базовым интервалом × job_max_interval_factor. Вызов
+   beat раньше срока пропускается.
+2. Аренда (lease) в Redis: SET NX PX с токеном запуска; продлевается и
+   снимается только владельцем (Lua-скрипты сравнивают токен). Если
+   задача упала, аренда истекает через job_lease_ttl.
+3. Пересечение. Если аренда занята, запуск пропускается; для задач с
+   политикой coalesce вместо этого ставится флаг, и по завершении текущего
+   запуска той же задачи выполняется ровно один повторный (сколько бы
+   вызовов ни пришло). Флаг ставится, только если аренду держит запуск
+   этой же задачи; задача, заблокированная другой задачей с тем же
+   замком, просто выполнится на следующем тике beat.
+
+Состояние задачи (интервал, длительности, счетчики) хранится в хеше
+jobs:{job}:state, история последних запусков — в списке jobs:{job}:runs.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import json
+import time
+
+from app.config import settings
+from app.redis_client import get_redis
+from app.services.queue_monitor import queue_monitor
+
+
+OVERLAP_SKIP = "skip"
+OVERLAP_COALESCE = "coalesce"
+
+LEASE_KEY = "jobs:{lock}:lease"
+PENDING_KEY = "jobs:{job}:pending"
+STATE_KEY = "jobs:{job}:state"
+RUNS_KEY = "jobs:{job}:runs"
+
+# Продлить аренду, только если она принадлежит токену
+RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Снять аренду, только если она принадлежит токену
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+STATE_FLOATS = ("interval", "base_interval", "ewma_duration", "last_duration", "last_started_at", "last_finished_at")
+STATE_INTS = ("runs", "failures", "throttled", "skipped", "coalesced")
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    """Периодическая задача: имя, базовый интервал, политика пересечения и общий замок"""
+    name: str
+    base_interval: float
+    overlap: str = OVERLAP_SKIP
+    lock: Optional[str] = None  # Задачи с одним замком не выполняются одновременно
+
+    @property
+    def lock_name(self) -> str:
+        return self.lock or self.name
+
+
+# Периодические задачи: базовый интервал beat и поведение при пересечении запусков
+SCHEDULED_JOBS = {spec.name: spec for spec in (
+    JobSpec("stats", float(settings.stats_refresh_interval)),
+    JobSpec("unique_visitors", float(settings.unique_visitors_refresh_interval)),
+    JobSpec("district_stats", float(settings.district_stats_refresh_interval), OVERLAP_COALESCE, lock="district_stats"),
+    JobSpec("district_stats_full", float(settings.district_stats_full_refresh_interval), lock="district_stats"),
+    JobSpec("demand_clusters", float(settings.demand_clusters_interval), OVERLAP_COALESCE),
+    JobSpec("rollup_compaction", float(settings.rollup_compaction_interval), OVERLAP_COALESCE),
+    JobSpec("views_log_partitions", 86400.0),
+    JobSpec("dirty_pricing", float(settings.pricing_dirty_scan_interval), OVERLAP_COALESCE),
+    JobSpec("pricing_full", float(settings.pricing_full_scan_interval)),
+)}
+
+
+class JobScheduler:
+    """Аренды, адаптивные интервалы и история запусков периодических задач"""
+
+    @staticmethod
+    async def _queue_depth() -> int:
+        """Количество задач во всех очередях брокера"""
+        try:
+            return await queue_monitor.total_depth()
+        except Exception:
+            return 0
+
+    async def _next_interval(self, spec: JobSpec, ewma_duration: float) -> float:
+        base = spec.base_interval
+        interval = max(base, ewma_duration * settings.job_runtime_factor)
+        backlog = await self._queue_depth()
+        interval *= 1 + backlog / max(settings.job_backlog_threshold, 1)
+        return min(interval, base * settings.job_max_interval_factor)
+
+    async def try_start(self, spec: JobSpec, token: str, force: bool = False) -> Optional[str]:
+        """
+        Пытается начать запуск; возвращает None при успехе или причину пропуска:
+        throttled (адаптивный интервал не истек), running (запуск уже идет)
+        """
+        redis = get_redis()
+        state_key = STATE_KEY.format(job=spec.name)
+        now = time.time()
+        if not force:
+            last_started, interval = await redis.hmget(state_key, "last_started_at", "interval")
+            interval = float(interval) if interval else spec.base_interval
+            # Небольшой допуск на неточность тиков beat
+            if last_started and now - float(last_started) < interval - min(1.0, spec.base_interval * 0.05):
+                await redis.hincrby(state_key, "throttled", 1)
+                return "throttled"
+
+        lease_key = LEASE_KEY.format(lock=spec.lock_name)
+        acquired = await redis.set(lease_key, token, nx=True, px=settings.job_lease_ttl * 1000)
+        if not acquired:
+            coalesce = False
+            if spec.overlap == OVERLAP_COALESCE:
+                # Флаг снимает только finish этой же задачи, поэтому при чужой аренде его не ставим
+                pipeline = redis.pipeline(transaction=True)
+                pipeline.get(lease_key)
+                pipeline.hget(state_key, "running_token")
+                holder, running_token = await pipeline.execute()
+                coalesce = holder is not None and holder == running_token
+            if coalesce:
+                await redis.set(PENDING_KEY.format(job=spec.name), 1, ex=settings.job_lease_ttl)
+                await redis.hincrby(state_key, "coalesced", 1)
+            else:
+                await redis.hincrby(state_key, "skipped", 1)
+            return "running"
+
+        await redis.hset(state_key, mapping={
+            "base_interval": spec.base_interval,
+            "last_started_at": now,
+            "running_token": token,
+            "status": "running"
+        })
+        return None
+
+    async def renew(self, spec: JobSpec, token: str) -> bool:
+        """Продлевает аренду длинного запуска"""
+        renewed = await get_redis().eval(
+            RENEW_SCRIPT, 1, LEASE_KEY.format(lock=spec.lock_name), token, settings.job_lease_ttl * 1000
+        )
+        return bool(renewed)
+
+    async def finish(self, spec: JobSpec, token: str, status: str = "success") -> Optional[float]:
+        """
+        Завершает запуск: записывает длительность, пересчитывает интервал и снимает
+        аренду. Возвращает задержку повторного запуска, если за время работы пришли
+        вызовы задачи с политикой coalesce, иначе None
+        """
+        redis = get_redis()
+        state_key = STATE_KEY.format(job=spec.name)
+        now = time.time()
+        started, ewma = await redis.hmget(state_key, "last_started_at", "ewma_duration")
+        duration = now - float(started) if started else 0.0
+        alpha = settings.job_duration_smoothing
+        ewma = duration if ewma is None else alpha * duration + (1 - alpha) * float(ewma)
+        interval = await self._next_interval(spec, ewma)
+
+        run = {
+            "started_at": datetime.utcfromtimestamp(now - duration).isoformat(),
+            "duration": round(duration, 3),
+            "status": status,
+            "interval": round(interval, 3)
+        }
+        pipeline = redis.pipeline(transaction=True)
+        pipeline.hset(state_key, mapping={
+            "last_duration": duration,
+            "ewma_duration": ewma,
+            "interval": interval,
+            "last_finished_at": now,
+            "status": status
+        })
+        pipeline.hdel(state_key, "running_token")
+        pipeline.hincrby(state_key, "runs", 1)
+        if status not in ("success", "no_change"):
+            pipeline.hincrby(state_key, "failures", 1)
+        pipeline.lpush(RUNS_KEY.format(job=spec.name), json.dumps(run))
+        pipeline.ltrim(RUNS_KEY.format(job=spec.name), 0, settings.job_run_history - 1)
+        await pipeline.execute()
+
+        await redis.eval(RELEASE_SCRIPT, 1, LEASE_KEY.format(lock=spec.lock_name), token)
+        if await redis.getdel(PENDING_KEY.format(job=spec.name)):
+            return 0.0
+        return None
+
+    async def get_state(self, spec: JobSpec) -> Dict[str, Any]:
+        """Состояние задачи для мониторинга"""
+        raw = await get_redis().hgetall(STATE_KEY.format(job=spec.name))
+        state: Dict[str, Any] = {
+            "job": spec.name,
+            "base_interval": spec.base_interval,
+            "interval": spec.base_interval,
+            "overlap": spec.overlap,
+            "lock": spec.lock_name
+        }
+        for field, value in raw.items():
+            field, value = field.decode(), value.decode()
+            if field in STATE_FLOATS:
+                state[field] = float(value)
+            elif field in STATE_INTS:
+                state[field] = int(value)
+            else:
+                state[field] = value
+        for field in ("last_started_at", "last_finished_at"):
+            if field in state:
+                state[field] = datetime.utcfromtimestamp(state[field])
+        return state
+
+    async def get_runs(self, spec: JobSpec, limit: int = 20) -> List[Dict[str, Any]]:
+        """Последние запуски задачи, новые первыми"""
+        runs = await get_redis().lrange(RUNS_KEY.format(job=spec.name), 0, limit - 1)
+        return [json.loads(run) for run in runs]
+
+
+job_scheduler = JobScheduler()
@@ -0,0 +1,146 @@
+"""
+Кэш результатов ИИ-подбора.
+
+Ключ строится по нормализованному запросу: списки городов и районов
+сортируются, бюджет в ключе округляется до settings.match_cache_budget_granularity.
+Подбор выполняется по точному бюджету, а при попадании в кэш результат
+дофильтровывается по бюджету запроса. Два уровня: процессный LRU и Redis.
+Инвалидация — через счетчик версии в Redis, входящий в ключ. Перед расчетом
+результата для новой версии снимок каталога догоняет изменения
+(CatalogSnapshot.sync), иначе в кэш под новой версией попал бы старый снимок.
+"""
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import time
+
+from app.cache import LRUCache
+from app.config import settings
+from app.redis_client import get_redis
+from app.schemas import PropertyMatchRequest
+
+
+VERSION_KEY = "ai_matching:cache:version"
+RESULT_KEY_PREFIX = "ai_matching:result:"
+
+
+class MatchResultCache:
+    """Двухуровневый кэш результатов подбора"""
+
+    def __init__(self):
+        self.local = LRUCache(max_size=settings.match_cache_max_size, ttl=settings.match_cache_ttl)
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self._version = 0
+        self._version_checked_at = 0.0
+
+    @property
+    def version(self) -> int:
+        """Последняя известная процессу версия кэша"""
+        return self._version
+
+    @staticmethod
+    def normalize(request: PropertyMatchRequest) -> PropertyMatchRequest:
+        """Приводит запрос к канонической форме"""
+        return request.model_copy(update={
+            "preferred_cities": sorted(set(request.preferred_cities)),
+            "preferred_districts": sorted(set(request.preferred_districts)) if request.preferred_districts else None
+        })
+
+    async def _current_version(self) -> int:
+        """Версия кэша; проверяется в Redis не чаще раза в match_cache_version_check_interval"""
+        now = time.monotonic()
+        if now - self._version_checked_at < settings.match_cache_version_check_interval:
+            return self._version
+        self._version_checked_at = now
+        try:
+            version = int(await get_redis().get(VERSION_KEY) or 0)
+        except Exception:
+            self.redis_errors += 1
+            return self._version
+        if version != self._version:
+            self.local.clear()
+            self._version = version
+        return version
+
+    async def make_key(self, request: PropertyMatchRequest, limit: int) -> str:
+        """Ключ кэша для нормализованного запроса; бюджет округляется только в ключе"""
+        granularity = settings.match_cache_budget_granularity
+        key_request = request.model_dump(mode="json")
+        if granularity > 0:
+            key_request["budget"] = max(granularity, round(request.budget / granularity) * granularity)
+        payload = json.dumps(
+            {"request": key_request, "limit": limit},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return f"{await self._current_version()}:{digest}"
+
+    @staticmethod
+    def within_budget(payload: bytes, budget: float) -> bytes:
+        """
+        Убирает из результата объекты дороже бюджета запроса: результат мог быть
+        рассчитан для другого бюджета из того же шага округления
+        """
+        ceiling = budget * settings.ai_matching_budget_overshoot
+        items = json.loads(payload)
+        kept = [
+            item for item in items
+            if not item.get("price") or item["price"]["current_price"] <= ceiling
+        ]
+        if len(kept) == len(items):
+            return payload
+        return json.dumps(kept, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Получить сериализованный результат"""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = await get_redis().get(RESULT_KEY_PREFIX + key)
+        except Exception:
+            self.redis_errors += 1
+            return None
+        if value is not None:
+            self.redis_hits += 1
+            self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        """Сохранить сериализованный результат на обоих уровнях"""
+        self.local.set(key, value)
+        try:
+            await get_redis().set(RESULT_KEY_PREFIX + key, value, ex=settings.match_cache_ttl)
+        except Exception:
+            self.redis_errors += 1
+
+    async def invalidate(self) -> None:
+        """Сбросить кэш во всех процессах (при изменении цен или статусов)"""
+        self.local.clear()
+        try:
+            self._version = int(await get_redis().incr(VERSION_KEY))
+        except Exception:
+            self.redis_errors += 1
+            self._version += 1
+        self._version_checked_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий для подбора гранулярности бюджета"""
+        local = self.local.stats()
+        misses = local["misses"] - self.redis_hits
+        total = local["hits"] + self.redis_hits + misses
+        return {
+            "local_hits": local["hits"],
+            "redis_hits": self.redis_hits,
+            "misses": misses,
+            "hit_ratio": round((local["hits"] + self.redis_hits) / total, 4) if total else 0.0,
+            "local_size": local["size"],
+            "redis_errors": self.redis_errors,
+            "version": self._version,
+            "budget_granularity": settings.match_cache_budget_granularity
+        }
+
+
+match_cache = MatchResultCache()
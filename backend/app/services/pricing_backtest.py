@@ -0,0 +1,446 @@
+"""
+Бэктест конфигурации динамического ценообразования на исторических данных.
+
+События (просмотры, избранное, бронирования) и изменения цен загружаются
+сгруппированными запросами в разреженном виде (объект, интервал, количество).
+Симуляция идет по интервалам: в конце каждого интервала объекты
+переоцениваются с параметрами конфигурации-кандидата, новая цена действует
+со следующего интервала. Суммы событий в скользящих окнах поддерживаются
+инкрементально, поэтому память — O(объектов + событий), а не «объект × интервал».
+
+Это отдельная модель, а не воспроизведение боевого движка. С ним общие
+только формулы цены из pricing_math: корректировка по отклонению спроса от
+медианы, ограничения от базовой цены и за шаг, правила частоты изменений.
+Спрос считается weighted_demand_scores с весами k1/k2/k3 кандидата, включая
+добавления в избранное, а медиана кластера — по симулированному спросу
+остальных объектов кластера. Боевой движок использует demand_scores
+(0.3 просмотры / 0.7 бронирования) и медианы из cluster_demand_stats.
+Поэтому результат помечен полем model (BACKTEST_MODEL) и годится для
+сравнения конфигураций между собой, а не для прогноза боевых цен.
+
+Спрос воспроизводится как есть: бронирования не зависят от симулированной
+цены, поэтому разница выручки — это эффект цены при том же спросе.
+Кластеры (проект + комнаты) независимы, поэтому объекты обрабатываются
+пачками целых кластеров.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import math
+import time
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud import CRUDDynamicPricing, crud_dynamic_pricing_config
+from app.models import ViewEvent
+from app.schemas import (
+    PricingBacktestConfig, PricingBacktestRequest, PricingBacktestResult, PricingBacktestCluster
+)
+from app.services.pricing_config import pricing_config_cache
+from app.services.pricing_math import (
+    DEMAND_WINDOW_DAYS, weighted_demand_scores, cluster_medians_excluding_self,
+    price_adjustments, apply_price_limits, apply_step_limits
+)
+
+
+# Метка модели симуляции в результате бэктеста
+BACKTEST_MODEL = "weighted_demand_simulated_medians"
+
+DEFAULT_PERIOD_DAYS = 365
+MAX_BUCKETS = 20000
+CHUNK_PROPERTIES = 20000  # Примерный размер пачки объектов (кластеры не делятся)
+BOOKING_BLOCK_HOURS = 24  # Не менять цену в течение суток после бронирования
+
+
+@dataclass
+class BacktestData:
+    """Исторические данные в колоночном виде; объекты отсортированы по кластеру"""
+    cluster_codes: np.ndarray  # (P,) код кластера
+    base_prices: np.ndarray  # (P,)
+    start_prices: np.ndarray  # (P,) цена на начало периода
+    # Разреженные счетчики событий: индекс объекта, индекс интервала, количество
+    views: tuple
+    leads: tuple
+    bookings: tuple
+    # Изменения цен в периоде: индекс объекта, индекс интервала периода, новая цена
+    price_changes: tuple
+    warmup_buckets: int  # Интервалы до начала периода для окна спроса
+    period_buckets: int
+    n_clusters: int
+
+
+@dataclass
+class BacktestParams:
+    k1: float
+    k2: float
+    k3: float
+    min_price_change: float
+    max_price_change: float
+    interval_buckets: int
+    booking_block_buckets: int
+    max_shift_percent: float
+
+
+def _sparse(property_index: np.ndarray, bucket: np.ndarray, count: np.ndarray) -> tuple:
+    """Разреженные счетчики, отсортированные по индексу объекта"""
+    order = np.argsort(property_index, kind="stable")
+    return property_index[order], bucket[order], count[order]
+
+
+class _BucketEvents:
+    """События пачки объектов [lo, hi), упорядоченные по интервалу"""
+
+    def __init__(self, sparse: tuple, lo: int, hi: int, n_buckets: int):
+        property_index, bucket, count = sparse
+        left, right = np.searchsorted(property_index, [lo, hi])
+        order = np.argsort(bucket[left:right], kind="stable")
+        self.index = property_index[left:right][order] - lo
+        self.count = count[left:right][order].astype(np.float64)
+        self.offsets = np.searchsorted(bucket[left:right][order], np.arange(n_buckets + 1))
+        self.size = hi - lo
+
+    def between(self, first: int, last: int) -> np.ndarray:
+        """Сумма событий объектов в интервалах [first, last)"""
+        first, last = max(first, 0), max(min(last, len(self.offsets) - 1), 0)
+        if first >= last:
+            return np.zeros(self.size)
+        start, end = self.offsets[first], self.offsets[last]
+        # bincount пустого среза возвращает целые числа
+        counts = np.bincount(self.index[start:end], weights=self.count[start:end], minlength=self.size)
+        return counts.astype(np.float64, copy=False)
+
+    def at(self, bucket: int) -> np.ndarray:
+        """Количество событий объектов в интервале bucket"""
+        return self.between(bucket, bucket + 1)
+
+
+class _RollingSum:
+    """Сумма событий объектов в окне из width интервалов, заканчивающемся текущим"""
+
+    def __init__(self, events: _BucketEvents, first_bucket: int, width: int):
+        self.events = events
+        self.width = width
+        # Окно перед первым интервалом: [first_bucket - width, first_bucket)
+        self.total = events.between(first_bucket - width, first_bucket)
+
+    def advance(self, bucket: int, added: Optional[np.ndarray] = None) -> np.ndarray:
+        """Сдвигает окно так, чтобы оно заканчивалось интервалом bucket"""
+        self.total += self.events.at(bucket) if added is None else added
+        self.total -= self.events.at(bucket - self.width)
+        return self.total
+
+
+class _ActualPrices:
+    """Фактические цены объектов [lo, hi) на начало интервалов периода"""
+
+    def __init__(self, data: BacktestData, lo: int, hi: int):
+        self.price = data.start_prices[lo:hi].copy()
+        property_index, bucket, new_price = data.price_changes
+        mask = (property_index >= lo) & (property_index < hi) & (bucket + 1 < data.period_buckets)
+        # Изменения в хронологическом порядке; цена действует со следующего интервала
+        order = np.argsort(bucket[mask], kind="stable")
+        self.index = property_index[mask][order] - lo
+        self.step = bucket[mask][order] + 1
+        self.value = new_price[mask][order]
+        self.offsets = np.searchsorted(self.step, np.arange(data.period_buckets + 1))
+
+    def at(self, step: int) -> np.ndarray:
+        """Цены на начало интервала step; шаги запрашиваются по порядку"""
+        start, end = self.offsets[step], self.offsets[step + 1]
+        if start < end:
+            # В интервале остается последнее изменение объекта
+            index = self.index[start:end][::-1]
+            _, last = np.unique(index, return_index=True)
+            self.price[index[last]] = self.value[start:end][::-1][last]
+        return self.price
+
+
+def _chunks(cluster_codes: np.ndarray, size: int):
+    """Границы пачек объектов, не разрывающие кластеры"""
+    n = len(cluster_codes)
+    lo = 0
+    while lo < n:
+        hi = min(lo + size, n)
+        if hi < n:
+            # Расширяем пачку до конца кластера
+            hi = int(np.searchsorted(cluster_codes, cluster_codes[hi - 1], side="right"))
+        yield lo, hi
+        lo = hi
+
+
+def simulate(data: BacktestData, params: BacktestParams) -> Dict[str, np.ndarray]:
+    """
+    Пошаговая симуляция цен. Возвращает агрегаты по кластерам:
+    выручку, число изменений цен и суммы цен по интервалам периода
+    """
+    n_clusters, n_period = data.n_clusters, data.period_buckets
+    warmup = data.warmup_buckets
+    n_buckets = warmup + n_period
+    window = warmup
+
+    totals = {
+        "property_count": np.bincount(data.cluster_codes, minlength=n_clusters),
+        "bookings": np.zeros(n_clusters, dtype=np.int64),
+        "actual_revenue": np.zeros(n_clusters),
+        "simulated_revenue": np.zeros(n_clusters),
+        "actual_price_changes": np.zeros(n_clusters, dtype=np.int64),
+        "simulated_price_changes": np.zeros(n_clusters, dtype=np.int64),
+        "actual_price_sum": np.zeros((n_clusters, n_period)),
+        "simulated_price_sum": np.zeros((n_clusters, n_period)),
+    }
+
+    for lo, hi in _chunks(data.cluster_codes, CHUNK_PROPERTIES):
+        codes = data.cluster_codes[lo:hi]
+        first_cluster = int(codes[0])
+        local_codes = codes - first_cluster
+        n_local = int(local_codes[-1]) + 1
+        cluster_slice = slice(first_cluster, first_cluster + n_local)
+        # Объекты отсортированы по кластеру: начала групп для reduceat
+        group_starts = np.searchsorted(local_codes, np.arange(n_local))
+
+        views = _BucketEvents(data.views, lo, hi, n_buckets)
+        leads = _BucketEvents(data.leads, lo, hi, n_buckets)
+        bookings = _BucketEvents(data.bookings, lo, hi, n_buckets)
+        change_index = data.price_changes[0]
+        in_chunk = change_index[(change_index >= lo) & (change_index < hi)] - lo
+        totals["actual_price_changes"][cluster_slice] = np.bincount(local_codes[in_chunk], minlength=n_local)
+
+        # Факт и симуляция по интервалам; окна спроса и блокировки после бронирования сдвигаются
+        actual = _ActualPrices(data, lo, hi)
+        window_views = _RollingSum(views, warmup, window)
+        window_leads = _RollingSum(leads, warmup, window)
+        window_bookings = _RollingSum(bookings, warmup, window)
+        block_bookings = _RollingSum(bookings, warmup, params.booking_block_buckets)
+        base_prices = data.base_prices[lo:hi]
+        price = data.start_prices[lo:hi].copy()
+        last_change = np.full(hi - lo, -params.interval_buckets, dtype=np.int64)
+        actual_sum = np.zeros((n_local, n_period))
+        simulated_sum = np.zeros((n_local, n_period))
+        actual_revenue = np.zeros(hi - lo)
+        simulated_revenue = np.zeros(hi - lo)
+        period_bookings = np.zeros(hi - lo)
+        changes = np.zeros(hi - lo, dtype=np.int64)
+
+        for step in range(n_period):
+            t = warmup + step
+            step_bookings = bookings.at(t)
+            actual_price = actual.at(step)
+            actual_sum[:, step] = np.add.reduceat(actual_price, group_starts)
+            actual_revenue += step_bookings * actual_price
+            simulated_sum[:, step] = np.add.reduceat(price, group_starts)
+            simulated_revenue += step_bookings * price
+            period_bookings += step_bookings
+
+            # Переоценка в конце интервала по окну спроса, включающему его
+            demand = weighted_demand_scores(
+                window_views.advance(t),
+                window_leads.advance(t),
+                window_bookings.advance(t, step_bookings),
+                params.k1, params.k2, params.k3
+            )
+            median_demand = cluster_medians_excluding_self(local_codes, demand)
+            new_prices = price_adjustments(price, demand, median_demand)
+            new_prices = apply_price_limits(new_prices, base_prices, params.max_shift_percent)
+            new_prices, _ = apply_step_limits(
+                new_prices, price, params.min_price_change, params.max_price_change
+            )
+
+            recently_booked = block_bookings.advance(t, step_bookings) > 0
+            eligible = (
+                (t - last_change >= params.interval_buckets)
+                & ~recently_booked
+                & (np.abs(new_prices - price) >= 0.01)
+            )
+            price = np.where(eligible, new_prices, price)
+            last_change[eligible] = t
+            changes += eligible
+
+        totals["actual_price_sum"][cluster_slice] = actual_sum
+        totals["actual_revenue"][cluster_slice] = np.bincount(local_codes, weights=actual_revenue, minlength=n_local)
+        totals["bookings"][cluster_slice] = np.bincount(
+            local_codes, weights=period_bookings, minlength=n_local
+        ).round().astype(np.int64)
+        totals["simulated_price_sum"][cluster_slice] = simulated_sum
+        totals["simulated_revenue"][cluster_slice] = np.bincount(
+            local_codes, weights=simulated_revenue, minlength=n_local
+        )
+        totals["simulated_price_changes"][cluster_slice] = np.bincount(
+            local_codes, weights=changes, minlength=n_local
+        ).astype(np.int64)
+
+    return totals
+
+
+def _delta_percent(actual: float, simulated: float) -> float:
+    return round((simulated - actual) / actual * 100, 2) if actual else 0.0
+
+
+class PricingBacktestService:
+    """Офлайн-симулятор конфигурации динамического ценообразования"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.crud = CRUDDynamicPricing(session)
+
+    async def _resolve_config(self, request: PricingBacktestRequest) -> PricingBacktestConfig:
+        """Конфигурация-кандидат из запроса, по ID или активная"""
+        if request.config is not None:
+            return request.config
+        if request.config_id is not None:
+            config = await crud_dynamic_pricing_config.get(self.session, request.config_id)
+            if not config:
+                raise LookupError("Configuration not found")
+        else:
+            config = await pricing_config_cache.get(self.session)
+        if not config:
+            return PricingBacktestConfig()
+        return PricingBacktestConfig(
+            k1=config.k1,
+            k2=config.k2,
+            k3=config.k3,
+            min_price_change=config.min_price_change,
+            max_price_change=config.max_price_change,
+            update_interval_hours=config.update_interval_hours
+        )
+
+    async def _load(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket_hours: int,
+        project_ids: Optional[List[int]]
+    ) -> tuple:
+        """Загружает данные периода сгруппированными запросами"""
+        bucket_seconds = bucket_hours * 3600
+        warmup = math.ceil(DEMAND_WINDOW_DAYS * 24 / bucket_hours)
+        period = math.ceil((end - start).total_seconds() / bucket_seconds)
+        if warmup + period > MAX_BUCKETS:
+            raise ValueError(f"Too many time buckets: {warmup + period} > {MAX_BUCKETS}")
+        warmup_start = start - timedelta(seconds=warmup * bucket_seconds)
+
+        properties = await self.crud.get_backtest_properties(project_ids)
+
+        # Кластеры (проект + комнаты); объекты упорядочиваются по коду кластера
+        cluster_keys: Dict[tuple, int] = {}
+        codes = np.array(
+            [cluster_keys.setdefault((row.project_id, row.rooms), len(cluster_keys)) for row in properties],
+            dtype=np.int64
+        )
+        order = np.argsort(codes, kind="stable")
+        property_ids = np.array([row.id for row in properties], dtype=np.int64)[order]
+        index_by_id = {int(property_id): i for i, property_id in enumerate(property_ids)}
+        base_prices = np.array([row.base_price for row in properties], dtype=np.float64)[order]
+        start_prices = np.array([row.current_price for row in properties], dtype=np.float64)[order]
+
+        # Цена на начало периода — old_price первого изменения после start
+        changes = await self.crud.get_price_changes_since(start, project_ids)
+        seen = set()
+        change_index, change_bucket, change_price = [], [], []
+        for row in changes:
+            i = index_by_id.get(row.property_id)
+            if i is None:
+                continue
+            if i not in seen:
+                seen.add(i)
+                start_prices[i] = row.old_price
+            if row.changed_at < end:
+                change_index.append(i)
+                change_bucket.append(int((row.changed_at - start).total_seconds() // bucket_seconds))
+                change_price.append(row.new_price)
+
+        views_rows = await self.crud.get_bucketed_views(warmup_start, end, bucket_seconds, project_ids)
+        booking_rows = await self.crud.get_bucketed_bookings(warmup_start, end, bucket_seconds, project_ids)
+
+        def _events(rows, event: Optional[ViewEvent] = None) -> tuple:
+            selected = [
+                (index_by_id[row[0]], row[-2], row[-1]) for row in rows
+                if row[0] in index_by_id and (event is None or row[1] == event)
+            ]
+            array = np.array(selected, dtype=np.int64).reshape(-1, 3)
+            return _sparse(array[:, 0], array[:, 1], array[:, 2])
+
+        data = BacktestData(
+            cluster_codes=codes[order],
+            base_prices=base_prices,
+            start_prices=start_prices,
+            views=_events(views_rows, ViewEvent.VIEW),
+            leads=_events(views_rows, ViewEvent.FAVOURITE),
+            bookings=_events(booking_rows),
+            price_changes=(
+                np.array(change_index, dtype=np.int64),
+                np.array(change_bucket, dtype=np.int64),
+                np.array(change_price, dtype=np.float64)
+            ),
+            warmup_buckets=warmup,
+            period_buckets=period,
+            n_clusters=len(cluster_keys)
+        )
+        # Коды кластеров выданы по порядку, поэтому список ключей индексируется кодом
+        return data, list(cluster_keys)
+
+    async def run(self, request: PricingBacktestRequest) -> PricingBacktestResult:
+        """Прогоняет конфигурацию на исторических данных"""
+        started = time.monotonic()
+        config = await self._resolve_config(request)
+        end = request.end or datetime.utcnow()
+        start = request.start or end - timedelta(days=DEFAULT_PERIOD_DAYS)
+        if start >= end:
+            raise ValueError("start must be earlier than end")
+
+        data, clusters = await self._load(start, end, request.bucket_hours, request.project_ids)
+        params = BacktestParams(
+            k1=config.k1,
+            k2=config.k2,
+            k3=config.k3,
+            min_price_change=config.min_price_change,
+            max_price_change=config.max_price_change,
+            interval_buckets=max(1, math.ceil(config.update_interval_hours / request.bucket_hours)),
+            booking_block_buckets=max(1, math.ceil(BOOKING_BLOCK_HOURS / request.bucket_hours)),
+            max_shift_percent=settings.price_max_shift
+        )
+        totals = await asyncio.to_thread(simulate, data, params) if len(clusters) else None
+
+        cluster_results = []
+        for code, (project_id, rooms) in enumerate(clusters):
+            count = int(totals["property_count"][code])
+            actual_revenue = float(totals["actual_revenue"][code])
+            simulated_revenue = float(totals["simulated_revenue"][code])
+            cluster = PricingBacktestCluster(
+                project_id=project_id,
+                rooms=rooms,
+                property_count=count,
+                bookings=int(totals["bookings"][code]),
+                actual_revenue=actual_revenue,
+                simulated_revenue=simulated_revenue,
+                revenue_delta=simulated_revenue - actual_revenue,
+                revenue_delta_percent=_delta_percent(actual_revenue, simulated_revenue),
+                actual_price_changes=int(totals["actual_price_changes"][code]),
+                simulated_price_changes=int(totals["simulated_price_changes"][code])
+            )
+            if request.include_paths:
+                cluster.actual_price_path = np.round(totals["actual_price_sum"][code] / count, 2).tolist()
+                cluster.simulated_price_path = np.round(totals["simulated_price_sum"][code] / count, 2).tolist()
+            cluster_results.append(cluster)
+
+        actual_revenue = sum(cluster.actual_revenue for cluster in cluster_results)
+        simulated_revenue = sum(cluster.simulated_revenue for cluster in cluster_results)
+        return PricingBacktestResult(
+            model=BACKTEST_MODEL,
+            config=config,
+            start=start,
+            end=end,
+            bucket_hours=request.bucket_hours,
+            buckets=data.period_buckets,
+            property_count=len(data.base_prices),
+            actual_revenue=actual_revenue,
+            simulated_revenue=simulated_revenue,
+            revenue_delta=simulated_revenue - actual_revenue,
+            revenue_delta_percent=_delta_percent(actual_revenue, simulated_revenue),
+            actual_price_changes=sum(cluster.actual_price_changes for cluster in cluster_results),
+            simulated_price_changes=sum(cluster.simulated_price_changes for cluster in cluster_results),
+            elapsed_seconds=round(time.monotonic() - started, 3),
+            clusters=cluster_results
+        )
@@ -0,0 +1,119 @@
+"""
+Процессный кэш активной конфигурации динамического ценообразования.
+
+Конфигурация загружается из БД один раз и хранится как отсоединенный
+от сессии объект вместе с версией, на которую она актуальна. Изменение
+конфигурации увеличивает счетчик версии в Redis и публикует новую версию
+в канал pub/sub. Каждый процесс (API и воркеры Celery) слушает канал в
+фоновом потоке и помечает кэш устаревшим; TTL страхует от пропущенных
+сообщений, если слушатель не запущен или был отключен от Redis.
+"""
+from typing import Optional
+import threading
+import time
+
+import redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud import crud_dynamic_pricing_config
+from app.models import DynamicPricingConfig
+from app.redis_client import get_redis
+
+
+VERSION_KEY = "pricing:config:version"
+INVALIDATE_CHANNEL = "pricing:config:invalidate"
+LISTENER_RECONNECT_DELAY = 5.0
+
+
+class PricingConfigCache:
+    """Кэш активной конфигурации с версией и инвалидацией через Redis pub/sub"""
+
+    def __init__(self):
+        self._config: Optional[DynamicPricingConfig] = None
+        self._loaded = False
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        self._version = 0  # Последняя известная версия; меняется слушателем
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._loaded
+            and self._loaded_version == self._version
+            and time.monotonic() - self._loaded_at < settings.pricing_config_cache_ttl
+        )
+
+    async def get(self, session: AsyncSession) -> Optional[DynamicPricingConfig]:
+        """Активная конфигурация; БД запрашивается только при устаревшем кэше"""
+        if self._is_fresh():
+            return self._config
+        # Версия фиксируется до запроса: инвалидация во время загрузки не потеряется
+        version = self._version
+        config = await crud_dynamic_pricing_config.get_active(session)
+        self._config = DynamicPricingConfig(**config.model_dump()) if config else None
+        self._loaded = True
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+        return self._config
+
+    def mark_stale(self, version: Optional[int] = None) -> None:
+        """Пометить кэш устаревшим (вызывается слушателем и при локальных изменениях)"""
+        self._version = max(self._version + 1, version or 0)
+
+    async def invalidate(self) -> None:
+        """Сбросить кэш во всех процессах после изменения конфигурации"""
+        self.mark_stale()
+        try:
+            client = get_redis()
+            version = int(await client.incr(VERSION_KEY))
+            await client.publish(INVALIDATE_CHANNEL, version)
+        except Exception as e:
+            # Остальные процессы обновятся по TTL
+            print(f"Ошибка при публикации инвалидации конфигурации ценообразования: {e}")
+
+    def _listen(self) -> None:
+        """Цикл слушателя канала инвалидации; переподключается при ошибках Redis"""
+        while not self._stop.is_set():
+            client = None
+            try:
+                client = redis.Redis.from_url(settings.redis_url)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATE_CHANNEL)
+                # Пока слушатель был отключен, сообщения могли быть пропущены
+                self.mark_stale()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self.mark_stale(int(message["data"]))
+            except Exception as e:
+                print(f"Ошибка слушателя инвалидации конфигурации ценообразования: {e}")
+                self._stop.wait(LISTENER_RECONNECT_DELAY)
+            finally:
+                if client is not None:
+                    client.close()
+
+    def start_listener(self) -> None:
+        """Запустить фоновый поток слушателя (после fork в воркерах Celery)"""
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(
+            target=self._listen, name="pricing-config-listener", daemon=True
+        )
+        self._listener.start()
+
+    def stop_listener(self) -> None:
+        """Остановить фоновый поток слушателя"""
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=2.0)
+            self._listener = None
+
+
+pricing_config_cache = PricingConfigCache()
@@ -0,0 +1,167 @@
+"""
+Векторизованные формулы динамического ценообразования.
+
+Функции работают с массивами NumPy и используются как пакетным движком
+переоценки, так и скалярными методами DynamicPricingService. reprice_arrays
+объединяет формулы пакетной переоценки в одно ядро для compute_pool.
+"""
+from typing import Tuple
+import numpy as np
+
+
+# Оценка спроса: хорошие показатели — 100 просмотров и 5 бронирований за 30 дней
+DEMAND_WINDOW_DAYS = 30
+DEMAND_VIEWS_TARGET = 100.0
+DEMAND_BOOKINGS_TARGET = 5.0
+DEMAND_VIEWS_WEIGHT = 0.3
+DEMAND_BOOKINGS_WEIGHT = 0.7
+DEMAND_LEADS_TARGET = 20.0  # Добавления в избранное за 30 дней
+
+# Корректировка цены
+MAX_ADJUSTMENT = 0.10  # Максимальное изменение цены (10%)
+DEMAND_THRESHOLD = 0.2  # Порог разницы в спросе для изменения цены
+PRICE_ROUNDING = 1000.0  # Округление до тысяч
+
+
+def demand_scores(views: np.ndarray, bookings: np.ndarray) -> np.ndarray:
+    """Оценка спроса 0..100 по просмотрам и бронированиям"""
+    normalized_views = np.minimum(np.asarray(views, dtype=np.float64) / DEMAND_VIEWS_TARGET, 1.0)
+    normalized_bookings = np.minimum(np.asarray(bookings, dtype=np.float64) / DEMAND_BOOKINGS_TARGET, 1.0)
+    return (normalized_views * DEMAND_VIEWS_WEIGHT + normalized_bookings * DEMAND_BOOKINGS_WEIGHT) * 100
+
+
+def weighted_demand_scores(
+    views: np.ndarray,
+    leads: np.ndarray,
+    bookings: np.ndarray,
+    k1: float,
+    k2: float,
+    k3: float
+) -> np.ndarray:
+    """
+    Оценка спроса 0..100 с весами конфигурации: k1 — просмотры,
+    k2 — добавления в избранное, k3 — бронирования
+    """
+    total = k1 + k2 + k3
+    views = np.asarray(views, dtype=np.float64)
+    if total <= 0:
+        return np.zeros_like(views)
+    normalized_views = np.minimum(views / DEMAND_VIEWS_TARGET, 1.0)
+    normalized_leads = np.minimum(np.asarray(leads, dtype=np.float64) / DEMAND_LEADS_TARGET, 1.0)
+    normalized_bookings = np.minimum(np.asarray(bookings, dtype=np.float64) / DEMAND_BOOKINGS_TARGET, 1.0)
+    return (normalized_views * k1 + normalized_leads * k2 + normalized_bookings * k3) / total * 100
+
+
+def cluster_medians_excluding_self(cluster_keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Медиана значений кластера без учета самого элемента.
+    NaN в values означает отсутствие значения: элемент не участвует в медианах,
+    но медиану своего кластера получает. Пустой кластер дает 0.
+    """
+    cluster_keys = np.asarray(cluster_keys)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return np.zeros(0)
+
+    valid = ~np.isnan(values)
+    _, key_codes = np.unique(cluster_keys, return_inverse=True)
+    key_codes = key_codes.reshape(-1)
+
+    # Отсортированные валидные значения, сгруппированные по кластерам
+    valid_idx = np.flatnonzero(valid)
+    order = valid_idx[np.lexsort((values[valid_idx], key_codes[valid_idx]))]
+    sorted_values = values[order]
+    sorted_keys = key_codes[order]
+
+    n_clusters = key_codes.max() + 1
+    counts = np.bincount(sorted_keys, minlength=n_clusters)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # Ранг элемента внутри своего кластера (-1 для отсутствующих значений)
+    rank = np.full(n, -1, dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts[sorted_keys]
+
+    start = starts[key_codes]
+    size = counts[key_codes] - (rank >= 0)
+    low = np.maximum((size - 1) // 2, 0)
+    high = np.maximum(size // 2, 0)
+
+    def _pick(position: np.ndarray) -> np.ndarray:
+        shifted = np.where((rank >= 0) & (position >= rank), position + 1, position)
+        index = np.clip(start + shifted, 0, max(len(sorted_values) - 1, 0))
+        return sorted_values[index] if len(sorted_values) else np.zeros(n)
+
+    medians = (_pick(low) + _pick(high)) / 2
+    return np.where(size > 0, medians, 0.0)
+
+
+def price_adjustments(
+    current_prices: np.ndarray,
+    demand: np.ndarray,
+    median_demand: np.ndarray
+) -> np.ndarray:
+    """Новые цены по отклонению спроса от медианы кластера"""
+    current_prices = np.asarray(current_prices, dtype=np.float64)
+    demand_diff = np.asarray(demand, dtype=np.float64) / 100.0 - np.asarray(median_demand, dtype=np.float64) / 100.0
+    adjusted = np.round(current_prices * (1 + demand_diff * MAX_ADJUSTMENT) / PRICE_ROUNDING) * PRICE_ROUNDING
+    return np.where(np.abs(demand_diff) < DEMAND_THRESHOLD, current_prices, adjusted)
+
+
+def apply_price_limits(
+    new_prices: np.ndarray,
+    base_prices: np.ndarray,
+    max_shift_percent: float
+) -> np.ndarray:
+    """Ограничение отклонения от базовой цены на ±max_shift_percent"""
+    base_prices = np.asarray(base_prices, dtype=np.float64)
+    return np.clip(
+        np.asarray(new_prices, dtype=np.float64),
+        base_prices * (1 - max_shift_percent / 100),
+        base_prices * (1 + max_shift_percent / 100)
+    )
+
+
+def apply_step_limits(
+    new_prices: np.ndarray,
+    current_prices: np.ndarray,
+    min_change_percent: float,
+    max_change_percent: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ограничение изменения за один шаг; возвращает цены и процент изменения.
+    Цена после ограничений снова округляется до PRICE_ROUNDING внутрь допустимого
+    диапазона; если кратной цены в диапазоне нет, остается граница. Неизменная
+    цена не округляется
+    """
+    current_prices = np.asarray(current_prices, dtype=np.float64)
+    low = current_prices * (1 + min_change_percent / 100)
+    high = current_prices * (1 + max_change_percent / 100)
+    limited = np.clip(np.asarray(new_prices, dtype=np.float64), low, high)
+    rounded = np.round(limited / PRICE_ROUNDING) * PRICE_ROUNDING
+    rounded = np.where(rounded > high, np.floor(high / PRICE_ROUNDING) * PRICE_ROUNDING, rounded)
+    rounded = np.where(rounded < low, np.ceil(low / PRICE_ROUNDING) * PRICE_ROUNDING, rounded)
+    limited = np.where(limited == current_prices, current_prices, np.clip(rounded, low, high))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change_percent = np.where(current_prices > 0, (limited - current_prices) / current_prices * 100, 0.0)
+    return limited, change_percent
+
+
+def reprice_arrays(
+    views: np.ndarray,
+    bookings: np.ndarray,
+    median_demand: np.ndarray,
+    current_prices: np.ndarray,
+    base_prices: np.ndarray,
+    max_shift_percent: float,
+    min_change_percent: float,
+    max_change_percent: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Спрос, новые цены с ограничениями и процент изменения за один проход"""
+    demand = demand_scores(views, bookings)
+    new_prices = price_adjustments(current_prices, demand, median_demand)
+    new_prices = apply_price_limits(new_prices, base_prices, max_shift_percent)
+    new_prices, change_percent = apply_step_limits(
+        new_prices, current_prices, min_change_percent, max_change_percent
+    )
+    return demand, new_prices, change_percent
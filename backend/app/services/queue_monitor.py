@@ -0,0 +1,101 @@
+"""
+Глубина очередей Celery и задержка задач.
+
+Очереди брокера Redis разбиты по приоритетам: сообщения приоритета 0
+лежат в списке с именем очереди, приоритета p — в списке "{очередь}:{p}"
+(broker_transport_options в app.services.task_queue). Глубина очереди — сумма длин
+этих списков.
+
+При публикации задачи в заголовок добавляется время постановки
+(enqueued_at). Воркер по завершении задачи записывает ожидание в очереди
+(от постановки или ETA до старта) и время выполнения в списки
+queues:{очередь}:wait и queues:{очередь}:runtime, обрезанные до
+queue_latency_samples последних замеров; перцентили считаются при чтении.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.redis_client import get_broker_redis, get_redis
+
+
+PRIORITY_STEPS = list(range(10))
+PRIORITY_SEP = ":"
+
+WAIT_KEY = "queues:{queue}:wait"
+RUNTIME_KEY = "queues:{queue}:runtime"
+
+ENQUEUED_HEADER = "enqueued_at"
+
+
+def queue_names() -> List[str]:
+    return [settings.celery_interactive_queue, settings.celery_default_queue, settings.celery_bulk_queue]
+
+
+def _priority_keys(queue: str) -> List[str]:
+    return [queue if step == 0 else f"{queue}{PRIORITY_SEP}{step}" for step in PRIORITY_STEPS]
+
+
+def _percentiles(samples: List[bytes]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    values = np.array([float(sample) for sample in samples], dtype=np.float64)
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "max": round(float(values.max()), 3)}
+
+
+class QueueMonitor:
+    """Глубина очередей брокера и замеры задержки задач"""
+
+    async def depth(self, queue: str) -> int:
+        """Количество сообщений в очереди по всем приоритетам"""
+        pipeline = get_broker_redis().pipeline(transaction=False)
+        for key in _priority_keys(queue):
+            pipeline.llen(key)
+        return int(sum(await pipeline.execute()))
+
+    async def total_depth(self) -> int:
+        """Количество сообщений во всех очередях"""
+        total = 0
+        for queue in queue_names():
+            total += await self.depth(queue)
+        return total
+
+    async def record(self, queue: str, wait: Optional[float], runtime: float) -> None:
+        """Записать замер завершенной задачи"""
+        limit = settings.queue_latency_samples
+        pipeline = get_redis().pipeline(transaction=False)
+        if wait is not None:
+            pipeline.lpush(WAIT_KEY.format(queue=queue), round(max(wait, 0.0), 3))
+            pipeline.ltrim(WAIT_KEY.format(queue=queue), 0, limit - 1)
+        pipeline.lpush(RUNTIME_KEY.format(queue=queue), round(runtime, 3))
+        pipeline.ltrim(RUNTIME_KEY.format(queue=queue), 0, limit - 1)
+        await pipeline.execute()
+
+    async def get_stats(self, queue: str) -> Dict[str, Any]:
+        """Глубина очереди и перцентили ожидания и выполнения, секунды"""
+        redis = get_redis()
+        waits = await redis.lrange(WAIT_KEY.format(queue=queue), 0, -1)
+        runtimes = await redis.lrange(RUNTIME_KEY.format(queue=queue), 0, -1)
+        return {
+            "queue": queue,
+            "depth": await self.depth(queue),
+            "samples": len(runtimes),
+            "wait": _percentiles(waits),
+            "runtime": _percentiles(runtimes)
+        }
+
+
+def wait_time(enqueued_at: Optional[float], eta: Optional[str], started_at: float) -> Optional[float]:
+    """Ожидание в очереди; для отложенных задач — от момента ETA"""
+    if enqueued_at is None:
+        return None
+    ready_at = float(enqueued_at)
+    if eta:
+        ready_at = max(ready_at, datetime.fromisoformat(eta).timestamp())
+    return started_at - ready_at
+
+
+queue_monitor = QueueMonitor()
@@ -0,0 +1,105 @@
+"""
+Приложение Celery без задач: брокер, очереди, маршруты и приоритеты.
+
+Используется и воркером (app.worker регистрирует в нем задачи и сигналы
+процессов), и API, которое ставит задачи в очередь по имени через
+send_task, не импортируя модуль воркера с его сигналами и сервисами.
+"""
+from typing import Any, Dict
+import time
+
+from celery import Celery
+from celery.result import AsyncResult
+from celery.signals import before_task_publish
+from kombu import Exchange, Queue
+
+from app.config import settings
+from app.services.queue_monitor import ENQUEUED_HEADER, PRIORITY_SEP, PRIORITY_STEPS
+
+
+TASK_MODULE = "app.worker"
+
+# Создаем Celery приложение
+celery_app = Celery(
+    "real_estate_worker",
+    broker=settings.celery_broker_url,
+    backend=settings.celery_result_backend,
+    include=[TASK_MODULE]
+)
+
+# Задачи по одному объекту не ждут за массовыми: у каждой группы своя очередь и свои процессы
+INTERACTIVE_TASKS = (
+    "update_single_property_price_task",
+    "update_single_property_stats_task",
+)
+BULK_TASKS = (
+    "update_stats_task",
+    "update_stats_chunk_task",
+    "finish_stats_task",
+    "update_dynamic_pricing_task",
+    "update_pricing_chunk_task",
+    "finish_pricing_task",
+    "batch_match_task",
+    "build_demand_clusters_task",
+)
+
+# Процессов воркера на очередь: python run_worker.py <очередь>
+QUEUE_CONCURRENCY = {
+    settings.celery_interactive_queue: settings.celery_interactive_concurrency,
+    settings.celery_default_queue: settings.celery_default_concurrency,
+    settings.celery_bulk_queue: settings.celery_bulk_concurrency,
+}
+
+
+def _task_routes() -> Dict[str, Dict[str, Any]]:
+    routes = {}
+    for name in INTERACTIVE_TASKS:
+        routes[f"{TASK_MODULE}.{name}"] = {
+            "queue": settings.celery_interactive_queue,
+            "priority": settings.celery_interactive_priority
+        }
+    for name in BULK_TASKS:
+        routes[f"{TASK_MODULE}.{name}"] = {
+            "queue": settings.celery_bulk_queue,
+            "priority": settings.celery_bulk_priority
+        }
+    return routes
+
+
+# Конфигурация Celery
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    timezone="UTC",
+    enable_utc=True,
+    task_track_started=True,
+    task_time_limit=30 * 60,  # 30 минут
+    task_soft_time_limit=25 * 60,  # 25 минут
+    result_expires=settings.celery_result_expires,
+    task_queues=[Queue(queue, Exchange(queue), routing_key=queue) for queue in QUEUE_CONCURRENCY],
+    task_default_queue=settings.celery_default_queue,
+    task_routes=_task_routes(),
+    task_default_priority=settings.celery_default_priority,
+    # Приоритеты в Redis: отдельный список на каждый шаг, чтение по возрастанию номера
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "sep": PRIORITY_SEP,
+        "queue_order_strategy": "priority",
+    },
+    # Процесс берет следующую задачу только после текущей, иначе приоритеты и очереди
+    # обходятся предвыборкой длинных массовых задач
+    worker_prefetch_multiplier=1,
+)
+
+
+def send_task(name: str, *args: Any, **kwargs: Any) -> AsyncResult:
+    """Поставить задачу воркера в очередь по короткому имени; очередь и приоритет — из task_routes"""
+    return celery_app.send_task(f"{TASK_MODULE}.{name}", args=args, kwargs=kwargs)
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    """Время постановки в очередь передается в заголовке сообщения"""
+    if headers is not None:
+        headers.setdefault(ENQUEUED_HEADER, time.time())
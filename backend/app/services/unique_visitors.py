@@ -0,0 +1,106 @@
+"""
+Приблизительный подсчет уникальных посетителей объектов через Redis HyperLogLog.
+
+На каждый объект и сутки (UTC) заводится HLL-ключ с session_id посетителей;
+ключ занимает не более 12 КБ и живет UNIQUE_VISITORS_RETENTION_DAYS дней.
+Число уникальных посетителей за окно — PFCOUNT по ключам суток окна
+(объединение без материализации). Погрешность HyperLogLog в Redis ~0.81%.
+
+Объекты с новыми посетителями попадают в множество DIRTY_KEY: периодический
+перенос оценок в property_analytics пересчитывает только их. Окна сдвигаются
+со сменой суток, поэтому первый перенос за сутки (UTC) — полный.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.redis_client import get_redis
+
+
+KEY_PREFIX = "uv"
+DIRTY_KEY = f"{KEY_PREFIX}:dirty"  # ID объектов с посетителями после последнего переноса
+FULL_REFRESH_KEY = f"{KEY_PREFIX}:full_refresh_day"  # Сутки последнего полного переноса
+UNIQUE_VISITORS_RETENTION_DAYS = 31
+PIPELINE_CHUNK = 1000
+
+
+class UniqueVisitorCounter:
+    """Счетчики уникальных посетителей по объектам и суткам"""
+
+    @staticmethod
+    def key(property_id: int, day: date) -> str:
+        return f"{KEY_PREFIX}:{property_id}:{day:%Y%m%d}"
+
+    @classmethod
+    def window_keys(cls, property_id: int, days: int, today: Optional[date] = None) -> List[str]:
+        """Ключи суток окна из days последних дней, включая сегодняшний"""
+        today = today or datetime.utcnow().date()
+        return [cls.key(property_id, today - timedelta(days=offset)) for offset in range(days)]
+
+    async def record(self, events: Iterable[Tuple[int, Optional[str], datetime]]) -> int:
+        """Учитывает события (property_id, session_id, occurred_at); без session_id не учитываются"""
+        sessions: Dict[str, Set[str]] = defaultdict(set)
+        property_ids: Set[int] = set()
+        for property_id, session_id, occurred_at in events:
+            if session_id:
+                sessions[self.key(property_id, occurred_at.date())].add(session_id)
+                property_ids.add(property_id)
+        if not sessions:
+            return 0
+
+        ttl = int(timedelta(days=UNIQUE_VISITORS_RETENTION_DAYS).total_seconds())
+        pipeline = get_redis().pipeline(transaction=False)
+        for key, members in sessions.items():
+            pipeline.pfadd(key, *members)
+            pipeline.expire(key, ttl)
+        pipeline.sadd(DIRTY_KEY, *property_ids)
+        await pipeline.execute()
+        return len(sessions)
+
+    async def take_dirty(self) -> List[int]:
+        """Забирает ID объектов с новыми посетителями и очищает множество"""
+        pipeline = get_redis().pipeline(transaction=True)
+        pipeline.smembers(DIRTY_KEY)
+        pipeline.delete(DIRTY_KEY)
+        members, _ = await pipeline.execute()
+        return sorted(int(member) for member in members)
+
+    async def restore_dirty(self, property_ids: Sequence[int]) -> None:
+        """Возвращает ID в множество, если перенос оценок не удался"""
+        if property_ids:
+            await get_redis().sadd(DIRTY_KEY, *property_ids)
+
+    async def needs_full_refresh(self, today: date) -> bool:
+        """Был ли полный перенос оценок за сутки today"""
+        value = await get_redis().get(FULL_REFRESH_KEY)
+        return value is None or value.decode() != today.isoformat()
+
+    async def mark_full_refresh(self, today: date) -> None:
+        await get_redis().set(FULL_REFRESH_KEY, today.isoformat())
+
+    async def count(self, property_id: int, days: int) -> int:
+        """Уникальные посетители объекта за последние days суток"""
+        return int(await get_redis().pfcount(*self.window_keys(property_id, days)))
+
+    async def count_many(
+        self,
+        property_ids: Sequence[int],
+        windows: Sequence[int],
+        today: Optional[date] = None
+    ) -> Dict[int, List[int]]:
+        """Уникальные посетители объектов для каждого окна из windows (в сутках)"""
+        today = today or datetime.utcnow().date()
+        counts: Dict[int, List[int]] = {}
+        for start in range(0, len(property_ids), PIPELINE_CHUNK):
+            chunk = property_ids[start:start + PIPELINE_CHUNK]
+            pipeline = get_redis().pipeline(transaction=False)
+            for property_id in chunk:
+                for days in windows:
+                    pipeline.pfcount(*self.window_keys(property_id, days, today))
+            results = await pipeline.execute()
+            for i, property_id in enumerate(chunk):
+                counts[property_id] = [int(value) for value in results[i * len(windows):(i + 1) * len(windows)]]
+        return counts
+
+
+unique_visitors = UniqueVisitorCounter()
@@ -1,62 +1,91 @@
-from celery import Celery
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from celery import chord, group
+from celery.signals import task_postrun, task_prerun, worker_process_init, worker_process_shutdown
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.database import AsyncSessionLocal
+from app.worker_runtime import worker_runtime
 from app.services.stats_aggregator import StatsAggregatorService
 from app.services.dynamic_pricing import DynamicPricingService
-from app.crud import CRUDWorker
-import asyncio
-from typing import Dict, Any, List
-
-# Создаем Celery приложение
-celery_app = Celery(
-    "real_estate_worker",
-    broker=settings.celery_broker_url,
-    backend=settings.celery_result_backend,
-    include=["app.worker"]
-)
-
-# Конфигурация Celery
-celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
-    timezone="UTC",
-    enable_utc=True,
-    task_track_started=True,
-    task_time_limit=30 * 60,  # 30 минут
-    task_soft_time_limit=25 * 60,  # 25 минут
-)
+from app.services.ai_matching import PropertyMatchingService, iter_batch_matches
+from app.services.pricing_config import pricing_config_cache
+from app.services.demand_clustering import DemandClusteringService
+from app.services.compute_pool import compute_pool
+from app.services.job_fanout import MAX_ERROR_LENGTH, fanout_progress
+from app.services.job_scheduler import JobSpec, SCHEDULED_JOBS, job_scheduler
+from app.services.queue_monitor import ENQUEUED_HEADER, queue_monitor, wait_time
+from app.services.task_queue import QUEUE_CONCURRENCY, celery_app
+from app.models import PropertyType
+from app.crud import CRUDWorker, CRUDEventRollup, crud_job_run, crud_match_recommendation
+from app.schemas import PropertyMatchBatchItem
+from app.redis_client import get_redis
+from app.partitions import ensure_partitions, archive_expired_partitions
+from datetime import datetime, timedelta
+import time
+import uuid
+from typing import Callable, Dict, Any, List, Optional
 
 
-async def get_async_session() -> AsyncSession:
-    """Получает асинхронную сессию для работы с базой данных"""
+@worker_process_init.connect
+def start_worker_listeners(**kwargs):
+    """Цикл событий, пул БД и фоновые потоки создаются в каждом процессе воркера после fork"""
+    worker_runtime.start()
+    pricing_config_cache.start_listener()
+
+
+@worker_process_shutdown.connect
+def stop_worker_listeners(**kwargs):
+    pricing_config_cache.stop_listener()
+    compute_pool.shutdown()
+    worker_runtime.shutdown()
+
+
+# Время старта выполняемых задач процесса по task_id
+_task_started_at: Dict[str, float] = {}
+
+
+@task_prerun.connect
+def mark_task_started(task_id=None, **kwargs):
+    _task_started_at[task_id] = time.time()
+
 
+@task_postrun.connect
+def record_task_latency(task_id=None, task=None, **kwargs):
+    """Записывает ожидание в очереди и время выполнения задачи"""
+    started_at = _task_started_at.pop(task_id, None)
+    if started_at is None or task is None:
+        return
+    request = task.request
+    queue = (request.delivery_info or {}).get("routing_key") or settings.celery_default_queue
+    wait = wait_time(getattr(request, ENQUEUED_HEADER, None), request.eta, started_at)
+    try:
+        worker_runtime.run(queue_monitor.record(queue, wait, time.time() - started_at))
+    except Exception as e:
+        print(f"Ошибка при записи задержки задачи {task_id}: {e}")
 
-    celery_engine = create_async_engine(
-        str(settings.database_url).replace("postgresql://", "postgresql+asyncpg://"),
-        pool_size=5,
-        max_overflow=10,
-        )
 
-    CelerySessionLocal = sessionmaker(
-        bind=celery_engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-        )
+# Размер пачки при записи результатов пакетного подбора
+BATCH_MATCH_INSERT_SIZE = 5000
 
-    async with CelerySessionLocal() as session:
-        return session
+# Ключи Redis для инкрементальной переоценки
+PRICING_QUEUED_KEY = "pricing:queued:{property_id}"
+PRICING_QUEUED_TTL = 30 * 60  # Не дольше лимита времени задачи
+
+# Время последнего пересчета статистики районов
+DISTRICT_STATS_WATERMARK_KEY = "district_stats:watermark"
+
+async def get_async_session() -> AsyncSession:
+    """Получает сессию из пула соединений процесса воркера; закрывается вызывающим"""
+    return worker_runtime.session()
 
 
 def format_stats_response(stats: Any) -> Dict[str, Any]:
     """Форматирует ответ для задачи обновления статистики"""
     return {
-        "views_24h": stats.views_24h,
-        "leads_24h": stats.leads_24h,
-        "bookings_24h": stats.bookings_24h,
-        "days_on_site": stats.days_on_site
+        "views_last_week": stats.views_last_week,
+        "views_last_month": stats.views_last_month,
+        "favourites_total": stats.favourites_total,
+        "bookings_total": stats.bookings_total,
+        "days_on_market": stats.days_on_market,
+        "demand_score": stats.demand_score
     }
 
 
@@ -71,48 +100,267 @@ def format_pricing_response(result: Any) -> Dict[str, Any]:
     }
 
 
-@celery_app.task
-def update_stats_task():
-    """Задача для обновления статистики всех объектов недвижимости"""
-    async def _update_stats():
+def _run_scheduled(
+    task,
+    spec: JobSpec,
+    run: Callable[[], Dict[str, Any]],
+    force: bool = False,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Выполняет периодическую задачу под арендой. Вызов до истечения адаптивного
+    интервала или во время другого запуска пропускается; для политики coalesce
+    по завершении запуска ставится один повтор с теми же kwargs
+    """
+    token = str(uuid.uuid4())
+    reason = worker_runtime.run(job_scheduler.try_start(spec, token, force))
+    if reason:
+        return {"status": "skipped", "job": spec.name, "reason": reason}
+    
+    status = "error"
+    try:
+        result = run()
+        status = result.get("status", "success")
+        return result
+    finally:
+        delay = worker_runtime.run(job_scheduler.finish(spec, token, status))
+        if delay is not None:
+            task.apply_async(kwargs={**kwargs, "force": True}, countdown=delay)
+
+
+def _finish_scheduled_fanout(task, spec: JobSpec, job_id: str, status: str) -> None:
+    """Снимает аренду пачечной задачи из колбэка chord и ставит повтор при coalesce"""
+    delay = worker_runtime.run(job_scheduler.finish(spec, job_id, status))
+    if delay is not None:
+        task.apply_async(kwargs={"force": True}, countdown=delay)
+
+
+def _dispatch_fanout(
+    spec: JobSpec,
+    chunk_task,
+    finish_task,
+    available_only: bool,
+    force: bool = False,
+    prepare=None
+) -> Dict[str, Any]:
+    """
+    Делит ID объектов на диапазоны и запускает chord: пачки параллельно, затем finish_task.
+    prepare(session) -> кортеж аргументов, общих для всех пачек запуска: считается один раз
+    и передается каждой пачке после диапазона ID.
+    Аренда задачи берется с токеном job_id и снимается в finish_task
+    """
+    job_id = str(uuid.uuid4())
+    reason = worker_runtime.run(job_scheduler.try_start(spec, job_id, force))
+    if reason:
+        return {"status": "skipped", "job": spec.name, "reason": reason}
+    
+    async def _dispatch():
         session = await get_async_session()
         try:
-            worker_crud = CRUDWorker(session)
-            properties = await worker_crud.get_properties_for_stats()
-            
-            if not properties:
-                return {
-                    "status": "success",
-                    "message": "Нет объектов недвижимости для обновления статистики"
-                }
-            
-            aggregator = StatsAggregatorService(session)
-            updated_stats = []
-            
-            for property_obj in properties:
-                try:
-                    stats = await aggregator.update_property_stats(property_obj.id)
-                    updated_stats.append(format_stats_response(stats))
-                except Exception as e:
-                    print(f"Ошибка при обновлении статистики объекта {property_obj.id}: {e}")
-                    continue
-            
+            ranges = await CRUDWorker(session).get_id_ranges(settings.fanout_chunk_size, available_only)
+            chunk_args = tuple(await prepare(session)) if ranges and prepare else ()
+            if ranges:
+                await crud_job_run.start(session, job_id, spec.name, len(ranges))
+        finally:
+            await session.close()
+        if ranges:
+            await fanout_progress.start(job_id, spec.name, len(ranges))
+        return ranges, chunk_args
+    
+    try:
+        ranges, chunk_args = worker_runtime.run(_dispatch())
+    except Exception as e:
+        worker_runtime.run(job_scheduler.finish(spec, job_id, "error"))
+        return {"status": "error", "job_id": job_id, "error": str(e), "message": "Ошибка при разбиении задачи на пачки"}
+    if not ranges:
+        worker_runtime.run(job_scheduler.finish(spec, job_id, "success"))
+        return {"status": "success", "job_id": job_id, "chunks": 0, "message": "Нет объектов для обработки"}
+    
+    chord(
+        group(chunk_task.s(job_id, first_id, last_id, *chunk_args) for first_id, last_id in ranges),
+        finish_task.s(job_id)
+    ).apply_async()
+    return {
+        "status": "dispatched",
+        "job_id": job_id,
+        "chunks": len(ranges),
+        "message": f"Задача разбита на {len(ranges)} пачек"
+    }
+
+
+def _run_chunk(
+    task,
+    spec: JobSpec,
+    job_id: str,
+    first_id: int,
+    last_id: int,
+    process,
+    available_only: bool = False
+) -> Dict[str, Any]:
+    """
+    Выполняет пачку process(session, property_ids) -> количество обновленных.
+    При ошибке пачка повторяется отдельно; после исчерпания повторов
+    возвращается ошибка, чтобы chord завершился с частичным результатом.
+    Результат пачки — только счетчики: подробности пишет process в job_run_items
+    """
+    started = time.monotonic()
+    
+    async def _chunk():
+        session = await get_async_session()
+        try:
+            property_ids = await CRUDWorker(session).get_property_ids_in_range(first_id, last_id, available_only)
+            updated = await process(session, property_ids) if property_ids else 0
+            await fanout_progress.chunk_done(job_id, len(property_ids), updated)
+            await job_scheduler.renew(spec, job_id)
             return {
                 "status": "success",
-                "updated_properties": len(updated_stats),
-                "stats": updated_stats,
-                "message": f"Статистика обновлена для {len(updated_stats)} объектов недвижимости"
-            }
-        except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "message": "Ошибка при обновлении статистики"
+                "first_id": first_id,
+                "last_id": last_id,
+                "processed": len(property_ids),
+                "updated": updated,
+                "duration": round(time.monotonic() - started, 3)
             }
         finally:
             await session.close()
     
-    return asyncio.run(_update_stats())
+    async def _record_failure(error: str):
+        await fanout_progress.chunk_failed(job_id, error)
+        session = await get_async_session()
+        try:
+            await crud_job_run.add_items(session, job_id, [
+                {"status": "error", "detail": f"ID {first_id}-{last_id}: {error}"[:MAX_ERROR_LENGTH]}
+            ])
+        finally:
+            await session.close()
+    
+    try:
+        return worker_runtime.run(_chunk())
+    except Exception as e:
+        if task.request.retries < task.max_retries:
+            worker_runtime.run(fanout_progress.chunk_retried(job_id, str(e)))
+            raise task.retry(exc=e, countdown=settings.fanout_retry_delay * 2 ** task.request.retries)
+        try:
+            worker_runtime.run(_record_failure(str(e)))
+        except Exception:
+            pass
+        return {
+            "status": "error",
+            "first_id": first_id,
+            "last_id": last_id,
+            "error": str(e)[:MAX_ERROR_LENGTH]
+        }
+
+
+def _aggregate_chunks(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Сводка по результатам пачек: счетчики, время и несколько первых ошибок"""
+    failed = [result for result in results if result.get("status") != "success"]
+    durations = [result["duration"] for result in results if "duration" in result]
+    return {
+        "chunks": len(results),
+        "failed_chunks": len(failed),
+        "processed": sum(result.get("processed", 0) for result in results),
+        "updated": sum(result.get("updated", 0) for result in results),
+        "max_chunk_duration": max(durations, default=None),
+        "error_sample": [
+            f"ID {result['first_id']}-{result['last_id']}: {result.get('error')}"
+            for result in failed[:settings.job_error_sample_size]
+        ]
+    }
+
+
+def _record_run(job_id: str, status: str, summary: Dict[str, Any]) -> Optional[float]:
+    """Записывает итог запуска в job_runs, удаляет устаревшие запуски и возвращает длительность"""
+    async def _record():
+        session = await get_async_session()
+        try:
+            await crud_job_run.finish(
+                session, job_id, status,
+                failed_chunks=summary["failed_chunks"],
+                processed=summary["processed"],
+                updated=summary["updated"],
+                max_chunk_duration=summary["max_chunk_duration"],
+                error_sample=summary["error_sample"] or None
+            )
+            await crud_job_run.prune(
+                session, datetime.utcnow() - timedelta(days=settings.job_run_retention_days)
+            )
+            run = await crud_job_run.get(session, job_id)
+            return run.duration if run else None
+        finally:
+            await session.close()
+    
+    try:
+        return worker_runtime.run(_record())
+    except Exception as e:
+        print(f"Ошибка при записи журнала запуска {job_id}: {e}")
+        return None
+
+
+@celery_app.task
+def update_stats_task(force: bool = False):
+    """
+    Задача для обновления статистики всех объектов недвижимости: разбивается на пачки по ID.
+    Среднее число просмотров по каталогу считается один раз на запуск и передается пачкам
+    """
+    async def _prepare(session):
+        return (await StatsAggregatorService(session).get_avg_views_last_month(),)
+    
+    return _dispatch_fanout(
+        SCHEDULED_JOBS["stats"], update_stats_chunk_task, finish_stats_task,
+        available_only=False, force=force, prepare=_prepare
+    )
+
+
+@celery_app.task(bind=True, max_retries=settings.fanout_chunk_max_retries)
+def update_stats_chunk_task(
+    self, job_id: str, first_id: int, last_id: int, avg_views_last_month: Optional[float] = None
+):
+    """Пересчет аналитики объектов диапазона ID"""
+    async def _process(session, property_ids):
+        return await StatsAggregatorService(session).refresh_all_stats(property_ids, avg_views_last_month)
+    
+    return _run_chunk(self, SCHEDULED_JOBS["stats"], job_id, first_id, last_id, _process)
+
+
+@celery_app.task
+def finish_stats_task(results: List[Dict[str, Any]], job_id: str):
+    """Завершение пересчета статистики: кластеры спроса считаются по обновленной аналитике"""
+    async def _finish():
+        session = await get_async_session()
+        try:
+            clusters = await StatsAggregatorService(session).refresh_cluster_demand_stats()
+        finally:
+            await session.close()
+        await fanout_progress.finish(job_id)
+        return clusters
+    
+    summary = _aggregate_chunks(results)
+    try:
+        clusters = worker_runtime.run(_finish())
+    except Exception as e:
+        summary["error_sample"] = [str(e)[:MAX_ERROR_LENGTH]] + summary["error_sample"]
+        duration = _record_run(job_id, "error", summary)
+        _finish_scheduled_fanout(update_stats_task, SCHEDULED_JOBS["stats"], job_id, "error")
+        return {
+            "status": "error",
+            "job_id": job_id,
+            **summary,
+            "duration": duration,
+            "error": str(e),
+            "message": "Ошибка при обновлении статистики кластеров"
+        }
+    status = "partial" if summary["failed_chunks"] else "success"
+    duration = _record_run(job_id, status, summary)
+    _finish_scheduled_fanout(update_stats_task, SCHEDULED_JOBS["stats"], job_id, status)
+    return {
+        "status": status,
+        "job_id": job_id,
+        **summary,
+        "duration": duration,
+        "updated_properties": summary["updated"],
+        "updated_clusters": clusters,
+        "message": f"Статистика обновлена для {summary['updated']} объектов недвижимости"
+    }
 
 
 @celery_app.task
@@ -150,53 +398,54 @@ def update_single_property_stats_task(property_id: str):
         finally:
             await session.close()
     
-    return asyncio.run(_update_single_stats())
+    return worker_runtime.run(_update_single_stats())
 
 
 @celery_app.task
-def update_dynamic_pricing_task():
-    """Задача для обновления цен всех объектов недвижимости"""
-    async def _update_pricing():
-        session = await get_async_session()
-        try:
-            worker_crud = CRUDWorker(session)
-            properties = await worker_crud.get_properties_for_pricing()
-            
-            if not properties:
-                return {
-                    "status": "success",
-                    "message": "Нет объектов недвижимости для обновления цен"
+def update_dynamic_pricing_task(force: bool = False):
+    """Задача для обновления цен всех доступных объектов: разбивается на пачки по ID"""
+    return _dispatch_fanout(
+        SCHEDULED_JOBS["pricing_full"], update_pricing_chunk_task, finish_pricing_task, available_only=True, force=force
+    )
+
+
+@celery_app.task(bind=True, max_retries=settings.fanout_chunk_max_retries)
+def update_pricing_chunk_task(self, job_id: str, first_id: int, last_id: int):
+    """Переоценка доступных объектов диапазона ID; изменения цен пишутся в job_run_items"""
+    async def _process(session, property_ids):
+        results = await DynamicPricingService(session).reprice_properties(property_ids)
+        if settings.job_run_items_enabled:
+            await crud_job_run.add_items(session, job_id, [
+                {
+                    "property_id": result.property_id,
+                    "status": result.reason,
+                    "old_value": result.old_price,
+                    "new_value": result.new_price,
+                    "detail": result.description
                 }
-            
-            pricing_service = DynamicPricingService(session)
-            results = []
-            
-            for property_obj in properties:
-                try:
-                    result = await pricing_service.update_property_price(property_obj)
-                    if result:
-                        results.append(format_pricing_response(result))
-                        await worker_crud.update_property_price_timestamp(property_obj.id)
-                except Exception as e:
-                    print(f"Ошибка при обновлении цены объекта {property_obj.id}: {e}")
-                    continue
-            
-            return {
-                "status": "success",
-                "updated_properties": len(results),
-                "results": results,
-                "message": f"Цены обновлены для {len(results)} объектов недвижимости"
-            }
-        except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "message": "Ошибка при обновлении цен"
-            }
-        finally:
-            await session.close()
+                for result in results
+            ])
+        return len(results)
     
-    return asyncio.run(_update_pricing())
+    return _run_chunk(self, SCHEDULED_JOBS["pricing_full"], job_id, first_id, last_id, _process, available_only=True)
+
+
+@celery_app.task
+def finish_pricing_task(results: List[Dict[str, Any]], job_id: str):
+    """Сводка по переоценке всех пачек"""
+    summary = _aggregate_chunks(results)
+    worker_runtime.run(fanout_progress.finish(job_id))
+    status = "partial" if summary["failed_chunks"] else "success"
+    duration = _record_run(job_id, status, summary)
+    _finish_scheduled_fanout(update_dynamic_pricing_task, SCHEDULED_JOBS["pricing_full"], job_id, status)
+    return {
+        "status": status,
+        "job_id": job_id,
+        **summary,
+        "duration": duration,
+        "updated_properties": summary["updated"],
+        "message": f"Цены обновлены для {summary['updated']} объектов недвижимости"
+    }
 
 
 @celery_app.task
@@ -219,7 +468,6 @@ def update_single_property_price_task(property_id: str):
             result = await pricing_service.update_property_price(property_obj)
             
             if result:
-                await worker_crud.update_property_price_timestamp(property_obj.id)
                 return {
                     "status": "success",
                     "property_id": property_id,
@@ -240,9 +488,279 @@ def update_single_property_price_task(property_id: str):
                 "message": f"Ошибка при обновлении цены объекта недвижимости {property_id}"
             }
         finally:
+            await get_redis().delete(PRICING_QUEUED_KEY.format(property_id=property_id))
             await session.close()
     
-    return asyncio.run(_update_single_price())
+    return worker_runtime.run(_update_single_price())
+
+
+@celery_app.task
+def batch_match_task(profiles: List[Dict[str, Any]], limit: int = 10, run_id: Optional[str] = None):
+    """Задача пакетного ИИ-подбора с записью результатов в match_recommendations"""
+    async def _batch_match():
+        session = await get_async_session()
+        try:
+            batch_run_id = run_id or str(uuid.uuid4())
+            requests = [PropertyMatchBatchItem(**profile) for profile in profiles]
+            snapshot = await PropertyMatchingService(session).get_batch_snapshot()
+            
+            rows = []
+            saved = 0
+            for item in iter_batch_matches(snapshot, requests, limit):
+                for rank, result in enumerate(item["results"], start=1):
+                    rows.append({
+                        "run_id": batch_run_id,
+                        "profile_id": item["profile_id"],
+                        "profile_index": item["index"],
+                        "property_id": result["property_id"],
+                        "rank": rank,
+                        "score": result["score"],
+                        "created_at": datetime.utcnow()
+                    })
+                if len(rows) >= BATCH_MATCH_INSERT_SIZE:
+                    saved += await crud_match_recommendation.bulk_create(session, rows)
+                    rows = []
+            saved += await crud_match_recommendation.bulk_create(session, rows)
+            
+            return {
+                "status": "success",
+                "run_id": batch_run_id,
+                "profiles": len(requests),
+                "recommendations": saved,
+                "message": f"Подбор выполнен для {len(requests)} профилей"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "run_id": run_id,
+                "error": str(e),
+                "message": "Ошибка при пакетном подборе"
+            }
+        finally:
+            await session.close()
+    
+    return worker_runtime.run(_batch_match())
+
+
+@celery_app.task(bind=True)
+def enqueue_dirty_pricing_task(self, force: bool = False):
+    """Задача постановки в очередь переоценки объектов с изменившимся спросом"""
+    async def _enqueue_dirty():
+        session = await get_async_session()
+        try:
+            redis = get_redis()
+            dirty = await DynamicPricingService(session).find_dirty_properties()
+            
+            # Одна задача на объект: ключ снимается по завершении переоценки
+            enqueued = 0
+            for property_id in dirty:
+                queued = await redis.set(
+                    PRICING_QUEUED_KEY.format(property_id=property_id), 1,
+                    nx=True, ex=PRICING_QUEUED_TTL
+                )
+                if queued:
+                    update_single_property_price_task.delay(property_id)
+                    enqueued += 1
+            
+            # Позиция поиска сдвигается только после постановки задач
+            await session.commit()
+            return {
+                "status": "success",
+                "dirty_properties": len(dirty),
+                "enqueued": enqueued,
+                "message": f"Поставлено в очередь {enqueued} объектов на переоценку"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "Ошибка при поиске объектов для переоценки"
+            }
+        finally:
+            await session.close()
+    
+    return _run_scheduled(self, SCHEDULED_JOBS["dirty_pricing"], lambda: worker_runtime.run(_enqueue_dirty()), force)
+
+
+@celery_app.task(bind=True)
+def refresh_district_stats_task(self, full: bool = False, force: bool = False):
+    """Задача пересчета статистики районов: измененных с прошлого запуска или всех (full)"""
+    async def _refresh():
+        session = await get_async_session()
+        try:
+            redis = get_redis()
+            now = datetime.utcnow()
+            since = None
+            if not full:
+                watermark = await redis.get(DISTRICT_STATS_WATERMARK_KEY)
+                # Без отметки о прошлом запуске пересчитываются все районы
+                since = datetime.fromisoformat(watermark.decode()) if watermark else None
+            
+            updated = await StatsAggregatorService(session).refresh_district_stats(since)
+            await redis.set(DISTRICT_STATS_WATERMARK_KEY, now.isoformat())
+            return {
+                "status": "success",
+                "full": since is None,
+                "updated_districts": updated,
+                "message": f"Статистика обновлена для {updated} районов"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "Ошибка при обновлении статистики районов"
+            }
+        finally:
+            await session.close()
+    
+    spec = SCHEDULED_JOBS["district_stats_full" if full else "district_stats"]
+    return _run_scheduled(self, spec, lambda: worker_runtime.run(_refresh()), force, full=full)
+
+
+@celery_app.task(bind=True)
+def build_demand_clusters_task(
+    self,
+    project_id: Optional[int] = None,
+    property_type: Optional[str] = None,
+    k: Optional[int] = None,
+    force: bool = False
+):
+    """Задача кластеризации спроса доступных объектов (k-means)"""
+    async def _build():
+        session = await get_async_session()
+        try:
+            run = await DemandClusteringService(session).build(
+                project_id=project_id,
+                property_type=PropertyType(property_type) if property_type else None,
+                k=k
+            )
+            return {
+                "status": "success",
+                "run_id": run.id,
+                "clusters": run.k,
+                "property_count": run.property_count,
+                "iterations": run.iterations,
+                "message": f"Построено {run.k} кластеров спроса по {run.property_count} объектам"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "Ошибка при кластеризации спроса"
+            }
+        finally:
+            await session.close()
+    
+    return _run_scheduled(
+        self, SCHEDULED_JOBS["demand_clusters"], lambda: worker_runtime.run(_build()), force,
+        project_id=project_id, property_type=property_type, k=k
+    )
+
+
+async def _compact_rollups(session) -> Dict[str, int]:
+    """Сворачивает все новые строки источников в роллапы пачками"""
+    rollup_crud = CRUDEventRollup(session)
+    processed = {}
+    for source in ("views_log", "bookings"):
+        total = 0
+        while True:
+            count = await rollup_crud.compact(source, settings.rollup_compaction_batch_size)
+            if not count:
+                break
+            total += count
+        processed[source] = total
+    return processed
+
+
+@celery_app.task(bind=True)
+def compact_event_rollups_task(self, force: bool = False):
+    """Задача свертки views_log и bookings в часовые и суточные роллапы"""
+    async def _compact():
+        session = await get_async_session()
+        try:
+            processed = await _compact_rollups(session)
+            pruned = await CRUDEventRollup(session).prune_hourly(
+                datetime.utcnow() - timedelta(days=settings.rollup_hourly_retention_days)
+            )
+            return {
+                "status": "success",
+                "processed": processed,
+                "pruned_hourly": pruned,
+                "message": "Роллапы событий обновлены"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "Ошибка при свертке событий"
+            }
+        finally:
+            await session.close()
+    
+    return _run_scheduled(self, SCHEDULED_JOBS["rollup_compaction"], lambda: worker_runtime.run(_compact()), force)
+
+
+@celery_app.task(bind=True)
+def maintain_views_log_partitions_task(self, force: bool = False):
+    """Задача создания будущих партиций views_log и архивации устаревших"""
+    async def _maintain():
+        session = await get_async_session()
+        try:
+            # Будущие партиции фиксируются отдельно: ошибка архивации не должна им мешать
+            created = await ensure_partitions(await session.connection())
+            await session.commit()
+            
+            # Архивируются только свернутые партиции, поэтому сначала сворачиваем хвост;
+            # watermark свертки не выше безопасного горизонта ID
+            await _compact_rollups(session)
+            watermarks = await CRUDEventRollup(session).get_watermarks()
+            compacted_id = watermarks["views_log"].last_id if "views_log" in watermarks else 0
+            
+            archived = await archive_expired_partitions(await session.connection(), compacted_id)
+            await session.commit()
+            return {
+                "status": "success",
+                "created": created,
+                "archived": archived,
+                "message": f"Создано партиций: {len(created)}, архивировано: {len(archived)}"
+            }
+        except Exception as e:
+            print(f"Ошибка при обслуживании партиций views_log: {e}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "Ошибка при обслуживании партиций views_log"
+            }
+        finally:
+            await session.close()
+    
+    return _run_scheduled(
+        self, SCHEDULED_JOBS["views_log_partitions"], lambda: worker_runtime.run(_maintain()), force
+    )
+
+
+@celery_app.task(bind=True)
+def refresh_unique_visitors_task(self, force: bool = False):
+    """Задача переноса оценок уникальных посетителей в property_analytics"""
+    async def _refresh():
+        session = await get_async_session()
+        try:
+            updated = await StatsAggregatorService(session).refresh_unique_visitors()
+            return {
+                "status": "success",
+                "updated_properties": updated,
+                "message": f"Уникальные посетители обновлены для {updated} объектов недвижимости"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "Ошибка при обновлении уникальных посетителей"
+            }
+        finally:
+            await session.close()
+    
+    return _run_scheduled(self, SCHEDULED_JOBS["unique_visitors"], lambda: worker_runtime.run(_refresh()), force)
 
 
 # Периодические задачи
@@ -251,16 +769,63 @@ def setup_periodic_tasks(sender, **kwargs):
     """Настройка периодических задач"""
     # Обновление статистики каждую минуту
     sender.add_periodic_task(
-        60.0,  # каждые 60 секунд
+        float(settings.stats_refresh_interval),
         update_stats_task.s(),
         name="update-stats-every-minute"
     )
     
-    # Обновление цен каждый час
+    # Уникальные посетители
+    sender.add_periodic_task(
+        float(settings.unique_visitors_refresh_interval),
+        refresh_unique_visitors_task.s(),
+        name="refresh-unique-visitors"
+    )
+    
+    # Статистика районов
+    sender.add_periodic_task(
+        float(settings.district_stats_refresh_interval),
+        refresh_district_stats_task.s(),
+        name="refresh-district-stats"
+    )
+    sender.add_periodic_task(
+        float(settings.district_stats_full_refresh_interval),
+        refresh_district_stats_task.s(full=True),
+        name="refresh-district-stats-full"
+    )
+    
+    # Кластеризация спроса
+    sender.add_periodic_task(
+        float(settings.demand_clusters_interval),
+        build_demand_clusters_task.s(),
+        name="build-demand-clusters"
+    )
+    
+    # Свертка событий в роллапы
+    sender.add_periodic_task(
+        float(settings.rollup_compaction_interval),
+        compact_event_rollups_task.s(),
+        name="compact-event-rollups"
+    )
+    
+    # Партиции views_log: создание наперед и архивация (раз в сутки)
+    sender.add_periodic_task(
+        86400.0,
+        maintain_views_log_partitions_task.s(),
+        name="maintain-views-log-partitions"
+    )
+    
+    # Переоценка объектов, спрос которых изменился
+    sender.add_periodic_task(
+        float(settings.pricing_dirty_scan_interval),
+        enqueue_dirty_pricing_task.s(),
+        name="enqueue-dirty-pricing"
+    )
+    
+    # Страховочная полная переоценка каталога (раз в сутки)
     sender.add_periodic_task(
-        3600.0,  # каждые 3600 секунд (1 час)
+        float(settings.pricing_full_scan_interval),
         update_dynamic_pricing_task.s(),
-        name="update-pricing-every-hour"
+        name="update-pricing-full-scan"
     )
 
 
@@ -0,0 +1,108 @@
+"""
+Среда выполнения асинхронных задач в процессе воркера Celery.
+
+Каждый поток воркера (в prefork — единственный поток процесса) получает
+один цикл событий и один движок SQLAlchemy с пулом соединений размера
+settings.worker_db_pool_size. Они создаются при первом обращении или на
+worker_process_init и переиспользуются всеми задачами процесса, поэтому
+короткие задачи не платят за установку соединений и создание пула.
+Клиент Redis привязан к циклу событий и переиспользуется так же.
+На worker_process_shutdown пул закрывается, цикл событий завершается.
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, List, TypeVar
+import asyncio
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.redis_client import close_redis
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class LoopContext:
+    """Цикл событий с движком и фабрикой сессий"""
+    loop: asyncio.AbstractEventLoop
+    engine: AsyncEngine
+    session_factory: Any
+
+    @classmethod
+    def create(cls) -> "LoopContext":
+        engine = create_async_engine(
+            str(settings.database_url).replace("postgresql://", "postgresql+asyncpg://"),
+            pool_size=settings.worker_db_pool_size,
+            max_overflow=settings.worker_db_max_overflow,
+            pool_timeout=settings.worker_db_pool_timeout,
+            pool_recycle=settings.worker_db_pool_recycle,
+            pool_pre_ping=True,
+        )
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        return cls(loop=asyncio.new_event_loop(), engine=engine, session_factory=session_factory)
+
+    def close(self) -> None:
+        """Закрыть соединения пула и Redis и завершить цикл событий"""
+        async def _close():
+            await self.engine.dispose()
+            await close_redis()
+
+        try:
+            self.loop.run_until_complete(_close())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+
+
+class WorkerRuntime:
+    """Циклы событий и движки БД потоков процесса воркера"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._contexts: List[LoopContext] = []
+
+    def _context(self) -> LoopContext:
+        context = getattr(self._local, "context", None)
+        if context is None:
+            context = self._local.context = LoopContext.create()
+            with self._lock:
+                self._contexts.append(context)
+        return context
+
+    def start(self) -> None:
+        """
+        Инициализация после fork: унаследованные от родителя контексты
+        отбрасываются без закрытия (их соединения принадлежат родителю)
+        """
+        self._local = threading.local()
+        with self._lock:
+            self._contexts = []
+        self._context()
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Выполнить корутину в цикле событий текущего потока"""
+        context = self._context()
+        asyncio.set_event_loop(context.loop)
+        return context.loop.run_until_complete(coro)
+
+    def session(self) -> AsyncSession:
+        """Новая сессия из пула текущего потока; закрывается вызывающим"""
+        return self._context().session_factory()
+
+    def shutdown(self) -> None:
+        """Закрыть все контексты процесса"""
+        with self._lock:
+            contexts, self._contexts = self._contexts, []
+        self._local = threading.local()
+        for context in contexts:
+            try:
+                context.close()
+            except Exception as e:
+                print(f"Ошибка при закрытии среды выполнения воркера: {e}")
+
+
+worker_runtime = WorkerRuntime()
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """
 Скрипт для запуска Celery worker
+
+Без аргументов — аргументы командной строки Celery как есть.
+С именем очереди (interactive, celery, bulk) — worker только этой очереди
+с числом процессов из настроек: python run_worker.py interactive
 """
 import sys
 import os
@@ -9,5 +13,15 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 if __name__ == "__main__":
-    from app.worker import celery_app
-    celery_app.start() 
\ No newline at end of file
+    from app.worker import celery_app, QUEUE_CONCURRENCY
+    if len(sys.argv) == 2 and sys.argv[1] in QUEUE_CONCURRENCY:
+        queue = sys.argv[1]
+        celery_app.worker_main([
+            "worker",
+            "--loglevel=info",
+            "--queues", queue,
+            "--concurrency", str(QUEUE_CONCURRENCY[queue]),
+            "--hostname", f"{queue}@%h"
+        ])
+    else:
+        celery_app.start()
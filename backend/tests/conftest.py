@@ -0,0 +1,165 @@
+"""Общие фикстуры тестов"""
+import pytest
+
+from app.services.job_scheduler import RELEASE_SCRIPT, RENEW_SCRIPT
+
+
+def _encode(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class FakePipeline:
+    """Копит команды и выполняет их по порядку на FakeRedis"""
+    
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+    
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        
+        def _call(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return self
+        return _call
+    
+    async def execute(self):
+        calls, self.calls = self.calls, []
+        return [await method(*args, **kwargs) for method, args, kwargs in calls]
+
+
+class FakeRedis:
+    """Строки, хеши, списки, множества и sorted set Redis в памяти.
+    
+    Как и клиент без decode_responses, возвращает значения в bytes.
+    Из Lua-скриптов поддерживаются только скрипты аренды планировщика.
+    """
+    
+    def __init__(self):
+        self.data = {}
+        self.published = []
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+    
+    async def get(self, key):
+        return self.data.get(key)
+    
+    async def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = _encode(value)
+        return True
+    
+    async def getdel(self, key):
+        return self.data.pop(key, None)
+    
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+    
+    async def incrby(self, key, amount=1):
+        value = int(self.data.get(key, b"0")) + amount
+        self.data[key] = _encode(value)
+        return value
+    
+    async def incr(self, key):
+        return await self.incrby(key)
+    
+    async def expire(self, key, ttl):
+        return key in self.data
+    
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+    
+    async def eval(self, script, numkeys, key, token, *args):
+        assert script in (RENEW_SCRIPT, RELEASE_SCRIPT)
+        if self.data.get(key) != _encode(token):
+            return 0
+        if script == RELEASE_SCRIPT:
+            del self.data[key]
+        return 1
+    
+    async def hset(self, key, mapping):
+        values = self.data.setdefault(key, {})
+        values.update({_encode(field): _encode(value) for field, value in mapping.items()})
+        return len(mapping)
+    
+    async def hget(self, key, field):
+        return self.data.get(key, {}).get(_encode(field))
+    
+    async def hmget(self, key, *fields):
+        values = self.data.get(key, {})
+        return [values.get(_encode(field)) for field in fields]
+    
+    async def hincrby(self, key, field, amount=1):
+        values = self.data.setdefault(key, {})
+        value = int(values.get(_encode(field), b"0")) + amount
+        values[_encode(field)] = _encode(value)
+        return value
+    
+    async def hdel(self, key, *fields):
+        values = self.data.get(key, {})
+        return sum(values.pop(_encode(field), None) is not None for field in fields)
+    
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+    
+    async def lpush(self, key, *values):
+        items = self.data.setdefault(key, [])
+        for value in values:
+            items.insert(0, _encode(value))
+        return len(items)
+    
+    async def ltrim(self, key, start, end):
+        self.data[key] = await self.lrange(key, start, end)
+        return True
+    
+    async def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+    
+    async def llen(self, key):
+        return len(self.data.get(key, []))
+    
+    async def sadd(self, key, *members):
+        members = {_encode(member) for member in members}
+        values = self.data.setdefault(key, set())
+        added = len(members - values)
+        values.update(members)
+        return added
+    
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+    
+    async def pfadd(self, key, *members):
+        # Точный подсчет вместо HyperLogLog
+        return await self.sadd(key, *members) > 0
+    
+    async def pfcount(self, *keys):
+        return len(set().union(*(self.data.get(key, set()) for key in keys)))
+    
+    async def zadd(self, key, mapping):
+        values = self.data.setdefault(key, {})
+        added = sum(_encode(member) not in values for member in mapping)
+        values.update({_encode(member): float(score) for member, score in mapping.items()})
+        return added
+    
+    async def zrangebyscore(self, key, min, max, withscores=False):
+        low, high = float(min), float(max)
+        items = sorted(
+            ((member, score) for member, score in self.data.get(key, {}).items() if low <= score <= high),
+            key=lambda item: (item[1], item[0])
+        )
+        return items if withscores else [member for member, _ in items]
+    
+    async def zremrangebyscore(self, key, min, max):
+        removed = await self.zrangebyscore(key, min, max)
+        for member in removed:
+            del self.data[key][member]
+        return len(removed)
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
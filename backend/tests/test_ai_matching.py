@@ -0,0 +1,67 @@
+"""Потоковый пакетный подбор совпадает с синхронным"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.models import PropertyType, PropertyCategory
+from app.schemas import PropertyMatchBatchItem
+from app.services.ai_matching import aiter_batch_matches, iter_batch_matches
+from app.services.catalog import CatalogSnapshot
+
+
+NOW = datetime(2024, 6, 1)
+CITIES = ["Москва", "Казань"]
+DISTRICTS = ["Центральный", "Северный", None]
+
+
+def make_snapshot(n: int, seed: int = 0) -> CatalogSnapshot:
+    rng = np.random.default_rng(seed)
+    snapshot = CatalogSnapshot()
+    for i in range(n):
+        snapshot._columns.upsert(SimpleNamespace(
+            id=i + 1,
+            external_id=None,
+            property_type=PropertyType.RESIDENTIAL,
+            category=PropertyCategory.FLAT_NEW,
+            developer_id=None,
+            project_id=None,
+            building_id=None,
+            has_3d_tour=False,
+            created_at=NOW - timedelta(days=int(rng.integers(0, 90))),
+            updated_at=NOW,
+            current_price=None if i % 17 == 0 else float(rng.integers(3, 30) * 250_000),
+            address_id=i + 1,
+            city=CITIES[i % len(CITIES)],
+            district=DISTRICTS[i % len(DISTRICTS)],
+            rooms=int(rng.integers(1, 5)),
+            total_area=float(rng.integers(25, 120)),
+            floor=int(rng.integers(1, 25)),
+            features_id=None,
+            balcony=False,
+            parking_type=None,
+            demand_score=int(rng.integers(0, 100)),
+            clicks_total=int(rng.integers(0, 5000))
+        ))
+    return snapshot
+
+
+async def test_async_batch_matches_sync():
+    snapshot = make_snapshot(400)
+    profiles = [
+        PropertyMatchBatchItem(profile_id="a", budget=4_000_000, preferred_cities=["Москва"]),
+        PropertyMatchBatchItem(
+            profile_id="b", budget=6_500_000, preferred_cities=["Казань"],
+            preferred_districts=["Северный"], min_rooms=2, max_area=90
+        ),
+        PropertyMatchBatchItem(budget=100_000, preferred_cities=["Тверь"]),
+    ]
+    expected = list(iter_batch_matches(snapshot, profiles, 15))
+    streamed = [item async for item in aiter_batch_matches(snapshot, profiles, 15)]
+    assert [item["index"] for item in streamed] == [0, 1, 2]
+    assert [item["profile_id"] for item in streamed] == ["a", "b", None]
+    for got, want in zip(streamed, expected):
+        assert [r["property_id"] for r in got["results"]] == [r["property_id"] for r in want["results"]]
+        np.testing.assert_allclose(
+            [r["score"] for r in got["results"]], [r["score"] for r in want["results"]], atol=2e-6
+        )
@@ -0,0 +1,237 @@
+"""Снимок каталога и SQL-выборка списка объектов дают одинаковый результат"""
+from datetime import datetime
+import math
+
+import pytest
+from sqlalchemy import create_engine, delete
+from sqlmodel import Session, SQLModel
+
+from app.api.properties import properties_query
+from app.crud import crud_property, crud_property_address, crud_property_price
+from app.models import (
+    Property, PropertyPrice, PropertyAddress, ResidentialProperty, PropertyFeatures,
+    PropertyAnalytics, PropertyStatus, PropertyType, PropertyCategory
+)
+from app.services import catalog as catalog_module
+from app.services.catalog import CatalogSnapshot
+
+
+TABLES = [
+    Property.__table__, PropertyPrice.__table__, PropertyAddress.__table__,
+    ResidentialProperty.__table__, PropertyFeatures.__table__, PropertyAnalytics.__table__
+]
+
+# (цена, комнаты, площадь); None в позиции сателлита — записи нет
+CATALOG = [
+    (5_000_000, 2, 55.0),
+    (7_500_000, 3, 80.0),
+    (3_000_000, 1, None),
+    (4_000_000, None, 40.0),
+    (None, 2, 60.0),
+    (6_000_000, None, None),
+]
+NO_RESIDENTIAL = {6}
+
+
+@pytest.fixture(scope="module")
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine, tables=TABLES)
+    with Session(engine) as session:
+        now = datetime(2024, 1, 1)
+        for property_id, (price, rooms, area) in enumerate(CATALOG, start=1):
+            session.add(Property(
+                id=property_id,
+                property_type=PropertyType.RESIDENTIAL,
+                category=PropertyCategory.FLAT_NEW,
+                status=PropertyStatus.AVAILABLE,
+                created_at=now,
+                updated_at=now
+            ))
+            if price is not None:
+                session.add(PropertyPrice(property_id=property_id, base_price=price, current_price=price))
+            if property_id not in NO_RESIDENTIAL:
+                session.add(ResidentialProperty(property_id=property_id, rooms=rooms, total_area=area))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def snapshot(session):
+    snapshot = CatalogSnapshot()
+    for row in session.execute(CatalogSnapshot._rows_query()):
+        snapshot._columns.upsert(row)
+    return snapshot
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"min_area": 50},
+    {"max_area": 70},
+    {"min_area": 30, "max_area": 90},
+    {"rooms": 2},
+    {"rooms": 2, "min_area": 58},
+    {"min_price": 4_500_000},
+    {"max_price": 5_500_000, "min_area": 30},
+])
+def test_snapshot_filter_matches_sql(session, snapshot, filters):
+    sql_ids = sorted(
+        p.id for p in session.execute(properties_query(status=PropertyStatus.AVAILABLE, **filters)).scalars()
+    )
+    rows = snapshot.filter(strict_area=True, **filters)
+    snapshot_ids = [p.id for p in snapshot.property_reads(rows)]
+    assert snapshot_ids == sql_ids
+
+
+def test_match_filter_keeps_missing_area(snapshot):
+    # Подбор по-прежнему не отсекает объекты без площади
+    rows = snapshot.filter(min_area=50)
+    ids = {p.id for p in snapshot.property_reads(rows)}
+    assert {3, 6} <= ids
+
+
+class _Stream:
+    def __init__(self, result):
+        self.result = result
+    
+    async def partitions(self):
+        for partition in self.result.partitions():
+            yield partition
+
+
+class _AsyncSession:
+    """Асинхронный интерфейс AsyncSession поверх синхронной сессии SQLite"""
+    
+    def __init__(self, session):
+        self.session = session
+    
+    async def execute(self, query):
+        return self.session.execute(query)
+    
+    async def stream(self, query):
+        return _Stream(self.session.execute(query))
+    
+    def add(self, obj):
+        self.session.add(obj)
+    
+    async def delete(self, obj):
+        self.session.delete(obj)
+    
+    async def commit(self):
+        self.session.commit()
+    
+    async def refresh(self, obj):
+        self.session.refresh(obj)
+
+
+@pytest.mark.parametrize("filters", [
+    {"budget": 5_000_000},
+    {"budget": 3_000_000},
+    {"budget": 8_000_000, "min_rooms": 2},
+    {"budget": 8_000_000, "max_rooms": 1},
+    {"budget": 8_000_000, "min_area": 50, "max_area": 70},
+    {"budget": 8_000_000, "property_type": PropertyType.RESIDENTIAL, "category": PropertyCategory.FLAT_NEW},
+])
+async def test_match_candidates_match_snapshot(session, snapshot, filters):
+    candidates = await crud_property.get_match_candidates(_AsyncSession(session), budget_overshoot=1.2, **filters)
+    rows = snapshot.filter(budget_overshoot=1.2, **filters)
+    assert sorted(p.id for p in candidates) == sorted(p.id for p in snapshot.property_reads(rows))
+
+
+async def test_match_candidates_are_ordered_by_budget_distance(session):
+    candidates = await crud_property.get_match_candidates(_AsyncSession(session), budget=5_000_000, limit=3)
+    # 7.5 млн выше бюджета с допуском; при равной разнице цен порядок по ID
+    assert [p.id for p in candidates] == [1, 4, 6]
+    # Объект без цены проходит фильтр бюджета, но сортируется последним
+    candidates = await crud_property.get_match_candidates(_AsyncSession(session), budget=5_000_000)
+    assert [p.id for p in candidates] == [1, 4, 6, 3, 5]
+
+
+@pytest.fixture
+def db(fake_redis, monkeypatch):
+    monkeypatch.setattr(catalog_module, "get_redis", lambda: fake_redis)
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine, tables=TABLES)
+    with Session(engine) as session:
+        for property_id in (1, 2):
+            session.add(Property(
+                id=property_id,
+                property_type=PropertyType.RESIDENTIAL,
+                category=PropertyCategory.FLAT_NEW,
+                status=PropertyStatus.AVAILABLE,
+                updated_at=datetime(2024, 1, 1)
+            ))
+            session.add(PropertyPrice(property_id=property_id, base_price=1_000_000, current_price=1_000_000))
+        session.commit()
+        yield _AsyncSession(session)
+    engine.dispose()
+
+
+def _price(snapshot, property_id):
+    columns = snapshot._columns
+    return columns.price[columns.row_by_id[property_id]]
+
+
+async def test_price_writes_reach_incremental_refresh(db):
+    snapshot = CatalogSnapshot()
+    await snapshot.load(db)
+    await crud_property_price.delete(db, 1)
+    await crud_property_price.update(db, await crud_property_price.get(db, 2), {"current_price": 2_000_000})
+    assert await snapshot.refresh(db)
+    assert math.isnan(_price(snapshot, 1)) and _price(snapshot, 2) == 2_000_000
+    await crud_property_price.create(db, {"property_id": 1, "base_price": 500_000, "current_price": 500_000})
+    await snapshot.refresh(db)
+    assert _price(snapshot, 1) == 500_000
+
+
+async def test_address_writes_reach_incremental_refresh(db):
+    snapshot = CatalogSnapshot()
+    await snapshot.load(db)
+    address = {"property_id": 1, "address_full": "Москва, ул. Тверская, 1", "city": "Москва", "region": "Москва",
+               "lat": 55.76, "lng": 37.61}
+    await crud_property_address.create(db, address)
+    await snapshot.refresh(db)
+    columns = snapshot._columns
+    assert columns.cities[columns.city[columns.row_by_id[1]]] == "Москва"
+    await crud_property_address.delete(db, 1)
+    await snapshot.refresh(db)
+    assert not columns.has_address[columns.row_by_id[1]]
+
+
+async def test_deleted_property_leaves_every_snapshot(db):
+    local, other = CatalogSnapshot(), CatalogSnapshot()
+    await local.load(db)
+    await other.load(db)
+    await db.execute(delete(Property).where(Property.id == 2))
+    await db.commit()
+    await local.delete(2)
+    assert len(local) == 1
+    # Другой процесс не видит удаление по updated_at, но применяет отметку из Redis
+    assert await other.refresh(db)
+    assert sorted(other._columns.row_by_id) == [1]
+    assert await other.refresh(db) and len(other) == 1
+
+
+async def test_refresh_reports_unavailable_tombstones(db, monkeypatch):
+    snapshot = CatalogSnapshot()
+    await snapshot.load(db)
+    
+    def _broken():
+        raise ConnectionError("redis")
+    
+    monkeypatch.setattr(catalog_module, "get_redis", _broken)
+    await snapshot.delete(1)
+    assert len(snapshot) == 1
+    assert not await snapshot.refresh(db)
+
+
+async def test_sync_drops_deleted_property_before_caching(db):
+    snapshot = CatalogSnapshot()
+    await snapshot.load(db)
+    await db.execute(delete(Property).where(Property.id == 1))
+    await db.commit()
+    await CatalogSnapshot().delete(1)  # Удаление в другом процессе API
+    await crud_property_price.delete(db, 2)
+    await snapshot.sync(db, 1)
+    assert sorted(snapshot._columns.row_by_id) == [2] and math.isnan(_price(snapshot, 2))
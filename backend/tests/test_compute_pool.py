@@ -0,0 +1,56 @@
+"""Пул процессов для CPU-ядер с передачей массивов через shared memory"""
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.compute_pool import ALIGNMENT, ComputePool, _plan
+
+
+def scale_kernel(values: np.ndarray, counts: np.ndarray, factor: float) -> np.ndarray:
+    return values * counts * factor
+
+
+def split_kernel(values: np.ndarray) -> tuple:
+    return values + 1.0, values * 2.0
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "compute_pool_workers", 1)
+    monkeypatch.setattr(settings, "compute_pool_min_size", 4)
+    pool = ComputePool()
+    yield pool
+    pool.shutdown()
+
+
+def test_plan_aligns_arrays():
+    arrays = [np.zeros(3, dtype=np.float64), np.zeros(5, dtype=np.int32)]
+    inputs, outputs, size = _plan(arrays, 2, 3)
+    offsets = [offset for offset, _, _ in inputs + outputs]
+    assert offsets == [0, ALIGNMENT, 2 * ALIGNMENT, 3 * ALIGNMENT]
+    assert inputs[1][1:] == (np.dtype(np.int32).str, (5,))
+    assert size == 4 * ALIGNMENT
+
+
+async def test_small_arrays_run_inline(pool):
+    values = np.array([1.0, 2.0])
+    result = await pool.run(scale_kernel, [values, np.array([3, 4])], 0.5)
+    assert result.tolist() == [1.5, 4.0]
+    assert (pool.inline, pool.offloaded) == (1, 0)
+
+
+async def test_large_arrays_run_in_pool(pool):
+    values = np.arange(10, dtype=np.float64)
+    counts = np.arange(10, dtype=np.int64)
+    result = await pool.run(scale_kernel, [values, counts], 2.0)
+    assert np.array_equal(result, values * counts * 2.0)
+    plus, double = await pool.run(split_kernel, [values], n_outputs=2)
+    assert np.array_equal(plus, values + 1.0) and np.array_equal(double, values * 2.0)
+    assert (pool.inline, pool.offloaded, pool.failures) == (0, 2, 0)
+
+
+async def test_disabled_pool_runs_inline(pool, monkeypatch):
+    monkeypatch.setattr(settings, "compute_pool_workers", 0)
+    values = np.arange(10, dtype=np.float64)
+    assert np.array_equal(await pool.run(scale_kernel, [values, values], 1.0), values * values)
+    assert pool.stats()["workers"] == 0 and pool.inline == 1
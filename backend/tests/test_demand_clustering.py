@@ -0,0 +1,72 @@
+"""k-means кластеризация спроса"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.demand_clustering import build_features, kmeans, standardize, summarize
+
+
+def _blobs(seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0]])
+    return np.vstack([center + rng.normal(scale=0.5, size=(50, 2)) for center in centers])
+
+
+def test_kmeans_finds_separated_clusters():
+    X = _blobs()
+    result = kmeans(X, 3, 100)
+    for start in (0, 50, 100):
+        assert len(set(result.labels[start:start + 50].tolist())) == 1
+    assert len(set(result.labels.tolist())) == 3
+    assert result.inertia < 150 * 0.5 ** 2 * 2 * 1.5
+
+
+def test_kmeans_is_deterministic():
+    X = _blobs(2)
+    first, second = kmeans(X, 3, 100), kmeans(X, 3, 100)
+    assert np.array_equal(first.labels, second.labels)
+    assert np.allclose(first.centroids, second.centroids)
+
+
+def test_kmeans_caps_k_by_points():
+    X = np.array([[0.0, 0.0], [1.0, 1.0]])
+    result = kmeans(X, 5, 10)
+    assert len(result.centroids) == 2
+    assert result.inertia == 0.0
+
+
+def test_standardize_fills_missing_with_median():
+    raw = np.array([
+        [100.0, 10.0, 1.0, 30.0, 2.0, 0.0],
+        [200.0, np.nan, 2.0, 60.0, 4.0, 10.0],
+        [400.0, 30.0, np.nan, np.nan, 6.0, 100.0],
+    ])
+    X = standardize(raw)
+    assert not np.isnan(X).any()
+    assert np.allclose(X.mean(axis=0), 0.0)
+    # Пропуск получает медиану двух известных значений, она же среднее столбца: после нормировки 0
+    assert np.allclose([X[1, 1], X[2, 2], X[2, 3]], 0.0)
+    assert np.allclose(X.std(axis=0), 1.0)
+
+
+def test_summarize_orders_clusters_by_price():
+    raw = np.array([
+        [900.0, 9.0, 3.0, 100.0, 8.0, 50.0],
+        [100.0, 1.0, 1.0, 100.0, 2.0, 5.0],
+        [1100.0, 11.0, 3.0, 100.0, 6.0, 40.0],
+    ])
+    clusters, labels = summarize(raw, np.array([0, 1, 0]), 2)
+    assert labels.tolist() == [1, 0, 1]
+    assert [c["property_count"] for c in clusters] == [1, 2]
+    assert clusters[1]["centroid_price"] == 1000.0
+    assert clusters[1]["min_price"] == 900.0 and clusters[1]["median_demand"] == 7.0
+
+
+def test_build_features_marks_missing_as_nan():
+    row = SimpleNamespace(
+        current_price=5_000_000, price_per_m2=None, rooms=2, total_area=50.0,
+        demand_score=None, views_last_month=None
+    )
+    features = build_features([row])
+    assert np.isnan(features[0, 1])
+    assert features[0, 4] == 0 and features[0, 5] == 0
@@ -0,0 +1,84 @@
+"""Медианы спроса кластеров в движке переоценки"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import dynamic_pricing
+from app.services.dynamic_pricing import DynamicPricingService
+
+
+ROWS = [
+    SimpleNamespace(id=1, project_id=10, rooms=1),
+    SimpleNamespace(id=2, project_id=10, rooms=1),
+    SimpleNamespace(id=3, project_id=10, rooms=2),
+    SimpleNamespace(id=4, project_id=None, rooms=None),
+]
+
+
+class _Crud:
+    def __init__(self, members):
+        self.members = members
+
+    async def get_cluster_demand_rows(self, project_ids):
+        return self.members
+
+
+def _service(members=()) -> DynamicPricingService:
+    service = DynamicPricingService(None)
+    service.crud = _Crud(list(members))
+    return service
+
+
+@pytest.fixture(autouse=True)
+def no_demand_clusters(monkeypatch):
+    monkeypatch.setattr(settings, "pricing_use_demand_clusters", False)
+
+
+async def test_uses_precomputed_cluster_stats(monkeypatch):
+    async def get_medians(session):
+        return {(10, 1): 40.0, (10, 2): 70.0}
+
+    monkeypatch.setattr(dynamic_pricing.crud_cluster_demand_stats, "get_medians", get_medians)
+    medians = await _service()._get_cluster_medians(ROWS, None)
+    np.testing.assert_allclose(medians, [40.0, 40.0, 70.0, 0.0])
+
+
+async def test_falls_back_to_medians_excluding_self(monkeypatch):
+    async def get_medians(session):
+        return {}
+
+    monkeypatch.setattr(dynamic_pricing.crud_cluster_demand_stats, "get_medians", get_medians)
+    members = [
+        SimpleNamespace(id=1, project_id=10, rooms=1, demand_score=20),
+        SimpleNamespace(id=2, project_id=10, rooms=1, demand_score=60),
+        SimpleNamespace(id=5, project_id=10, rooms=1, demand_score=80),
+        SimpleNamespace(id=3, project_id=10, rooms=2, demand_score=None),
+    ]
+    medians = await _service(members)._compute_cluster_medians(ROWS, [1, 2, 3, 4])
+    # Объект 1: медиана (60, 80); объект 2: (20, 80); у 3 и 4 соседей с оценкой нет
+    np.testing.assert_allclose(medians, [70.0, 50.0, 0.0, 0.0])
+
+
+async def test_find_dirty_properties_applies_thresholds(monkeypatch):
+    monkeypatch.setattr(settings, "pricing_dirty_min_views", 10)
+    monkeypatch.setattr(settings, "pricing_dirty_min_bookings", 1)
+    claimed = {}
+
+    class _DirtyCrud:
+        async def claim_properties_with_new_events(self, since):
+            claimed["since"] = since
+            return [1, 2, 3]
+
+        async def get_activity_since_last_change(self, property_ids, default_since):
+            assert default_since == claimed["since"]
+            return {
+                1: {"views": 12, "bookings": 0},
+                2: {"views": 3, "bookings": 1},
+                3: {"views": 9, "bookings": 0},
+            }
+
+    service = DynamicPricingService(None)
+    service.crud = _DirtyCrud()
+    assert await service.find_dirty_properties() == [1, 2]
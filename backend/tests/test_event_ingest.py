@@ -0,0 +1,117 @@
+"""Прием событий: лимит и отсев повторов, повторы записи с паузой и пределом попыток"""
+import pytest
+
+from app.config import settings
+from app.models import ViewEvent
+from app.schemas import ViewEventIngest
+from app.services import event_ingest
+from app.services.event_ingest import EventIngestBuffer, EventIngestGuard, EventRateLimited
+
+
+class _BrokenRedis:
+    def pipeline(self, transaction=True):
+        raise ConnectionError("redis")
+
+
+def _event(property_id: int, session_id=None, event=ViewEvent.VIEW) -> ViewEventIngest:
+    return ViewEventIngest(property_id=property_id, event=event, session_id=session_id)
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(event_ingest, "get_redis", lambda: fake_redis)
+    return fake_redis
+
+
+async def test_repeated_events_are_admitted_once(redis):
+    guard = EventIngestGuard()
+    events = [_event(1, "s1"), _event(1, "s1"), _event(1, "s2"), _event(1, "s1", ViewEvent.FAVOURITE), _event(2)]
+    assert await guard.admit("10.0.0.1", events) == [events[0], events[2], events[3], events[4]]
+    # Без session_id посетитель определяется адресом клиента
+    assert await guard.admit("10.0.0.1", [_event(2), _event(1, "s1")]) == []
+    assert await guard.admit("10.0.0.2", [_event(2)]) == [_event(2)]
+    assert guard.duplicates == 3
+
+
+async def test_forgotten_events_are_admitted_again(redis):
+    guard = EventIngestGuard()
+    events = [_event(1, "s1")]
+    await guard.admit("c", events)
+    await guard.forget("c", events)
+    assert await guard.admit("c", events) == events
+
+
+async def test_rate_limit_per_client(redis, monkeypatch):
+    monkeypatch.setattr(settings, "event_ingest_rate_limit", 3)
+    guard = EventIngestGuard()
+    await guard.admit("a", [_event(1), _event(2)])
+    with pytest.raises(EventRateLimited) as error:
+        await guard.admit("a", [_event(3), _event(4)])
+    assert 1 <= error.value.retry_after <= settings.event_ingest_rate_window
+    assert await guard.admit("b", [_event(3)]) == [_event(3)]
+    assert guard.limited == 2
+
+
+async def test_redis_errors_do_not_block_ingestion(monkeypatch):
+    monkeypatch.setattr(event_ingest, "get_redis", lambda: _BrokenRedis())
+    guard = EventIngestGuard()
+    events = [_event(1), _event(1)]
+    assert await guard.admit("a", events) == events
+    assert guard.guard_errors == 1
+
+
+class _FailingBuffer(EventIngestBuffer):
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+        self.written_rows = []
+    
+    async def _write(self, session_factory, rows):
+        if self.fail:
+            raise ConnectionError("db")
+        self.written_rows.extend(rows)
+
+
+async def test_failed_rows_are_dropped_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "event_ingest_max_attempts", 3)
+    buffer = _FailingBuffer()
+    buffer.add([_event(1), _event(2)])
+    for _ in range(2):
+        assert await buffer.flush() == 0
+        assert len(buffer) == 2
+    # Новые события начинают со своего счетчика попыток
+    buffer.add([_event(3)])
+    assert await buffer.flush() == 0
+    assert len(buffer) == 1 and buffer.dropped == 2
+    buffer.fail = False
+    assert await buffer.flush() == 1
+    assert [row[0] for row in buffer.written_rows] == [3]
+
+
+async def test_requeue_respects_buffer_limit(monkeypatch):
+    monkeypatch.setattr(settings, "event_ingest_max_pending", 3)
+    buffer = _FailingBuffer()
+    buffer.add([_event(1), _event(2), _event(3)])
+    rows, attempts = buffer._pending, buffer._attempts
+    buffer._pending, buffer._attempts = [], []
+    buffer.add([_event(4), _event(5)])
+    buffer._requeue(rows, attempts)
+    assert [row[0] for row in buffer._pending] == [1, 4, 5]
+    assert buffer._attempts == [1, 0, 0]
+    assert buffer.rejected == 2
+
+
+async def test_flush_delay_backs_off_and_resets(monkeypatch):
+    monkeypatch.setattr(settings, "event_ingest_flush_interval", 0.5)
+    monkeypatch.setattr(settings, "event_ingest_max_backoff", 3.0)
+    monkeypatch.setattr(settings, "event_ingest_max_attempts", 100)
+    buffer = _FailingBuffer()
+    buffer.add([_event(1)])
+    delays = []
+    for _ in range(4):
+        await buffer.flush()
+        delays.append(buffer._delay())
+    assert delays == [1.0, 2.0, 3.0, 3.0]
+    buffer.fail = False
+    await buffer.flush()
+    assert buffer._delay() == 0.5
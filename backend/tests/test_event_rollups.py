@@ -0,0 +1,33 @@
+"""Безопасный горизонт ID-watermark роллапов"""
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from app.crud import ID_HORIZON_LAG, _snapshot_xid, promote_id_horizon
+
+
+NOW = datetime(2024, 6, 1, 12, 0)
+EMPTY = (None, None, None)
+
+
+def test_pending_waits_for_older_transactions():
+    pending = (1000, 500, NOW - timedelta(minutes=1))
+    # Транзакция с xid 499 еще активна: ее строки могут иметь ID <= 1000
+    assert promote_id_horizon(200, pending, 499, NOW) == (200, pending)
+    assert promote_id_horizon(200, pending, 500, NOW) == (1000, EMPTY)
+
+
+def test_pending_waits_for_lag():
+    pending = (1000, 500, NOW)
+    assert promote_id_horizon(200, pending, 900, NOW + ID_HORIZON_LAG / 2) == (200, pending)
+    assert promote_id_horizon(200, pending, 900, NOW + ID_HORIZON_LAG) == (1000, EMPTY)
+
+
+def test_horizon_never_moves_back():
+    assert promote_id_horizon(2000, (1000, 500, NOW - ID_HORIZON_LAG), 900, NOW) == (2000, EMPTY)
+    assert promote_id_horizon(2000, EMPTY, 900, NOW) == (2000, EMPTY)
+
+
+def test_snapshot_bounds_are_cast_to_bigint():
+    sql = str(_snapshot_xid("pg_snapshot_xmin").compile(dialect=postgresql.dialect()))
+    assert sql == "CAST(CAST(pg_snapshot_xmin(pg_current_snapshot()) AS VARCHAR) AS BIGINT)"
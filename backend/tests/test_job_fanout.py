@@ -0,0 +1,52 @@
+"""Прогресс и сводка массовых задач, разбитых на пачки"""
+import pytest
+
+from app.services import job_fanout
+from app.services.job_fanout import FanoutProgress
+from app.worker import _aggregate_chunks
+
+
+@pytest.fixture
+def progress(fake_redis, monkeypatch):
+    monkeypatch.setattr(job_fanout, "get_redis", lambda: fake_redis)
+    return FanoutProgress()
+
+
+async def test_progress_counts_chunks(progress):
+    await progress.start("j", "stats", 3)
+    await progress.chunk_done("j", 100, 90)
+    await progress.chunk_retried("j", "timeout")
+    await progress.chunk_done("j", 50, 50)
+    state = await progress.get("j")
+    assert state["status"] == "running"
+    assert (state["done_chunks"], state["retried_chunks"], state["processed"], state["updated"]) == (2, 1, 150, 140)
+    assert (await progress.finish("j"))["status"] == "success"
+
+
+async def test_failed_chunk_makes_job_partial(progress):
+    await progress.start("j", "pricing", 2)
+    await progress.chunk_done("j", 10, 1)
+    await progress.chunk_failed("j", "x" * 1000)
+    state = await progress.finish("j")
+    assert state["status"] == "partial"
+    assert len(state["last_error"]) == job_fanout.MAX_ERROR_LENGTH
+
+
+async def test_unknown_job(progress):
+    assert await progress.get("missing") is None
+
+
+def test_aggregate_chunks():
+    summary = _aggregate_chunks([
+        {"status": "success", "first_id": 1, "last_id": 10, "processed": 10, "updated": 4, "duration": 1.5},
+        {"status": "error", "first_id": 11, "last_id": 20, "error": "db"},
+        {"status": "success", "first_id": 21, "last_id": 30, "processed": 5, "updated": 5, "duration": 0.5},
+    ])
+    assert summary == {
+        "chunks": 3,
+        "failed_chunks": 1,
+        "processed": 15,
+        "updated": 9,
+        "max_chunk_duration": 1.5,
+        "error_sample": ["ID 11-20: db"]
+    }
@@ -0,0 +1,121 @@
+"""Результаты пачек в Celery — только счетчики, подробности — в job_runs / job_run_items"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import worker
+from app.crud import crud_job_run
+from app.services.job_scheduler import JobSpec
+
+
+SPEC = JobSpec("pricing_full", 60.0)
+
+
+class _Session:
+    def __init__(self):
+        self.executed = []
+        self.commits = 0
+    
+    async def execute(self, statement, params=None):
+        self.executed.append((str(statement.compile(dialect=postgresql.dialect())), params))
+        return SimpleNamespace(rowcount=2)
+    
+    async def commit(self):
+        self.commits += 1
+    
+    async def close(self):
+        pass
+
+
+class _Recorder:
+    def __init__(self):
+        self.calls = []
+    
+    def __getattr__(self, name):
+        async def _call(*args):
+            self.calls.append((name, args))
+        return _call
+
+
+class _Worker:
+    def __init__(self, session):
+        pass
+    
+    async def get_property_ids_in_range(self, first_id, last_id, available_only):
+        return list(range(first_id, last_id + 1))
+
+
+class _Task:
+    max_retries = 2
+    
+    def __init__(self, retries):
+        self.request = SimpleNamespace(retries=retries)
+    
+    def retry(self, exc, countdown):
+        return RuntimeError(f"retry in {countdown}")
+
+
+@pytest.fixture
+def chunk_env(monkeypatch):
+    env = SimpleNamespace(progress=_Recorder(), items=[])
+    
+    async def _session():
+        return _Session()
+    
+    async def _add_items(session, job_id, items):
+        env.items.extend(items)
+    
+    monkeypatch.setattr(worker, "get_async_session", _session)
+    monkeypatch.setattr(worker, "CRUDWorker", _Worker)
+    monkeypatch.setattr(worker, "fanout_progress", env.progress)
+    monkeypatch.setattr(worker, "job_scheduler", _Recorder())
+    monkeypatch.setattr(worker.crud_job_run, "add_items", _add_items)
+    yield env
+    worker.worker_runtime.shutdown()
+
+
+def test_chunk_result_is_a_summary(chunk_env):
+    async def _process(session, property_ids):
+        return len(property_ids) - 1
+    
+    result = worker._run_chunk(_Task(0), SPEC, "job", 1, 5, _process)
+    assert set(result) == {"status", "first_id", "last_id", "processed", "updated", "duration"}
+    assert (result["processed"], result["updated"]) == (5, 4)
+    assert chunk_env.progress.calls == [("chunk_done", ("job", 5, 4))]
+
+
+def test_failed_chunk_is_retried_then_logged(chunk_env):
+    async def _process(session, property_ids):
+        raise ValueError("boom")
+    
+    with pytest.raises(RuntimeError, match="retry in"):
+        worker._run_chunk(_Task(0), SPEC, "job", 1, 5, _process)
+    result = worker._run_chunk(_Task(2), SPEC, "job", 1, 5, _process)
+    assert result == {"status": "error", "first_id": 1, "last_id": 5, "error": "boom"}
+    assert chunk_env.items == [{"status": "error", "detail": "ID 1-5: boom"}]
+    assert [name for name, _ in chunk_env.progress.calls] == ["chunk_retried", "chunk_failed"]
+
+
+async def test_add_items_is_one_insert():
+    session = _Session()
+    assert await crud_job_run.add_items(session, "job", []) == 0
+    assert not session.executed
+    assert await crud_job_run.add_items(session, "job", [{"status": "a"}, {"status": "b"}]) == 2
+    (sql, params), = session.executed
+    assert sql.startswith("INSERT INTO job_run_items")
+    assert [row["run_id"] for row in params] == ["job", "job"]
+
+
+async def test_finish_computes_duration_in_sql():
+    session = _Session()
+    await crud_job_run.finish(session, "job", "success", processed=10)
+    sql, _ = session.executed[0]
+    assert "EXTRACT(epoch FROM" in sql and "job_runs.started_at" in sql
+
+
+async def test_prune_deletes_items_before_runs():
+    session = _Session()
+    assert await crud_job_run.prune(session, datetime(2024, 1, 1)) == 2
+    assert [sql.split()[2] for sql, _ in session.executed] == ["job_run_items", "job_runs"]
@@ -0,0 +1,120 @@
+"""Аренды, наложение запусков и адаптивные интервалы периодических задач"""
+import pytest
+
+from app.config import settings
+from app.services import job_scheduler as scheduler_module
+from app.services.job_scheduler import (
+    OVERLAP_COALESCE, JobScheduler, JobSpec
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(fake_redis, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(scheduler_module, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(scheduler_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def scheduler(clock):
+    scheduler = JobScheduler()
+    scheduler.backlog = 0
+    
+    async def _depth():
+        return scheduler.backlog
+    
+    scheduler._queue_depth = _depth
+    return scheduler
+
+
+SPEC = JobSpec("stats", 60.0)
+COALESCED = JobSpec("compaction", 60.0, OVERLAP_COALESCE)
+
+
+async def test_overlapping_run_is_skipped(scheduler):
+    assert await scheduler.try_start(SPEC, "a") is None
+    assert await scheduler.try_start(SPEC, "b", force=True) == "running"
+    assert await scheduler.finish(SPEC, "a") is None
+    state = await scheduler.get_state(SPEC)
+    assert (state["skipped"], state["runs"], state["status"]) == (1, 1, "success")
+
+
+async def test_coalesced_calls_rerun_once(scheduler):
+    assert await scheduler.try_start(COALESCED, "a") is None
+    for token in ("b", "c"):
+        assert await scheduler.try_start(COALESCED, token, force=True) == "running"
+    assert await scheduler.finish(COALESCED, "a") == 0.0
+    assert await scheduler.try_start(COALESCED, "d", force=True) is None
+    assert await scheduler.finish(COALESCED, "d") is None
+
+
+async def test_shared_lock_blocks_other_job(scheduler):
+    district = JobSpec("district", 60.0, lock="district")
+    district_full = JobSpec("district_full", 600.0, lock="district")
+    assert await scheduler.try_start(district, "a") is None
+    assert await scheduler.try_start(district_full, "b") == "running"
+
+
+async def test_coalesce_ignores_lease_of_other_job(scheduler):
+    district = JobSpec("district", 60.0, OVERLAP_COALESCE, lock="district")
+    district_full = JobSpec("district_full", 600.0, lock="district")
+    assert await scheduler.try_start(district_full, "a") is None
+    assert await scheduler.try_start(district, "b") == "running"
+    await scheduler.finish(district_full, "a")
+    # Без флага от чужой аренды следующий запуск не требует повтора
+    assert await scheduler.try_start(district, "c") is None
+    assert await scheduler.finish(district, "c") is None
+    state = await scheduler.get_state(district)
+    assert state["skipped"] == 1 and "coalesced" not in state
+
+
+async def test_lease_is_renewed_and_released_only_by_owner(scheduler):
+    assert await scheduler.try_start(SPEC, "a") is None
+    assert await scheduler.renew(SPEC, "a")
+    assert not await scheduler.renew(SPEC, "b")
+    await scheduler.finish(SPEC, "b", "error")
+    # Чужой токен не снимает аренду
+    assert await scheduler.try_start(SPEC, "c", force=True) == "running"
+
+
+async def test_early_beat_call_is_throttled(scheduler, clock):
+    assert await scheduler.try_start(SPEC, "a") is None
+    clock.now += 10
+    await scheduler.finish(SPEC, "a")
+    clock.now += 30
+    assert await scheduler.try_start(SPEC, "b") == "throttled"
+    clock.now += 30
+    assert await scheduler.try_start(SPEC, "b") is None
+
+
+async def test_interval_follows_duration_and_backlog(scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "job_runtime_factor", 2.0)
+    monkeypatch.setattr(settings, "job_backlog_threshold", 100)
+    monkeypatch.setattr(settings, "job_max_interval_factor", 10.0)
+    assert await scheduler._next_interval(SPEC, 10.0) == 60.0
+    assert await scheduler._next_interval(SPEC, 45.0) == 90.0
+    scheduler.backlog = 100
+    assert await scheduler._next_interval(SPEC, 45.0) == 180.0
+    scheduler.backlog = 10_000
+    assert await scheduler._next_interval(SPEC, 45.0) == 600.0
+
+
+async def test_finish_smooths_duration(scheduler, clock, monkeypatch):
+    monkeypatch.setattr(settings, "job_duration_smoothing", 0.5)
+    for token, duration in (("a", 10), ("b", 30)):
+        await scheduler.try_start(SPEC, token, force=True)
+        clock.now += duration
+        await scheduler.finish(SPEC, token, "error" if token == "b" else "success")
+    state = await scheduler.get_state(SPEC)
+    assert state["ewma_duration"] == 20.0 and state["failures"] == 1
+    runs = await scheduler.get_runs(SPEC)
+    assert [run["status"] for run in runs] == ["error", "success"]
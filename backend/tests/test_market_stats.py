@@ -0,0 +1,81 @@
+"""Рыночная статистика: один агрегирующий запрос и процессный кэш по фильтрам"""
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.crud import crud_property_analytics
+from app.models import PropertyType
+from app.services import stats_aggregator
+from app.services.stats_aggregator import StatsAggregatorService
+
+
+ROW = SimpleNamespace(
+    total_properties=10, new_properties=2, total_views=Decimal(1234), total_bookings=Decimal(5),
+    avg_views=Decimal("123.456"), avg_bookings=Decimal("0.5"), avg_days_on_market=Decimal("40.123")
+)
+
+
+class _Session:
+    def __init__(self):
+        self.statements = []
+    
+    async def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return SimpleNamespace(one=lambda: ROW)
+
+
+async def test_market_aggregate_is_one_query():
+    session = _Session()
+    stats = await crud_property_analytics.get_market_aggregate(
+        session, datetime(2024, 5, 2, 15, 30), property_type=PropertyType.RESIDENTIAL, city="Краснодар"
+    )
+    assert stats == {
+        "total_properties": 10, "new_properties": 2, "total_views": 1234, "total_bookings": 5,
+        "avg_views": 123.46, "avg_bookings": 0.5, "avg_days_on_market": 40.12
+    }
+    assert len(session.statements) == 1
+    sql = session.statements[0]
+    assert "JOIN property_addresses" in sql and "property_event_rollups" in sql
+    assert "properties.property_type =" in sql
+
+
+async def test_market_aggregate_without_filters_skips_address_join():
+    session = _Session()
+    await crud_property_analytics.get_market_aggregate(session, datetime(2024, 5, 2))
+    assert "property_addresses" not in session.statements[0]
+
+
+class _AnalyticsCrud:
+    def __init__(self):
+        self.calls = []
+    
+    async def get_market_aggregate(self, session, since, property_type=None, city=None):
+        self.calls.append((property_type, city))
+        return {"total_properties": len(self.calls)}
+
+
+@pytest.fixture
+def service():
+    stats_aggregator.market_stats_cache.clear()
+    service = StatsAggregatorService.__new__(StatsAggregatorService)
+    service.session = None
+    service.analytics_crud = _AnalyticsCrud()
+    yield service
+    stats_aggregator.market_stats_cache.clear()
+
+
+async def test_market_stats_are_cached_per_filters(service):
+    first = await service.get_market_stats(30, city="Краснодар")
+    assert await service.get_market_stats(30, city=" Краснодар ") == first
+    await service.get_market_stats(7, city="Краснодар")
+    await service.get_market_stats(30, PropertyType.RESIDENTIAL, "Краснодар")
+    assert len(service.analytics_crud.calls) == 3
+
+
+async def test_cached_market_stats_are_copies(service):
+    stats = await service.get_market_stats()
+    stats["total_properties"] = 100
+    assert (await service.get_market_stats())["total_properties"] == 1
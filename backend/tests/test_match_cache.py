@@ -0,0 +1,87 @@
+"""Ключи кэша подбора, дофильтровка по бюджету и синхронизация снимка с версией кэша"""
+import json
+import time
+
+from app.config import settings
+from app.schemas import PropertyMatchRequest
+from app.services.catalog import CatalogSnapshot
+from app.services.match_cache import MatchResultCache
+
+
+def _cache() -> MatchResultCache:
+    cache = MatchResultCache()
+    # Версия не запрашивается в Redis в пределах интервала проверки
+    cache._version_checked_at = time.monotonic() + 3600
+    return cache
+
+
+def _request(budget: float, cities=("Москва",)) -> PropertyMatchRequest:
+    return PropertyMatchRequest(budget=budget, preferred_cities=list(cities))
+
+
+def test_normalize_keeps_exact_budget():
+    normalized = MatchResultCache.normalize(_request(5_012_345, ["Тверь", "Москва", "Тверь"]))
+    assert normalized.budget == 5_012_345
+    assert normalized.preferred_cities == ["Москва", "Тверь"]
+
+
+async def test_key_rounds_budget_only_in_key():
+    cache = _cache()
+    granularity = settings.match_cache_budget_granularity
+    base = 100 * granularity
+    same = await cache.make_key(_request(base + granularity * 0.1), 10)
+    assert same == await cache.make_key(_request(base - granularity * 0.1), 10)
+    assert same != await cache.make_key(_request(base + granularity), 10)
+    assert same != await cache.make_key(_request(base + granularity * 0.1), 5)
+
+
+def test_within_budget_drops_unaffordable_items():
+    overshoot = settings.ai_matching_budget_overshoot
+    payload = json.dumps([
+        {"id": 1, "price": {"current_price": 1_000_000}},
+        {"id": 2, "price": {"current_price": 1_100_000 * overshoot}},
+        {"id": 3, "price": None},
+    ]).encode()
+    assert MatchResultCache.within_budget(payload, 1_200_000) is payload
+    kept = json.loads(MatchResultCache.within_budget(payload, 1_050_000))
+    assert [item["id"] for item in kept] == [1, 3]
+
+
+class _CountingSnapshot(CatalogSnapshot):
+    def __init__(self):
+        super().__init__()
+        self.refreshes = 0
+        self.loads = 0
+        self.tombstones_available = True
+
+    async def refresh(self, session):
+        self.refreshes += 1
+        return self.tombstones_available
+
+    async def load(self, session):
+        self.loads += 1
+
+
+async def test_snapshot_sync_refreshes_once_per_version():
+    snapshot = _CountingSnapshot()
+    await snapshot.sync(None, 1)
+    assert snapshot.refreshes == 0  # Снимок не загружен
+
+    snapshot.loaded_at = snapshot.watermark = time.time()
+    await snapshot.sync(None, 1)
+    await snapshot.sync(None, 1)
+    await snapshot.sync(None, 0)
+    assert snapshot.refreshes == 1
+    await snapshot.sync(None, 3)
+    assert snapshot.refreshes == 2
+    assert snapshot.synced_version == 3
+    assert snapshot.loads == 0
+
+
+async def test_snapshot_sync_reloads_without_tombstones():
+    snapshot = _CountingSnapshot()
+    snapshot.loaded_at = snapshot.watermark = time.time()
+    snapshot.tombstones_available = False
+    # Удаление могло пройти мимо инкрементального обновления
+    await snapshot.sync(None, 1)
+    assert (snapshot.refreshes, snapshot.loads, snapshot.synced_version) == (1, 1, 1)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.services.match_scoring import (
+    MatchColumns, PREFERRED_DISTRICT_BONUS, rank_candidates, score_columns_numpy, score_columns_python,
+    top_k_numpy, top_k_python, _to_timestamp
+)
+
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def make_columns(n: int, seed: int = 0) -> MatchColumns:
+    rng = np.random.default_rng(seed)
+    columns = MatchColumns()
+    for i in range(n):
+        columns.append(
+            property_id=1000 + i,
+            price=None if i % 11 == 0 else float(rng.integers(2, 20) * 500_000),
+            district=None if i % 13 == 0 else ("Центральный" if i % 3 else "Прикубанский"),
+            demand_score=None if i % 5 == 0 else float(rng.integers(0, 11)),
+            clicks_total=None if i % 7 == 0 else float(rng.integers(0, 3000)),
+            created_at=NOW - timedelta(days=int(rng.integers(0, 60)), hours=int(rng.integers(0, 24))),
+            preferred_districts=["Центральный"],
+            district_popularity=None if i % 4 else float(rng.uniform(0, 1))
+        )
+    return columns
+
+
+def test_numpy_and_python_scores_match():
+    columns = make_columns(500)
+    now_ts = _to_timestamp(NOW)
+    python_scores = score_columns_python(columns, 5_000_000, now_ts)
+    numpy_scores = score_columns_numpy(columns, 5_000_000, now_ts)
+    np.testing.assert_allclose(numpy_scores, python_scores, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("limit", [1, 10, 64, 499, 500, 1000])
+def test_numpy_and_python_rankings_match(limit):
+    columns = make_columns(500, seed=limit)
+    vectorized = rank_candidates(columns, budget=5_000_000, limit=limit, now=NOW, vectorize=True)
+    pure = rank_candidates(columns, budget=5_000_000, limit=limit, now=NOW, vectorize=False)
+    assert [property_id for property_id, _ in vectorized] == [property_id for property_id, _ in pure]
+    np.testing.assert_allclose([score for _, score in vectorized], [score for _, score in pure], atol=1e-12)
+    assert len(vectorized) == min(limit, len(columns))
+
+
+def test_ties_keep_lower_index_first():
+    scores = [0.5, 0.9, 0.5, 0.9, 0.1, 0.9]
+    assert top_k_python(scores, 4) == [1, 3, 5, 0]
+    assert top_k_numpy(np.array(scores), 4) == [1, 3, 5, 0]
+    assert top_k_numpy(np.array(scores), 2) == [1, 3]
+
+
+def test_preferred_district_bonus_applied():
+    columns = MatchColumns()
+    for district in ("Центральный", "Прикубанский"):
+        columns.append(1, 5_000_000, district, 5, 500, NOW, preferred_districts=["Центральный"], district_popularity=0.5)
+    scores = score_columns_python(columns, 5_000_000, _to_timestamp(NOW))
+    assert scores[0] == pytest.approx(scores[1] * PREFERRED_DISTRICT_BONUS)
+
+
+def test_empty_and_non_positive_limit():
+    assert rank_candidates(MatchColumns(), budget=1, limit=10) == []
+    assert rank_candidates(make_columns(3), budget=1, limit=0) == []
@@ -0,0 +1,83 @@
+"""Архивация устаревших партиций views_log"""
+from datetime import date
+from types import SimpleNamespace
+import gzip
+import os
+
+import pytest
+
+from app import partitions
+from app.config import settings
+from app.partitions import archive_expired_partitions, ensure_archive_dir
+
+
+TODAY = date(2024, 6, 15)
+OLD = "views_log_y2023m01"
+RECENT = "views_log_y2024m05"
+
+
+class _Driver:
+    async def copy_from_table(self, name, output, format, header):
+        await output(f"id,property_id\n1,{name}\n".encode())
+
+
+class _Connection:
+    def __init__(self, max_ids):
+        self.max_ids = max_ids
+        self.statements = []
+    
+    async def execute(self, statement):
+        sql = str(statement)
+        self.statements.append(sql)
+        name = sql.split('"')[1] if '"' in sql else None
+        return SimpleNamespace(scalar=lambda: self.max_ids.get(name))
+    
+    async def get_raw_connection(self):
+        return SimpleNamespace(driver_connection=_Driver())
+
+
+@pytest.fixture
+def archive(monkeypatch, tmp_path):
+    async def _partitioned(conn):
+        return True
+    
+    async def _list(conn):
+        return [OLD, RECENT]
+    
+    monkeypatch.setattr(partitions, "is_partitioned", _partitioned)
+    monkeypatch.setattr(partitions, "list_partitions", _list)
+    monkeypatch.setattr(settings, "views_log_retention_months", 13)
+    monkeypatch.setattr(settings, "views_log_archive_dir", str(tmp_path / "archive"))
+    return tmp_path / "archive"
+
+
+async def test_archives_compacted_partition(archive):
+    conn = _Connection({OLD: 100})
+    assert await archive_expired_partitions(conn, 100, TODAY) == [str(archive / f"{OLD}.csv.gz")]
+    with gzip.open(archive / f"{OLD}.csv.gz") as f:
+        assert OLD in f.read().decode()
+    assert os.listdir(archive) == [f"{OLD}.csv.gz"]
+    # Партиция блокируется от вставок до проверки max(id)
+    assert conn.statements[0].startswith(f'LOCK TABLE "{OLD}"')
+    assert f'DROP TABLE "{OLD}"' in conn.statements
+    assert not any(RECENT in sql for sql in conn.statements)
+
+
+async def test_skips_partition_past_compaction_horizon(archive):
+    conn = _Connection({OLD: 101})
+    assert await archive_expired_partitions(conn, 100, TODAY) == []
+    assert not any(sql.startswith("DROP") for sql in conn.statements)
+
+
+async def test_unwritable_archive_dir_fails_before_dropping(archive, monkeypatch):
+    archive.parent.joinpath("file").write_text("")
+    monkeypatch.setattr(settings, "views_log_archive_dir", str(archive.parent / "file" / "archive"))
+    conn = _Connection({OLD: 1})
+    with pytest.raises(RuntimeError):
+        await archive_expired_partitions(conn, 100, TODAY)
+    assert conn.statements == []
+
+
+def test_ensure_archive_dir_creates_directory(tmp_path):
+    ensure_archive_dir(str(tmp_path / "a" / "b"))
+    assert (tmp_path / "a" / "b").is_dir()
@@ -0,0 +1,104 @@
+"""Разреженная симуляция бэктеста"""
+import numpy as np
+import pytest
+
+from app.services.pricing_backtest import (
+    BacktestData, BacktestParams, _ActualPrices, _BucketEvents, _RollingSum, _sparse, simulate
+)
+
+
+P, WARMUP, PERIOD = 60, 6, 20
+N_BUCKETS = WARMUP + PERIOD
+
+
+def _events(rng, n: int) -> tuple:
+    keys = np.unique(rng.integers(0, P * N_BUCKETS, n))
+    return _sparse(keys // N_BUCKETS, keys % N_BUCKETS, rng.integers(1, 4, len(keys)))
+
+
+def _dense(sparse: tuple) -> np.ndarray:
+    dense = np.zeros((P, N_BUCKETS))
+    dense[sparse[0], sparse[1]] = sparse[2]
+    return dense
+
+
+def _data(seed: int = 0, n_changes: int = 30) -> BacktestData:
+    rng = np.random.default_rng(seed)
+    change_index = rng.integers(0, P, n_changes)
+    return BacktestData(
+        cluster_codes=np.sort(rng.integers(0, 5, P)),
+        base_prices=rng.integers(30, 60, P) * 100_000.0,
+        start_prices=rng.integers(30, 60, P) * 100_000.0,
+        views=_events(rng, 600),
+        leads=_events(rng, 100),
+        bookings=_events(rng, 80),
+        price_changes=(
+            change_index,
+            rng.integers(0, PERIOD, n_changes),
+            rng.integers(30, 60, n_changes) * 100_000.0
+        ),
+        warmup_buckets=WARMUP,
+        period_buckets=PERIOD,
+        n_clusters=5
+    )
+
+
+@pytest.mark.parametrize("width", [1, 3, WARMUP])
+def test_rolling_sum_matches_dense_window(width):
+    sparse = _events(np.random.default_rng(width), 400)
+    dense = _dense(sparse)
+    lo, hi = 10, 50
+    rolling = _RollingSum(_BucketEvents(sparse, lo, hi, N_BUCKETS), WARMUP, width)
+    for t in range(WARMUP, N_BUCKETS):
+        expected = dense[lo:hi, max(t + 1 - width, 0):t + 1].sum(axis=1)
+        np.testing.assert_allclose(rolling.advance(t), expected)
+
+
+def test_actual_prices_keep_last_change_in_bucket():
+    data = _data()
+    data.price_changes = (
+        np.array([0, 0, 1, 2]), np.array([2, 2, 0, PERIOD - 1]), np.array([1.0, 2.0, 3.0, 4.0])
+    )
+    actual = _ActualPrices(data, 0, 3)
+    paths = np.array([actual.at(step).copy() for step in range(PERIOD)])
+    assert np.all(paths[:3, 0] == data.start_prices[0]) and np.all(paths[3:, 0] == 2.0)
+    assert paths[0, 1] == data.start_prices[1] and np.all(paths[1:, 1] == 3.0)
+    # Изменение в последнем интервале на цены периода не влияет
+    assert np.all(paths[:, 2] == data.start_prices[2])
+
+
+def test_simulation_without_repricing_matches_actual():
+    data = _data(n_changes=0)
+    params = BacktestParams(
+        k1=1, k2=1, k3=1, min_price_change=0, max_price_change=0,
+        interval_buckets=1, booking_block_buckets=1, max_shift_percent=10
+    )
+    totals = simulate(data, params)
+    assert totals["simulated_price_changes"].sum() == 0
+    np.testing.assert_allclose(totals["simulated_revenue"], totals["actual_revenue"])
+    np.testing.assert_allclose(totals["simulated_price_sum"], totals["actual_price_sum"])
+    period_bookings = _dense(data.bookings)[:, WARMUP:].sum(axis=1)
+    np.testing.assert_array_equal(
+        totals["bookings"], np.bincount(data.cluster_codes, weights=period_bookings, minlength=5)
+    )
+
+
+def test_simulation_respects_update_interval():
+    data = _data(seed=3)
+    params = BacktestParams(
+        k1=1, k2=0.5, k3=2, min_price_change=-5, max_price_change=5,
+        interval_buckets=5, booking_block_buckets=1, max_shift_percent=10
+    )
+    totals = simulate(data, params)
+    # Не чаще раза в interval_buckets интервалов
+    max_changes = -(-PERIOD // params.interval_buckets)
+    assert np.all(totals["simulated_price_changes"] <= totals["property_count"] * max_changes)
+    assert totals["simulated_price_changes"].sum() > 0
+
+
+def test_bucket_events_without_events_are_float():
+    empty = np.array([], dtype=np.int64)
+    events = _BucketEvents(_sparse(empty, empty, empty), 0, 4, N_BUCKETS)
+    assert events.at(3).dtype == np.float64
+    rolling = _RollingSum(events, WARMUP, 2)
+    assert not rolling.advance(WARMUP).any()
@@ -0,0 +1,88 @@
+"""Процессный кэш конфигурации ценообразования"""
+import pytest
+
+from app.config import settings
+from app.models import DynamicPricingConfig
+from app.services import pricing_config
+from app.services.pricing_config import INVALIDATE_CHANNEL, PricingConfigCache
+
+
+class _ConfigCrud:
+    def __init__(self):
+        self.config = DynamicPricingConfig(id=1, k1=0.5)
+        self.loads = 0
+        self.on_load = None
+    
+    async def get_active(self, session):
+        self.loads += 1
+        if self.on_load:
+            self.on_load()
+        return self.config
+
+
+@pytest.fixture
+def crud(monkeypatch):
+    crud = _ConfigCrud()
+    monkeypatch.setattr(pricing_config, "crud_dynamic_pricing_config", crud)
+    return crud
+
+
+async def test_config_is_loaded_once_and_detached(crud):
+    cache = PricingConfigCache()
+    first = await cache.get(None)
+    assert await cache.get(None) is first
+    assert crud.loads == 1
+    # Изменение объекта сессии не влияет на кэш
+    crud.config.k1 = 0.9
+    assert first.k1 == 0.5
+
+
+async def test_stale_mark_reloads(crud):
+    cache = PricingConfigCache()
+    await cache.get(None)
+    cache.mark_stale(5)
+    assert cache.version == 5
+    await cache.get(None)
+    assert crud.loads == 2
+    # Старая версия из канала не откатывает счетчик
+    cache.mark_stale(3)
+    assert cache.version == 6
+
+
+async def test_invalidation_during_load_is_not_lost(crud):
+    cache = PricingConfigCache()
+    crud.on_load = cache.mark_stale
+    await cache.get(None)
+    crud.on_load = None
+    await cache.get(None)
+    assert crud.loads == 2
+
+
+async def test_ttl_expires_cache(crud, monkeypatch):
+    cache = PricingConfigCache()
+    await cache.get(None)
+    monkeypatch.setattr(settings, "pricing_config_cache_ttl", 0)
+    await cache.get(None)
+    assert crud.loads == 2
+
+
+async def test_invalidate_publishes_version(crud, fake_redis, monkeypatch):
+    monkeypatch.setattr(pricing_config, "get_redis", lambda: fake_redis)
+    cache = PricingConfigCache()
+    await cache.get(None)
+    await cache.invalidate()
+    assert fake_redis.published == [(INVALIDATE_CHANNEL, 1)]
+    await cache.get(None)
+    assert crud.loads == 2
+
+
+async def test_invalidate_without_redis_still_marks_stale(crud, monkeypatch):
+    def _broken():
+        raise ConnectionError("redis")
+    
+    monkeypatch.setattr(pricing_config, "get_redis", _broken)
+    cache = PricingConfigCache()
+    await cache.get(None)
+    await cache.invalidate()
+    await cache.get(None)
+    assert crud.loads == 2
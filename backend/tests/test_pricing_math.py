@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.services.pricing_math import (
+    PRICE_ROUNDING, apply_price_limits, apply_step_limits, cluster_medians_excluding_self,
+    demand_scores, price_adjustments, reprice_arrays
+)
+
+
+def brute_medians(keys, values):
+    result = []
+    for i, key in enumerate(keys):
+        others = [v for j, (k, v) in enumerate(zip(keys, values)) if j != i and k == key and not np.isnan(v)]
+        result.append(float(np.median(others)) if others else 0.0)
+    return np.array(result)
+
+
+def test_demand_scores_caps_each_component():
+    scores = demand_scores(np.array([0, 50, 100, 500]), np.array([0, 5, 0, 10]))
+    np.testing.assert_allclose(scores, [0.0, 85.0, 30.0, 100.0])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_cluster_medians_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(0, 6, size=80)
+    values = rng.integers(0, 100, size=80).astype(np.float64)
+    values[rng.random(80) < 0.2] = np.nan
+    np.testing.assert_allclose(cluster_medians_excluding_self(keys, values), brute_medians(keys, values))
+
+
+def test_cluster_medians_empty():
+    assert len(cluster_medians_excluding_self(np.array([], dtype=np.int64), np.array([]))) == 0
+
+
+def test_price_adjustments_threshold_and_rounding():
+    current = np.array([5_000_000.0, 5_000_000.0, 5_000_000.0])
+    new = price_adjustments(current, np.array([50.0, 90.0, 10.0]), np.array([40.0, 40.0, 40.0]))
+    assert new[0] == current[0]  # Разница в спросе ниже порога
+    assert new[1] == 5_250_000.0
+    assert new[2] == 4_850_000.0
+    assert np.all(new % PRICE_ROUNDING == 0)
+
+
+def test_apply_price_limits_clips_to_base_range():
+    limited = apply_price_limits(np.array([1500.0, 500.0, 1000.0]), np.array([1000.0] * 3), 10)
+    np.testing.assert_allclose(limited, [1100.0, 900.0, 1000.0])
+
+
+def test_step_limits_reround_inside_range():
+    current = np.array([3_333_333.0, 3_333_333.0, 3_333_333.0, 1_234_567.0])
+    new = np.array([9_000_000.0, 1_000_000.0, 3_333_333.0, 1_250_000.0])
+    limited, change = apply_step_limits(new, current, -5.0, 5.0)
+    # Клип дал бы 3 499 999.65 и 3 166 666.35: цена округляется внутрь диапазона
+    np.testing.assert_allclose(limited, [3_499_000.0, 3_167_000.0, 3_333_333.0, 1_250_000.0])
+    assert np.all(limited <= current * 1.05) and np.all(limited >= current * 0.95)
+    assert change[2] == 0.0
+    np.testing.assert_allclose(change, (limited - current) / current * 100)
+
+
+def test_step_limits_without_round_price_in_range():
+    limited, _ = apply_step_limits(np.array([2000.0]), np.array([1500.0]), -1.0, 1.0)
+    assert limited[0] == pytest.approx(1515.0)
+
+
+def test_reprice_arrays_matches_individual_steps():
+    views = np.array([100.0, 0.0, 40.0])
+    bookings = np.array([5.0, 0.0, 1.0])
+    median = np.array([30.0, 60.0, 30.0])
+    current = np.array([4_000_000.0, 6_000_000.0, 2_500_000.0])
+    base = np.array([4_000_000.0, 6_200_000.0, 2_500_000.0])
+    demand, prices, change = reprice_arrays(views, bookings, median, current, base, 10.0, -5.0, 5.0)
+    np.testing.assert_allclose(demand, demand_scores(views, bookings))
+    expected = apply_price_limits(price_adjustments(current, demand, median), base, 10.0)
+    expected, expected_change = apply_step_limits(expected, current, -5.0, 5.0)
+    np.testing.assert_allclose(prices, expected)
+    np.testing.assert_allclose(change, expected_change)
+    assert prices[0] > current[0] and prices[1] < current[1] and prices[2] == current[2]
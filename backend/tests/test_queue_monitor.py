@@ -0,0 +1,50 @@
+"""Глубина очередей по приоритетам и замеры задержки задач"""
+from datetime import datetime, timezone
+
+import pytest
+
+from app.config import settings
+from app.services import queue_monitor as monitor_module
+from app.services.queue_monitor import QueueMonitor, wait_time
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(monitor_module, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(monitor_module, "get_broker_redis", lambda: fake_redis)
+    return fake_redis
+
+
+async def test_depth_sums_priority_lists(redis):
+    queue = settings.celery_bulk_queue
+    redis.data[queue] = [b"m"] * 2
+    redis.data[f"{queue}:6"] = [b"m"] * 3
+    redis.data[f"{settings.celery_interactive_queue}:3"] = [b"m"]
+    monitor = QueueMonitor()
+    assert await monitor.depth(queue) == 5
+    assert await monitor.total_depth() == 6
+
+
+async def test_samples_are_trimmed_and_summarised(redis, monkeypatch):
+    monkeypatch.setattr(settings, "queue_latency_samples", 3)
+    monitor = QueueMonitor()
+    for wait, runtime in ((1.0, 10.0), (-0.5, 20.0), (3.0, 30.0), (None, 40.0)):
+        await monitor.record("q", wait, runtime)
+    stats = await monitor.get_stats("q")
+    assert stats["samples"] == 3
+    assert stats["runtime"] == {"p50": 30.0, "p95": 39.0, "max": 40.0}
+    # Отрицательное ожидание (расхождение часов) записывается как 0
+    assert stats["wait"]["max"] == 3.0 and stats["wait"]["p50"] == 1.0
+
+
+async def test_stats_without_samples(redis):
+    stats = await QueueMonitor().get_stats("empty")
+    assert stats["depth"] == 0 and stats["wait"] == {"p50": None, "p95": None, "max": None}
+
+
+def test_wait_time_counts_from_eta():
+    enqueued = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc).timestamp()
+    eta = datetime(2024, 1, 1, 12, 1, tzinfo=timezone.utc)
+    assert wait_time(enqueued, None, enqueued + 5) == 5
+    assert wait_time(enqueued, eta.isoformat(), eta.timestamp() + 2) == 2
+    assert wait_time(None, None, enqueued) is None
@@ -0,0 +1,47 @@
+"""Пересчет аналитики пачками: среднее по каталогу считается один раз на запуск"""
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app.crud import crud_property_analytics
+
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+class _Session:
+    def __init__(self, avg_row=(None, None)):
+        self.avg_row = avg_row
+        self.statements = []
+    
+    async def execute(self, statement, *args):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return SimpleNamespace(rowcount=3, one=lambda: self.avg_row)
+    
+    async def commit(self):
+        pass
+
+
+async def test_chunk_uses_passed_average():
+    session = _Session()
+    updated = await crud_property_analytics.bulk_refresh(
+        session, [1, 2, 3], now=NOW, avg_views_last_month=12.5
+    )
+    assert updated == 3
+    assert len(session.statements) == 1
+    assert "count(properties.id)" not in session.statements[0]
+
+
+async def test_average_is_computed_when_not_passed():
+    session = _Session(avg_row=(300, 100))
+    await crud_property_analytics.bulk_refresh(session, [1], now=NOW)
+    assert len(session.statements) == 2
+    assert "count(properties.id)" in session.statements[0]
+
+
+async def test_average_defaults_to_one_without_views():
+    crud = crud_property_analytics
+    assert await crud.get_avg_views_last_month(_Session(avg_row=(None, 10)), NOW) == 1.0
+    assert await crud.get_avg_views_last_month(_Session(avg_row=(50, 0)), NOW) == 1.0
+    assert await crud.get_avg_views_last_month(_Session(avg_row=(50, 20)), NOW) == 2.5
@@ -0,0 +1,36 @@
+"""Маршрутизация задач и независимость API от модуля воркера"""
+from pathlib import Path
+import subprocess
+import sys
+
+from app.config import settings
+from app.services.task_queue import celery_app
+
+
+def _route(name: str):
+    return celery_app.amqp.router.route({}, f"app.worker.{name}")
+
+
+def test_routes_by_task_group():
+    interactive = _route("update_single_property_price_task")
+    assert interactive["queue"].name == settings.celery_interactive_queue
+    assert interactive["priority"] == settings.celery_interactive_priority
+
+    bulk = _route("batch_match_task")
+    assert bulk["queue"].name == settings.celery_bulk_queue
+    assert bulk["priority"] == settings.celery_bulk_priority
+
+    default = _route("refresh_unique_visitors_task")
+    assert default["queue"].name == settings.celery_default_queue
+
+
+def test_queues_have_own_exchanges():
+    queues = {queue.name: queue for queue in celery_app.conf.task_queues}
+    assert len({queue.exchange.name for queue in queues.values()}) == len(queues)
+    for name, queue in queues.items():
+        assert queue.routing_key == name
+
+
+def test_api_does_not_import_worker():
+    code = "import sys, app.main; sys.exit(1 if 'app.worker' in sys.modules else 0)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parents[1]).returncode == 0
@@ -0,0 +1,79 @@
+"""Перенос уникальных посетителей: полный раз в сутки, иначе только объекты с новыми посетителями"""
+from datetime import datetime
+
+import pytest
+
+from app.services import unique_visitors as uv_module
+from app.services.stats_aggregator import StatsAggregatorService
+from app.services.unique_visitors import unique_visitors
+
+
+class _Crud:
+    def __init__(self, active_ids):
+        self.active_ids = active_ids
+        self.updates = []
+        self.fail = False
+    
+    async def get_recently_active_ids(self, db, since):
+        return self.active_ids
+    
+    async def bulk_update_unique_visitors(self, db, rows, reset_missing=True):
+        if self.fail:
+            raise RuntimeError("db")
+        self.updates.append(({row["property_id"]: row["unique_visitors_day"] for row in rows}, reset_missing))
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(uv_module, "get_redis", lambda: fake_redis)
+    return fake_redis
+
+
+def _service(crud) -> StatsAggregatorService:
+    service = StatsAggregatorService.__new__(StatsAggregatorService)
+    service.session = None
+    service.analytics_crud = crud
+    return service
+
+
+async def test_record_marks_properties_dirty(redis):
+    now = datetime.utcnow()
+    await unique_visitors.record([(1, "a", now), (2, None, now), (3, "b", now)])
+    assert await unique_visitors.take_dirty() == [1, 3]
+    assert await unique_visitors.take_dirty() == []
+
+
+async def test_full_refresh_once_a_day_then_dirty_only(redis):
+    now = datetime.utcnow()
+    await unique_visitors.record([(1, "a", now), (2, "b", now)])
+    crud = _Crud(active_ids=[1, 2, 5])
+    service = _service(crud)
+    
+    assert await service.refresh_unique_visitors() == 3
+    assert crud.updates[-1] == ({1: 1, 2: 1, 5: 0}, True)
+    
+    await unique_visitors.record([(2, "c", now)])
+    assert await service.refresh_unique_visitors() == 1
+    assert crud.updates[-1] == ({2: 2}, False)
+    
+    assert await service.refresh_unique_visitors() == 0
+    assert crud.updates[-1] == ({}, False)
+
+
+async def test_failed_refresh_keeps_dirty_ids(redis):
+    now = datetime.utcnow()
+    await unique_visitors.mark_full_refresh(now.date())
+    await unique_visitors.record([(7, "a", now)])
+    crud = _Crud(active_ids=[])
+    crud.fail = True
+    with pytest.raises(RuntimeError):
+        await _service(crud).refresh_unique_visitors()
+    assert await unique_visitors.take_dirty() == [7]
+
+
+async def test_failed_full_refresh_is_retried(redis):
+    crud = _Crud(active_ids=[1])
+    crud.fail = True
+    with pytest.raises(RuntimeError):
+        await _service(crud).refresh_unique_visitors()
+    assert await unique_visitors.needs_full_refresh(datetime.utcnow().date())
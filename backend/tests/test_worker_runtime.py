@@ -0,0 +1,50 @@
+"""Один цикл событий и один движок БД на поток процесса воркера"""
+import asyncio
+import threading
+
+from app.worker_runtime import WorkerRuntime
+
+
+async def _loop():
+    return asyncio.get_running_loop()
+
+
+def test_tasks_reuse_loop_and_engine():
+    runtime = WorkerRuntime()
+    try:
+        first = runtime.run(_loop())
+        engine = runtime._context().engine
+        assert runtime.run(_loop()) is first
+        assert runtime._context().engine is engine
+    finally:
+        runtime.shutdown()
+    assert first.is_closed()
+
+
+def test_threads_get_own_contexts():
+    runtime = WorkerRuntime()
+    loops = []
+    thread = threading.Thread(target=lambda: loops.append(runtime.run(_loop())))
+    try:
+        loops.append(runtime.run(_loop()))
+        thread.start()
+        thread.join()
+        assert loops[0] is not loops[1]
+        assert len(runtime._contexts) == 2
+    finally:
+        runtime.shutdown()
+    assert all(loop.is_closed() for loop in loops)
+
+
+def test_start_drops_inherited_contexts_without_closing():
+    runtime = WorkerRuntime()
+    inherited = runtime.run(_loop())
+    # После fork контексты родителя не закрываются: их соединения принадлежат родителю
+    runtime.start()
+    try:
+        assert not inherited.is_closed()
+        assert len(runtime._contexts) == 1
+        assert runtime.run(_loop()) is not inherited
+    finally:
+        runtime.shutdown()
+        inherited.close()
@@ -0,0 +1,36 @@
+"""Диапазоны ID для пачек воркера нарезаются из потока ID серверного курсора"""
+from types import SimpleNamespace
+
+from app.crud import CRUDWorker
+
+
+class _Result:
+    def __init__(self, ids, batch_size):
+        self.ids = ids
+        self.batch_size = batch_size
+    
+    async def partitions(self):
+        for start in range(0, len(self.ids), self.batch_size):
+            yield [SimpleNamespace(id=property_id) for property_id in self.ids[start:start + self.batch_size]]
+
+
+class _Session:
+    def __init__(self, ids):
+        self.ids = ids
+        self.statements = []
+    
+    async def stream(self, query):
+        self.statements.append(query)
+        return _Result(self.ids, query.get_execution_options()["yield_per"])
+
+
+async def test_id_ranges_follow_batches():
+    session = _Session([1, 2, 5, 8, 9, 13, 21])
+    assert await CRUDWorker(session).get_id_ranges(3) == [(1, 5), (8, 13), (21, 21)]
+    assert "WHERE" not in str(session.statements[0])
+
+
+async def test_id_ranges_of_available_only():
+    session = _Session([])
+    assert await CRUDWorker(session).get_id_ranges(3, available_only=True) == []
+    assert "properties.status" in str(session.statements[0])